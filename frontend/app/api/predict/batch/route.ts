@@ -0,0 +1,59 @@
+import { NextRequest, NextResponse } from "next/server"
+import { getServerSession } from "next-auth"
+import { authOptions } from "@/app/api/auth/[...nextauth]/route"
+
+export async function POST(request: NextRequest) {
+  try {
+    const session = await getServerSession(authOptions)
+
+    if (!session?.user?.id) {
+      return NextResponse.json({ error: "Unauthorized" }, { status: 401 })
+    }
+
+    const formData = await request.formData()
+    // accept many images (or zip archives) under "images" or "files"
+    const files = [...formData.getAll("images"), ...formData.getAll("files")].filter(
+      (f): f is File => f instanceof File
+    )
+
+    if (files.length === 0) {
+      return NextResponse.json({ error: "No image files provided" }, { status: 400 })
+    }
+
+    const fastApiUrl = process.env.FASTAPI_BASE_URL || "http://127.0.0.1:8000"
+
+    const fastApiFormData = new FormData()
+    for (const file of files) {
+      fastApiFormData.append("files", file, file.name)
+    }
+
+    // Single round trip to FastAPI /predict/batch
+    const response = await fetch(`${fastApiUrl}/predict/batch`, {
+      method: "POST",
+      body: fastApiFormData,
+    })
+
+    if (!response.ok || !response.body) {
+      const error = await response.json().catch(() => ({ error: "Batch prediction failed" }))
+      return NextResponse.json(
+        { error: error.error || "Batch prediction failed" },
+        { status: response.status }
+      )
+    }
+
+    // Stream the NDJSON lines through so the client can render results as they arrive
+    return new Response(response.body, {
+      status: 200,
+      headers: {
+        "Content-Type": "application/x-ndjson",
+        "Cache-Control": "no-cache",
+      },
+    })
+  } catch (error) {
+    console.error("Batch prediction error:", error)
+    return NextResponse.json(
+      { error: error instanceof Error ? error.message : "Failed to process batch prediction" },
+      { status: 500 }
+    )
+  }
+}
@@ -0,0 +1,100 @@
+"""Compare the per-sample PIL augmentation pipeline with the batched uint8 one.
+
+Runs both pipelines through a real DataLoader (same workers, same batch size)
+over synthetic images (or the images under `--data-dir`) and reports samples
+per second, including the main-process `BatchAugment.train` step for the
+batched variant.
+
+Usage:
+    python scripts/bench_augment.py --num-images 2048 --batch-size 64 --num-workers 4
+    python scripts/bench_augment.py --data-dir data/plant-disease-classification-dataset --num-images 4096
+"""
+import argparse
+import json
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.train.augment import BatchAugment, split_aspect
+from src.train.data_utils import build_transforms, list_image_folder
+from src.train.scan import find_class_root
+
+
+class ImageListDataset(Dataset):
+    def __init__(self, items, transform):
+        self.items = items
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        item = self.items[idx]
+        img = Image.open(item).convert('RGB') if isinstance(item, str) else item
+        return self.transform(img), 0
+
+
+def synthetic_images(n: int, size: int):
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8)) for _ in range(n)]
+
+
+def run(loader, augment=None, device='cpu'):
+    n = 0
+    start = time.perf_counter()
+    for batch, _ in loader:
+        imgs, aspect = split_aspect(batch)
+        imgs = imgs.to(device)
+        if augment is not None:
+            imgs = augment.train(imgs, aspect)
+        n += imgs.shape[0]
+    if device != 'cpu' and torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return n / (time.perf_counter() - start)
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--data-dir', type=Path, default=None, help='use real images instead of synthetic ones')
+    p.add_argument('--num-images', type=int, default=2048)
+    p.add_argument('--source-size', type=int, default=256, help='synthetic image size')
+    p.add_argument('--img-size', type=int, default=224)
+    p.add_argument('--batch-size', type=int, default=64)
+    p.add_argument('--num-workers', type=int, default=4)
+    p.add_argument('--device', type=str, default='cpu')
+    p.add_argument('--repeats', type=int, default=3)
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.data_dir is not None:
+        _, samples = list_image_folder(find_class_root(args.data_dir).class_dir)
+        items = [path for path, _ in samples[:args.num_images]]
+    else:
+        items = synthetic_images(args.num_images, args.source_size)
+
+    per_sample_tf, _ = build_transforms(args.img_size)
+    uint8_tf, _ = build_transforms(args.img_size, uint8_output=True)
+    augment = BatchAugment(args.img_size, device=args.device)
+    kwargs = dict(batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers)
+
+    results = {}
+    for name, tf, aug in (('per_sample', per_sample_tf, None), ('batched_uint8', uint8_tf, augment)):
+        loader = DataLoader(ImageListDataset(items, tf), **kwargs)
+        rates = [run(loader, aug, args.device) for _ in range(args.repeats)]
+        results[name] = {'samples_per_s': max(rates), 'runs': rates}
+        print(f'{name:>14}: {max(rates):8.1f} samples/s (best of {args.repeats})')
+    results['speedup'] = results['batched_uint8']['samples_per_s'] / results['per_sample']['samples_per_s']
+    print(f"speedup: {results['speedup']:.2f}x")
+    print(json.dumps({'config': {k: str(v) for k, v in vars(args).items()}, 'results': results}))
+
+
+if __name__ == '__main__':
+    main()
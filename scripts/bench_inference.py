@@ -0,0 +1,298 @@
+"""Benchmark the inference path stage by stage for ONNX Runtime and PyTorch.
+
+Every batch is timed per stage, the same way the API processes an upload:
+
+- decode: `decode_image` on the encoded bytes (JPEG draft decoding included),
+- preprocess: resize + normalize into the NCHW batch (`PreprocessEngine`, the
+  code behind `preprocess_image_pil` and the API's batch path),
+- run: `session.run` / the PyTorch forward pass,
+- postprocess: softmax + top-k.
+
+The sweep covers backends x architectures x thread counts x batch sizes. Each
+(backend, model, threads) combination runs in a fresh subprocess so peak RSS
+and thread pools are not shared between runs. ONNX models are exported from
+randomly initialized `src.model.models` architectures (latency does not depend
+on the weights) unless `--onnx-model` points at existing files, e.g. the
+served fp32 and int8 models.
+
+Results (p50/p95/p99 per stage and end to end, images/s, peak RSS) are printed
+as a table and as JSON. With `--baseline` the run is compared with an earlier
+`--output` file and the script exits non-zero if throughput of any matching
+configuration dropped by more than `--max-regression`.
+
+Usage:
+    python scripts/bench_inference.py --models resnet18 resnet50 --batch-sizes 1 8 32 --threads 1 4
+    python scripts/bench_inference.py --backends onnx --onnx-model models/model.onnx --onnx-model models/model.int8.onnx
+    python scripts/bench_inference.py --data-dir data/plant-disease-classification-dataset --output bench.json
+    python scripts/bench_inference.py --output new.json --baseline bench.json --max-regression 0.1
+"""
+import argparse
+import io
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+from pathlib import Path
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+STAGES = ('decode', 'preprocess', 'run', 'postprocess', 'total')
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def percentile(sorted_values, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(times_s) -> dict:
+    ms = sorted(t * 1000 for t in times_s)
+    return {
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'mean_ms': sum(ms) / len(ms) if ms else 0.0,
+    }
+
+
+def synthetic_images(n: int, size: int, quality: int = 90):
+    """JPEG-encoded gradient + noise images, roughly photo-like to decode."""
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    out = []
+    for _ in range(n):
+        base = np.linspace(0, 255, size, dtype=np.float32)
+        img = (base[None, :, None] * 0.5 + base[:, None, None] * 0.3
+               + rng.normal(0, 20, (size, size, 3))).clip(0, 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(img).save(buf, format='JPEG', quality=quality)
+        out.append(buf.getvalue())
+    return out
+
+
+def real_images(data_dir: Path, n: int):
+    from src.model.utils import is_image_file
+
+    out = []
+    for dirpath, dirnames, filenames in os.walk(data_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if is_image_file(name):
+                out.append(Path(dirpath, name).read_bytes())
+                if len(out) >= n:
+                    return out
+    if not out:
+        raise FileNotFoundError(f'no images under {data_dir}')
+    return out
+
+
+def softmax_topk(logits: np.ndarray, k: int):
+    logits = logits.astype(np.float64) - logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=1, keepdims=True)
+    k = min(k, probs.shape[1])
+    top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(probs, top, axis=1).argsort(axis=1)[:, ::-1]
+    return probs, np.take_along_axis(top, order, axis=1)
+
+
+def make_runner(cfg: dict):
+    """Return `run(x) -> logits` for the configured backend and thread count."""
+    if cfg['backend'] == 'onnx':
+        from src.api.session import SessionConfig, build_session
+
+        session = build_session(Path(cfg['onnx_path']), SessionConfig(intra_op_threads=cfg['threads']))
+        name = session.get_inputs()[0].name
+        return lambda x: session.run(None, {name: x})[0]
+
+    import torch
+
+    from src.model.models import build_model
+
+    if cfg['threads']:
+        torch.set_num_threads(cfg['threads'])
+    model = build_model(cfg['model'], cfg['num_classes']).eval()
+
+    def run(x):
+        with torch.inference_mode():
+            return model(torch.from_numpy(x)).numpy()
+
+    return run
+
+
+def run_combo(cfg: dict, images) -> list:
+    """Benchmark every batch size for one (backend, model, threads) in this process."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from src.model.utils import PreprocessEngine, decode_image
+
+    base_rss = peak_rss_mb()
+    runner = make_runner(cfg)
+    engine = PreprocessEngine((cfg['img_size'], cfg['img_size']))
+    results = []
+    for batch_size in cfg['batch_sizes']:
+        times = {s: [] for s in STAGES}
+        n_batches = cfg['warmup'] + cfg['iters']
+        for it in range(n_batches):
+            start = it * batch_size
+            blobs = [images[(start + j) % len(images)] for j in range(batch_size)]
+            t0 = time.perf_counter()
+            decoded = [decode_image(b, engine.size) for b in blobs]
+            t1 = time.perf_counter()
+            x = engine.batch_images(decoded)
+            t2 = time.perf_counter()
+            logits = runner(x)
+            t3 = time.perf_counter()
+            softmax_topk(logits, cfg['topk'])
+            t4 = time.perf_counter()
+            if it < cfg['warmup']:
+                continue
+            for stage, dt in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t4 - t0)):
+                times[stage].append(dt)
+        stages = {s: summarize(v) for s, v in times.items()}
+        total_s = sum(times['total'])
+        results.append({
+            'backend': cfg['backend'], 'model': cfg['model'], 'threads': cfg['threads'], 'batch_size': batch_size,
+            'stages': stages,
+            'images_per_s': batch_size * len(times['total']) / total_s if total_s else 0.0,
+            'run_images_per_s': batch_size / (stages['run']['p50_ms'] / 1000) if stages['run']['p50_ms'] else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_rss_delta_mb': peak_rss_mb() - base_rss,
+        })
+    return results
+
+
+def export_models(names, num_classes: int, img_size: int, out_dir: Path) -> dict:
+    """Export randomly initialized architectures to ONNX once, before the sweep."""
+    from src.model.artifacts import export_model
+    from src.model.models import build_model
+
+    paths = {}
+    for name in names:
+        path = out_dir / f'{name}.onnx'
+        export_model(build_model(name, num_classes), path, img_size=img_size)
+        paths[name] = str(path)
+    return paths
+
+
+def config_key(r: dict):
+    return r['backend'], r['model'], r['threads'], r['batch_size']
+
+
+def compare(results, baseline_path: Path, max_regression: float) -> list:
+    """Return (key, old, new) for configurations whose images/s dropped by more than `max_regression`."""
+    with open(baseline_path, 'r') as f:
+        baseline = {config_key(r): r for r in json.load(f)['results'] if 'error' not in r}
+    regressions = []
+    for r in results:
+        if 'error' in r:
+            continue
+        old = baseline.get(config_key(r))
+        if old is None:
+            continue
+        if r['images_per_s'] < old['images_per_s'] * (1 - max_regression):
+            regressions.append((config_key(r), old['images_per_s'], r['images_per_s']))
+    return regressions
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--backends', nargs='+', default=['onnx', 'torch'], choices=['onnx', 'torch'])
+    p.add_argument('--models', nargs='+', default=['resnet18'], help='architectures from src.model.models')
+    p.add_argument('--onnx-model', type=Path, action='append', default=None,
+                   help='benchmark this ONNX file instead of exporting --models (repeatable)')
+    p.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8, 32])
+    p.add_argument('--threads', nargs='+', type=int, default=[0], help='intra-op / torch threads (0 = library default)')
+    p.add_argument('--data-dir', type=Path, default=None, help='use real images instead of synthetic JPEGs')
+    p.add_argument('--num-images', type=int, default=256)
+    p.add_argument('--source-size', type=int, default=512, help='synthetic image size')
+    p.add_argument('--img-size', type=int, default=224)
+    p.add_argument('--num-classes', type=int, default=38)
+    p.add_argument('--topk', type=int, default=5)
+    p.add_argument('--iters', type=int, default=30, help='timed batches per configuration')
+    p.add_argument('--warmup', type=int, default=3)
+    p.add_argument('--output', type=Path, default=None, help='also write the JSON results here')
+    p.add_argument('--baseline', type=Path, default=None, help='earlier --output file to compare against')
+    p.add_argument('--max-regression', type=float, default=0.1, help='allowed relative images/s drop vs --baseline')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.data_dir is not None:
+        images = real_images(args.data_dir, args.num_images)
+    else:
+        images = synthetic_images(args.num_images, args.source_size)
+    print(f'{len(images)} images, {sum(map(len, images)) / len(images) / 1024:.0f} KiB average')
+
+    ctx = mp.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench_inference_') as tmp:
+        targets = []
+        if 'onnx' in args.backends:
+            if args.onnx_model:
+                onnx_paths = {p.stem: str(p) for p in args.onnx_model}
+            else:
+                onnx_paths = export_models(args.models, args.num_classes, args.img_size, Path(tmp))
+            targets += [('onnx', name, path) for name, path in onnx_paths.items()]
+        if 'torch' in args.backends:
+            targets += [('torch', name, None) for name in args.models]
+
+        print(f"{'backend':>7} {'model':>16} {'thr':>3} {'bs':>3} {'decode':>7} {'prep':>7} {'run':>8} "
+              f"{'post':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'img/s':>8} {'RSS MB':>7}")
+        for (backend, model, onnx_path), threads in itertools.product(targets, args.threads):
+            cfg = {
+                'backend': backend, 'model': model, 'onnx_path': onnx_path, 'threads': threads,
+                'batch_sizes': args.batch_sizes, 'img_size': args.img_size, 'num_classes': args.num_classes,
+                'topk': args.topk, 'iters': args.iters, 'warmup': args.warmup,
+            }
+            with ctx.Pool(1) as pool:
+                try:
+                    rows = pool.apply(run_combo, (cfg, images))
+                except Exception as e:
+                    print(f'{backend:>7} {model:>16} {threads:>3}  failed: {e}')
+                    results.append(dict(cfg, error=str(e)))
+                    continue
+            for r in rows:
+                s = r['stages']
+                print(f"{backend:>7} {model:>16} {threads:>3} {r['batch_size']:>3} {s['decode']['p50_ms']:7.2f} "
+                      f"{s['preprocess']['p50_ms']:7.2f} {s['run']['p50_ms']:8.2f} {s['postprocess']['p50_ms']:6.2f} "
+                      f"{s['total']['p50_ms']:8.2f} {s['total']['p95_ms']:8.2f} {s['total']['p99_ms']:8.2f} "
+                      f"{r['images_per_s']:8.1f} {r['peak_rss_mb']:7.0f}")
+            results.extend(rows)
+
+    config = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}
+    config['onnx_model'] = [str(p) for p in args.onnx_model] if args.onnx_model else None
+    config['cpu_count'] = os.cpu_count()
+    payload = json.dumps({'config': config, 'results': results}, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    print(payload)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        for key, old, new in regressions:
+            print(f'REGRESSION {key}: {old:.1f} -> {new:.1f} images/s ({new / old - 1:+.1%})')
+        if regressions:
+            sys.exit(1)
+        print(f'No throughput regression beyond {args.max_regression:.0%} vs {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark training step time and peak memory for --amp / --channels-last.
+
+Each (model, amp, channels_last) combination runs in a fresh subprocess so the
+peak-RSS numbers are not polluted by earlier runs. A step is forward + loss +
+backward + optimizer step on a synthetic batch, timed after a few warm-up
+steps, exactly as `src/train/train.py` runs it.
+
+Usage:
+    python scripts/bench_train_step.py --models resnet18 resnet50 --batch-size 32 --steps 20
+    python scripts/bench_train_step.py --device cuda --img-size 224 --output bench_train.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+from pathlib import Path
+import resource
+import statistics
+import sys
+import time
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_combo(cfg: dict) -> dict:
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import torch
+    import torch.nn as nn
+
+    from src.model.models import build_model
+    from src.train.precision import autocast, make_grad_scaler, memory_format, to_memory_format
+
+    torch.manual_seed(0)
+    if cfg['threads']:
+        torch.set_num_threads(cfg['threads'])
+    device = torch.device(cfg['device'])
+    model = build_model(cfg['model'], cfg['num_classes']).to(device, memory_format=memory_format(cfg['channels_last']))
+    model.train()
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = nn.CrossEntropyLoss()
+    scaler = make_grad_scaler(device, cfg['amp'])
+    imgs = to_memory_format(torch.randn(cfg['batch_size'], 3, cfg['img_size'], cfg['img_size'], device=device),
+                            cfg['channels_last'])
+    labels = torch.randint(0, cfg['num_classes'], (cfg['batch_size'],), device=device)
+
+    def step():
+        optimizer.zero_grad()
+        with autocast(device, cfg['amp']):
+            loss = criterion(model(imgs), labels)
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+
+    base_rss = peak_rss_mb()
+    for _ in range(cfg['warmup']):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+    times = []
+    for _ in range(cfg['steps']):
+        start = time.perf_counter()
+        step()
+        times.append(time.perf_counter() - start)
+
+    result = dict(cfg)
+    result.update({
+        'step_ms_mean': statistics.mean(times) * 1000,
+        'step_ms_median': statistics.median(times) * 1000,
+        'samples_per_s': cfg['batch_size'] / statistics.median(times),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_delta_mb': peak_rss_mb() - base_rss,
+    })
+    if device.type == 'cuda':
+        result['peak_cuda_mb'] = torch.cuda.max_memory_allocated() / (1024 * 1024)
+    return result
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--models', nargs='+', default=['resnet18'], help='architectures from src.model.models')
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--img-size', type=int, default=224)
+    p.add_argument('--num-classes', type=int, default=38)
+    p.add_argument('--steps', type=int, default=20)
+    p.add_argument('--warmup', type=int, default=3)
+    p.add_argument('--threads', type=int, default=0, help='torch.set_num_threads (0 = torch default)')
+    p.add_argument('--device', type=str, default='cpu')
+    p.add_argument('--output', type=Path, default=None, help='also write the JSON results here')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    ctx = mp.get_context('spawn')
+    results = []
+    print(f"{'model':>16} {'amp':>5} {'ch_last':>7} {'step ms':>9} {'samples/s':>10} {'peak MB':>9}")
+    for model, amp, channels_last in itertools.product(args.models, (False, True), (False, True)):
+        cfg = {
+            'model': model, 'amp': amp, 'channels_last': channels_last,
+            'batch_size': args.batch_size, 'img_size': args.img_size, 'num_classes': args.num_classes,
+            'steps': args.steps, 'warmup': args.warmup, 'threads': args.threads, 'device': args.device,
+        }
+        with ctx.Pool(1) as pool:
+            try:
+                r = pool.apply(run_combo, (cfg,))
+            except Exception as e:
+                print(f'{model:>16} {str(amp):>5} {str(channels_last):>7}  failed: {e}')
+                results.append(dict(cfg, error=str(e)))
+                continue
+        peak = r.get('peak_cuda_mb', r['peak_rss_mb'])
+        print(f"{model:>16} {str(amp):>5} {str(channels_last):>7} {r['step_ms_median']:9.1f} {r['samples_per_s']:10.1f} {peak:9.0f}")
+        results.append(r)
+
+    ok = [r for r in results if 'error' not in r]
+    if ok:
+        for model in args.models:
+            rows = [r for r in ok if r['model'] == model]
+            if rows:
+                best = min(rows, key=lambda r: r['step_ms_median'])
+                print(f"fastest for {model}: amp={best['amp']} channels_last={best['channels_last']}")
+    payload = json.dumps({'results': results}, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    print(payload)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,121 +1,486 @@
 """Download the Kaggle dataset and prepare it in ImageFolder layout.
 
 This script attempts to use `kagglehub.dataset_download` (per your snippet)
-to download the dataset `goelvanshaj/plant-disease-classification-dataset`.
+to download the dataset `goelvanshaj/plant-disease-classification-dataset`
+(or takes a local directory/archive via `--source`).
 
-It extracts archives if needed, heuristically finds the directory containing
-the image dataset (class subfolders or many image files), and copies it to
-`data/plant-disease-classification-dataset` which is the path expected by
-the training scripts.
+It heuristically finds the directory containing the image dataset (class
+subfolders), and places it at `data/plant-disease-classification-dataset`
+which is the path expected by the training scripts:
+
+- archives (zip/tar) are never extracted to a temp dir first: the class root
+  is chosen from the member list and only those members are extracted,
+  directly into the target (zip members in parallel);
+- directories are hardlinked or reflinked (copy-on-write clone, FICLONE)
+  into the target when the filesystem allows it, otherwise copied with a
+  thread pool;
+- a manifest (`.prepare_manifest.json` in the target) records every finished
+  file, so an interrupted run resumes where it stopped and reruns skip files
+  that are already present and verified;
+- `--resize N` re-encodes images as JPEG with the short side at most N while
+  copying (much smaller dataset, faster decoding during training); non-JPEG
+  files keep their extension in the new name (`leaf.png` -> `leaf.png.jpg`).
 
 Usage:
     python scripts/download_and_prepare.py
+    python scripts/download_and_prepare.py --source ~/Downloads/plant-disease.zip --workers 16
+    python scripts/download_and_prepare.py --resize 320 --quality 90
 
 If `kagglehub` is not installed, the script will print instructions.
 """
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+import argparse
+import errno
+import io
+import json
 import shutil
 import zipfile
 import tarfile
-import tempfile
+import threading
+import time
 import sys
 import os
-import fnmatch
+import zlib
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.model.utils import is_image_file
+from src.train.scan import dataset_node, find_class_root, scan_tree, tree_from_paths
 
 
 DATASET_ID = "goelvanshaj/plant-disease-classification-dataset"
 TARGET_DIR = Path("data") / "plant-disease-classification-dataset"
-
-
-def is_image_file(name: str) -> bool:
-    return any(name.lower().endswith(ext) for ext in ('.jpg', '.jpeg', '.png', '.bmp'))
+MANIFEST_NAME = '.prepare_manifest.json'
+MANIFEST_VERSION = 1
+# Linux ioctl: clone `src` into `dst` sharing extents (btrfs, xfs, ...)
+FICLONE = 0x40049409
 
 
 def count_images_in_dir(d: Path) -> int:
-    return sum(1 for _ in d.rglob('*') if is_image_file(str(_)))
+    return scan_tree(d).total_images
 
 
 def find_best_candidate(root: Path) -> Path:
-    """Find the directory under `root` that most likely contains images / class folders.
+    """Find the directory under `root` that most likely contains the class folders.
 
-    Strategy: pick the directory (including root) with the largest number of image files
-    but prefer directories that have subdirectories (class-folder layout).
+    One `os.scandir` pass over the tree (`src.train.scan`); the directory with
+    the most image-bearing subfolders wins, at any depth. A train/val/test
+    layout is kept together (the parent of the splits is returned).
     """
-    best = root
-    best_count = count_images_in_dir(root)
-    # prefer directories with class subfolders
-    for p, dirs, files in os.walk(root):
-        pth = Path(p)
-        c = count_images_in_dir(pth)
-        if c > best_count:
-            best = pth
-            best_count = c
-    return best
-
-
-def extract_archive(path: Path, dest: Path) -> Path:
-    dest.mkdir(parents=True, exist_ok=True)
-    if zipfile.is_zipfile(path):
-        with zipfile.ZipFile(path, 'r') as z:
-            z.extractall(dest)
-        return dest
-    if tarfile.is_tarfile(path):
-        with tarfile.open(path, 'r:*') as t:
-            t.extractall(dest)
-        return dest
-    # not an archive
-    return path
+    result = find_class_root(root, max_depth=None)
+    print(f'Found {len(result.classes)} class folders with {result.total_images} images under {result.root}')
+    return result.root
 
 
-def copy_tree_preserve(src: Path, dst: Path):
-    if dst.exists():
-        print('Target exists — removing it:', dst)
-        shutil.rmtree(dst)
-    print('Copying dataset from', src, '->', dst)
-    shutil.copytree(src, dst)
+def archive_candidate(names) -> str:
+    """Pick the class root from archive member names; returns a member prefix ('' = archive root)."""
+    tree = tree_from_paths(names)
+    root, node = dataset_node(tree, max_depth=None)
+    print(f'Found {node.image_children} class folders with {root.total_images} images under {root.path} in the archive')
+    return '' if root.path == Path('.') else root.path.as_posix() + '/'
 
 
-def main():
-    print('Preparing dataset — target location:', TARGET_DIR)
-    TARGET_DIR.parent.mkdir(parents=True, exist_ok=True)
+def safe_relpath(name: str, prefix: str):
+    """Member name -> relative target path under `prefix`, or None if outside it / unsafe."""
+    name = name.replace('\\', '/')
+    if not name.startswith(prefix):
+        return None
+    rel = PurePosixPath(name[len(prefix):])
+    if rel.is_absolute() or '..' in rel.parts or not rel.parts:
+        return None
+    return rel.as_posix()
+
+
+class PrepareManifest:
+    """Files already placed in the target, keyed by relative target path.
+
+    Each entry records the source identity (size/mtime, or the archive CRC)
+    and the size that was written, so a rerun can skip a file only when the
+    source is unchanged and the target is still there with the right size.
+    Changing `--resize`/`--quality` invalidates everything.
+    """
+
+    def __init__(self, path: Path, options: dict, save_every_s: float = 10.0):
+        self.path = path
+        self.options = options
+        self.save_every_s = save_every_s
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self.files = {}
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION and data.get('options') == options:
+                self.files = data.get('files', {})
+            else:
+                print('Preparation options changed; ignoring previous manifest')
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print('Ignoring unreadable manifest', path, e)
+
+    def is_done(self, rel: str, identity: str, target: Path, verify: bool = False) -> bool:
+        entry = self.files.get(rel)
+        if entry is None or entry.get('src') != identity:
+            return False
+        try:
+            if target.stat().st_size != entry['size']:
+                return False
+        except OSError:
+            return False
+        return not verify or entry.get('crc') is None or file_crc32(target) == entry['crc']
+
+    def record(self, rel: str, identity: str, size: int, crc=None):
+        with self._lock:
+            self.files[rel] = {'src': identity, 'size': size, 'crc': crc}
+            if time.monotonic() - self._last_save >= self.save_every_s:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'options': self.options, 'files': self.files}, f)
+        os.replace(tmp, self.path)
+        self._last_save = time.monotonic()
+
+
+def file_crc32(path: Path, chunk_size: int = 1 << 20) -> int:
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
 
+def tmp_path_for(dst: Path) -> Path:
+    return dst.with_name(f'.{dst.name}.{threading.get_ident()}.part')
+
+
+def reflink(src: Path, dst: Path):
+    import fcntl
+
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+class Placer:
+    """Put a source file at a target path by reflink, hardlink or copy.
+
+    In `auto` mode the cheapest method that works is found on the first file
+    and reused; a method that fails (e.g. cross-device hardlink, no reflink
+    support) is dropped for the rest of the run.
+    """
+
+    METHODS = ('reflink', 'hardlink', 'copy')
+
+    def __init__(self, mode: str = 'auto'):
+        self.methods = list(self.METHODS) if mode == 'auto' else [mode]
+        self.used = {}
+        self._lock = threading.Lock()
+
+    def place(self, src: Path, dst: Path):
+        for method in list(self.methods):
+            tmp = tmp_path_for(dst)
+            try:
+                if method == 'reflink':
+                    reflink(src, tmp)
+                elif method == 'hardlink':
+                    os.link(src, tmp)
+                else:
+                    shutil.copyfile(src, tmp)
+                os.replace(tmp, dst)
+            except OSError as e:
+                tmp.unlink(missing_ok=True)
+                if method == 'copy' or e.errno not in (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP,
+                                                       errno.ENOTTY, errno.EINVAL, errno.EMLINK, errno.ENOSYS):
+                    raise
+                with self._lock:
+                    if method in self.methods and len(self.methods) > 1:
+                        self.methods.remove(method)
+                        print(f'{method} not supported here ({e.strerror}); falling back to {self.methods[0]}')
+                continue
+            with self._lock:
+                self.used[method] = self.used.get(method, 0) + 1
+            return method
+        raise RuntimeError(f'could not place {src}')
+
+
+def transcode(data, dst: Path, max_side: int, quality: int):
+    """Decode `data` (path or bytes), shrink so the short side is <= `max_side`, save as JPEG."""
+    from PIL import Image
+
+    img = Image.open(data if isinstance(data, Path) else io.BytesIO(data))
+    img.draft('RGB', (max_side, max_side))
+    img = img.convert('RGB')
+    w, h = img.size
+    scale = max_side / min(w, h)
+    if scale < 1:
+        img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BILINEAR)
+    tmp = tmp_path_for(dst)
+    try:
+        img.save(tmp, format='JPEG', quality=quality)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def target_name(rel: str, resize: int) -> str:
+    """Target path for `rel`; re-encoded images are JPEGs.
+
+    Non-JPEG sources keep their original extension in the name (`x.png` ->
+    `x.png.jpg`), so `x.png` and `x.jpg` in the same class never map to the
+    same file.
+    """
+    if not resize or PurePosixPath(rel).suffix.lower() == '.jpg':
+        return rel
+    return rel + '.jpg'
+
+
+def write_bytes(data: bytes, dst: Path):
+    tmp = tmp_path_for(dst)
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class Preparer:
+    """Runs the per-file jobs on a thread pool and keeps the manifest/progress up to date."""
+
+    def __init__(self, target: Path, workers: int, link_mode: str, resize: int, quality: int, verify: bool):
+        self.target = target
+        self.workers = workers
+        self.resize = resize
+        self.quality = quality
+        self.verify = verify
+        self.placer = Placer(link_mode)
+        self.manifest = PrepareManifest(target / MANIFEST_NAME, {'resize': resize, 'quality': quality if resize else None})
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # bound queued work (tar members are held in memory until written)
+        self.slots = threading.BoundedSemaphore(workers * 4)
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.total = 0
+        self._lock = threading.Lock()
+        self._futures = []
+        self._made_dirs = set()
+        # target names already claimed in this run, to catch two sources mapping to one file
+        self._claimed = set()
+        # per-thread archive handles, closed in finish()
+        self._handles = []
+
+    def dst_for(self, rel: str) -> Path:
+        dst = self.target / target_name(rel, self.resize)
+        parent = dst.parent
+        if parent not in self._made_dirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            self._made_dirs.add(parent)
+        return dst
+
+    def claim(self, rel: str) -> bool:
+        """Reserve the target name of `rel`; False (and counted as failed) if another source took it."""
+        key = target_name(rel, self.resize)
+        if key in self._claimed:
+            self.failed += 1
+            print(f'Skipping {rel}: another source file already maps to {key}')
+            return False
+        self._claimed.add(key)
+        return True
+
+    def submit(self, rel: str, identity: str, job):
+        """Schedule `job(dst)` unless the manifest says `rel` is already in place."""
+        self.total += 1
+        if not self.claim(rel):
+            return
+        dst = self.dst_for(rel)
+        key = target_name(rel, self.resize)
+        if self.manifest.is_done(key, identity, dst, self.verify):
+            self.skipped += 1
+            return
+        self.slots.acquire()
+        self._futures.append(self.pool.submit(self._run, key, identity, dst, job))
+
+    def _run(self, key: str, identity: str, dst: Path, job):
+        try:
+            crc = job(dst)
+            self.manifest.record(key, identity, dst.stat().st_size, crc)
+            with self._lock:
+                self.done += 1
+                if self.done % 1000 == 0:
+                    print(f'  {self.done + self.skipped}/{self.total}+ files placed')
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f'Failed to prepare {dst}:', e)
+        finally:
+            self.slots.release()
+
+    def finish(self):
+        for f in self._futures:
+            f.result()
+        self.pool.shutdown()
+        for handle in self._handles:
+            handle.close()
+        self._handles.clear()
+        self.manifest.save()
+        methods = ', '.join(f'{k}={v}' for k, v in self.placer.used.items()) or 'n/a'
+        print(f'Prepared {self.total} files: {self.done} written, {self.skipped} already present, '
+              f'{self.failed} failed (placement: {methods})')
+        return self.failed == 0
+
+    # --- sources -----------------------------------------------------------
+
+    def _place_file(self, src: Path, dst: Path):
+        if self.resize:
+            transcode(src, dst, self.resize, self.quality)
+        else:
+            self.placer.place(src, dst)
+        # linked/copied files are verified by size; their CRC would cost a full read
+
+    def from_directory(self, src_root: Path):
+        for dirpath, _, filenames in os.walk(src_root):
+            for fn in filenames:
+                if not is_image_file(fn):
+                    continue
+                src = Path(dirpath) / fn
+                rel = src.relative_to(src_root).as_posix()
+                st = src.stat()
+                identity = f'file:{st.st_size}:{st.st_mtime_ns}'
+                self.submit(rel, identity, lambda dst, src=src: self._place_file(src, dst))
+
+    def from_zip(self, path: Path):
+        with zipfile.ZipFile(path) as z:
+            infos = [i for i in z.infolist() if not i.is_dir()]
+        prefix = archive_candidate(i.filename for i in infos)
+        local = threading.local()
+
+        def read(info):
+            # ZipFile objects are not safe to share between threads; one handle per worker
+            zf = getattr(local, 'zf', None)
+            if zf is None:
+                zf = local.zf = zipfile.ZipFile(path)
+                with self._lock:
+                    self._handles.append(zf)
+            return zf.read(info)
+
+        def job(dst, info):
+            data = read(info)
+            if self.resize:
+                transcode(data, dst, self.resize, self.quality)
+                return None
+            write_bytes(data, dst)
+            return info.CRC
+
+        for info in infos:
+            rel = safe_relpath(info.filename, prefix)
+            if rel is None or not is_image_file(rel):
+                continue
+            self.submit(rel, f'zip:{info.CRC}:{info.file_size}', lambda dst, info=info: job(dst, info))
+
+    def from_tar(self, path: Path):
+        with tarfile.open(path, 'r:*') as t:
+            names = [m.name for m in t.getmembers() if m.isfile()]
+        prefix = archive_candidate(names)
+        # compressed tars can only be read front to back: read here, write on the pool
+        with tarfile.open(path, 'r|*') as t:
+            for member in t:
+                if not member.isfile():
+                    continue
+                rel = safe_relpath(member.name, prefix)
+                if rel is None or not is_image_file(rel):
+                    continue
+                identity = f'tar:{member.size}:{int(member.mtime)}'
+                key = target_name(rel, self.resize)
+                # duplicates fall through to submit(), which reports them
+                if key not in self._claimed and self.manifest.is_done(key, identity, self.dst_for(rel), self.verify):
+                    self.total += 1
+                    self.skipped += 1
+                    self._claimed.add(key)
+                    continue
+                data = t.extractfile(member).read()
+                if self.resize:
+                    job = lambda dst, data=data: transcode(data, dst, self.resize, self.quality)
+                else:
+                    job = lambda dst, data=data: (write_bytes(data, dst), zlib.crc32(data))[1]
+                self.submit(rel, identity, job)
+
+
+def download_source() -> Path:
     try:
         import kagglehub
     except Exception as e:
         print('kagglehub is not installed or could not be imported:', e)
-        print('Install it with `pip install kagglehub` or download the dataset manually and place it under', TARGET_DIR)
+        print('Install it with `pip install kagglehub` or download the dataset manually and pass it with --source')
         sys.exit(1)
 
     print('Downloading dataset via kagglehub:', DATASET_ID)
-    path = kagglehub.dataset_download(DATASET_ID)
-    path = Path(path)
+    path = Path(kagglehub.dataset_download(DATASET_ID))
     print('Downloaded path:', path)
+    return path
 
-    # If path is a file (archive), extract to tempdir
-    workdir = None
-    try:
-        if path.is_file():
-            tmp = Path(tempfile.mkdtemp(prefix='plant_ds_'))
-            print('Extracting archive to', tmp)
-            extracted = extract_archive(path, tmp)
-            workdir = Path(extracted)
-        elif path.is_dir():
-            workdir = path
-        else:
-            print('Downloaded path not found:', path)
-            sys.exit(1)
 
-        print('Searching for image dataset in', workdir)
-        candidate = find_best_candidate(workdir)
-        print('Best candidate for dataset root:', candidate)
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--source', type=Path, default=None, help='local dataset directory or zip/tar archive (default: download from Kaggle)')
+    p.add_argument('--target', type=Path, default=TARGET_DIR)
+    p.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) * 4), help='I/O threads')
+    p.add_argument('--link', type=str, default='auto', choices=['auto', 'reflink', 'hardlink', 'copy'],
+                   help='how to place files from a source directory (auto: reflink, then hardlink, then copy)')
+    p.add_argument('--resize', type=int, default=0, help='re-encode as JPEG with the short side at most this many pixels (0 = keep originals)')
+    p.add_argument('--quality', type=int, default=90, help='JPEG quality for --resize')
+    p.add_argument('--verify', action='store_true', help='re-check CRCs of files the manifest says are present')
+    p.add_argument('--clean', action='store_true', help='delete the target first instead of resuming')
+    return p.parse_args()
 
-        # If candidate contains a few top-level class dirs, copy them directly
-        copy_tree_preserve(candidate, TARGET_DIR)
 
-        print('Dataset prepared at', TARGET_DIR)
+def main():
+    args = parse_args()
+    target = args.target
+    print('Preparing dataset — target location:', target)
+    if args.clean and target.exists():
+        print('Removing existing target:', target)
+        shutil.rmtree(target)
+    target.mkdir(parents=True, exist_ok=True)
+
+    path = args.source if args.source is not None else download_source()
+    if not path.exists():
+        print('Source path not found:', path)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    prep = Preparer(target, args.workers, args.link, args.resize, args.quality, args.verify)
+    try:
+        if path.is_dir():
+            print('Searching for image dataset in', path)
+            candidate = find_best_candidate(path)
+            print('Best candidate for dataset root:', candidate)
+            prep.from_directory(candidate)
+        elif zipfile.is_zipfile(path):
+            print('Extracting zip archive directly into', target)
+            prep.from_zip(path)
+        elif tarfile.is_tarfile(path):
+            print('Extracting tar archive directly into', target)
+            prep.from_tar(path)
+        else:
+            print('Source is neither a directory nor a zip/tar archive:', path)
+            sys.exit(1)
     finally:
-        # don't remove the tmp workdir if it's the same as path
-        pass
+        ok = prep.finish()
+
+    print(f'Dataset prepared at {target} in {time.perf_counter() - start:.1f}s')
+    if not ok:
+        print('Some files failed; rerun to retry them (finished files are skipped)')
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,490 @@
+"""HTTP load test and latency SLO report for the inference API.
+
+Starts the API against a small generated ONNX model, so no checkpoint,
+dataset or network access is needed. By default the server runs under
+uvicorn in a subprocess; `--server inprocess` runs it in a thread of this
+process, and `--url` targets a server that is already running. The generated
+model is written to a temporary models directory (`PDP_MODELS_DIR`) with
+its manifest, and automatic rebuilds are switched off. Use `--model` to
+load-test a real exported model instead.
+
+Each concurrency level (default 1 to 256 clients) runs for `--duration`
+seconds. Every client thread keeps one keep-alive connection (http.client) and
+sends a weighted mix of `/predict`, `/labels` and `/predict/batch` requests
+(the batch endpoint is skipped if the server does not expose it). Upload
+sizes are drawn from a mix of JPEG resolutions. A few random bytes are
+appended after the JPEG end marker so that every upload misses the
+prediction cache; `--allow-cache` sends identical bytes instead.
+
+For each level the report gives throughput (requests/s and images/s), error
+rate by status, and p50/p95/p99/max latency overall and per endpoint. The
+saturation point is the first level that adds less than `--saturation-gain`
+throughput over the best lower level. `--slo-p99-ms` and `--max-error-rate`
+mark each level as passing or failing the SLO. The highest passing level is
+reported as the supported concurrency, and `--fail-on-slo` exits non-zero
+when no level passes.
+
+The load generator runs on the same CPU as the server, so very high
+concurrency partly measures the client. Pin the two with `taskset` if that
+matters.
+
+Usage:
+    python scripts/loadtest.py
+    python scripts/loadtest.py --concurrency 1 4 16 64 --duration 20 --workers 2 --output loadtest.json
+    python scripts/loadtest.py --model models/model.onnx --mix predict=1 --image-sizes 640x480:3 4000x3000:1
+    python scripts/loadtest.py --url http://127.0.0.1:8000 --concurrency 8 32
+    PDP_MICROBATCH=1 python scripts/loadtest.py --server inprocess
+"""
+import argparse
+import http.client
+import io
+import json
+import math
+import os
+from pathlib import Path
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+ENDPOINTS = ('predict', 'labels', 'batch')
+
+
+def dummy_onnx_model(path: Path, num_classes: int, channels: int = 16):
+    """Write a small CNN (conv/relu x2, global pool, linear) with a dynamic batch axis."""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+
+    def init(name, *shape):
+        return numpy_helper.from_array((rng.standard_normal(shape) * 0.1).astype(np.float32), name)
+
+    nodes = [
+        helper.make_node('Conv', ['input', 'w1', 'b1'], ['c1'], kernel_shape=[3, 3], strides=[2, 2], pads=[1, 1, 1, 1]),
+        helper.make_node('Relu', ['c1'], ['r1']),
+        helper.make_node('Conv', ['r1', 'w2', 'b2'], ['c2'], kernel_shape=[3, 3], strides=[2, 2], pads=[1, 1, 1, 1]),
+        helper.make_node('Relu', ['c2'], ['r2']),
+        helper.make_node('GlobalAveragePool', ['r2'], ['gap']),
+        helper.make_node('Flatten', ['gap'], ['flat'], axis=1),
+        helper.make_node('Gemm', ['flat', 'fc_w', 'fc_b'], ['output'], transB=1),
+    ]
+    graph = helper.make_graph(
+        nodes, 'loadtest_dummy',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, ['batch', 3, 'height', 'width'])],
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, ['batch', num_classes])],
+        initializer=[
+            init('w1', channels, 3, 3, 3), init('b1', channels),
+            init('w2', 2 * channels, channels, 3, 3), init('b2', 2 * channels),
+            init('fc_w', num_classes, 2 * channels), init('fc_b', num_classes),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 12)])
+    # onnxruntime rejects IR versions newer than it knows; 7 is what opset 12 needs
+    model.ir_version = 7
+    onnx.checker.check_model(model)
+    onnx.save(model, str(path))
+
+
+def prepare_models_dir(models_dir: Path, args):
+    """Populate `models_dir` with model.onnx + model.json for the server under test."""
+    from src.model.artifacts import file_digest, write_manifest
+
+    model_path = models_dir / 'model.onnx'
+    if args.model is not None:
+        shutil.copyfile(args.model, model_path)
+        src_manifest = args.model.with_suffix('.json')
+        if src_manifest.exists():
+            shutil.copyfile(src_manifest, models_dir / 'model.json')
+            return
+        print(f'No manifest next to {args.model}; writing one with {args.num_classes} generic classes')
+    else:
+        dummy_onnx_model(model_path, args.num_classes, args.dummy_channels)
+    write_manifest(models_dir / 'model.json', {
+        'model': 'loadtest-dummy' if args.model is None else args.model.stem,
+        'classes': [f'Plant___class_{i}' for i in range(args.num_classes)],
+        'input_size': [args.img_size, args.img_size],
+        'onnx_sha256': file_digest(model_path),
+    })
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_env(models_dir: Path) -> dict:
+    return {
+        'PDP_MODELS_DIR': str(models_dir),
+        # nothing to rebuild from; keeps a real checkpoint from replacing the model under test
+        'PDP_CHECKPOINT': str(models_dir / 'no-checkpoint.pth'),
+        'PDP_REBUILD_MODE': 'off',
+    }
+
+
+def start_uvicorn(port: int, env: dict, workers: int, log_path: Path):
+    cmd = [sys.executable, '-m', 'uvicorn', 'src.api.app:app', '--host', '127.0.0.1', '--port', str(port),
+           '--workers', str(workers), '--no-access-log']
+    full_env = dict(os.environ, PDP_UVICORN_WORKERS=str(workers), **env)
+    log = open(log_path, 'w')
+    proc = subprocess.Popen(cmd, cwd=str(PROJECT_ROOT), env=full_env, stdout=log, stderr=subprocess.STDOUT)
+    return proc, log
+
+
+def start_inprocess(port: int, env: dict):
+    # settings are read at import time, so the environment must be set first
+    os.environ.update(env)
+    import uvicorn
+
+    from src.api.app import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, access_log=False, log_level='warning'))
+    thread = threading.Thread(target=server.run, name='loadtest-server', daemon=True)
+    thread.start()
+    return server, thread
+
+
+def request(conn, method: str, path: str, body: bytes = None, headers: dict = None):
+    conn.request(method, path, body=body, headers=headers or {})
+    resp = conn.getresponse()
+    return resp.status, resp.read()
+
+
+def wait_ready(host: str, port: int, timeout_s: float, proc=None):
+    """Poll /stats until the ONNX session is loaded."""
+    deadline = time.monotonic() + timeout_s
+    last = None
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f'server exited with code {proc.returncode}')
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            status, body = request(conn, 'GET', '/stats')
+            conn.close()
+            if status == 200 and json.loads(body)['onnxruntime']['providers']:
+                return json.loads(body)
+            last = f'HTTP {status}'
+        except (OSError, http.client.HTTPException, ValueError, KeyError) as e:
+            last = e
+        time.sleep(0.2)
+    raise TimeoutError(f'server not ready after {timeout_s}s ({last})')
+
+
+def has_batch_endpoint(host: str, port: int) -> bool:
+    try:
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        status, body = request(conn, 'GET', '/openapi.json')
+        conn.close()
+        return status == 200 and '/predict/batch' in json.loads(body).get('paths', {})
+    except (OSError, http.client.HTTPException, ValueError):
+        return False
+
+
+def parse_weights(items, cast=str) -> list:
+    """`['a=3', 'b=1']` / `['640x480:3']` -> [(value, weight), ...]."""
+    out = []
+    for item in items:
+        sep = '=' if '=' in item else ':'
+        value, _, weight = item.partition(sep)
+        out.append((cast(value), float(weight) if weight else 1.0))
+    return out
+
+
+def parse_size(s: str):
+    w, _, h = s.lower().partition('x')
+    return int(w), int(h or w)
+
+
+def make_images(sizes, variants: int, quality: int = 85) -> dict:
+    """A few distinct JPEGs per resolution (smooth gradients + noise, photo-like file sizes)."""
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    images = {}
+    for w, h in sizes:
+        blobs = []
+        for v in range(variants):
+            x = np.linspace(0, 1, w, dtype=np.float32)[None, :, None]
+            y = np.linspace(0, 1, h, dtype=np.float32)[:, None, None]
+            color = rng.uniform(0, 255, (1, 1, 3)).astype(np.float32)
+            noise = rng.standard_normal((h, w, 3), dtype=np.float32) * 12
+            img = (color * (0.6 + 0.4 * x * y) + noise).clip(0, 255).astype(np.uint8)
+            buf = io.BytesIO()
+            Image.fromarray(img).save(buf, format='JPEG', quality=quality)
+            blobs.append(buf.getvalue())
+        images[(w, h)] = blobs
+    return images
+
+
+def multipart(files, boundary: str) -> bytes:
+    """Encode `[(field, filename, bytes), ...]` as multipart/form-data."""
+    parts = []
+    for field, filename, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts)
+
+
+class Client(threading.Thread):
+    """One simulated user: a keep-alive connection sending requests back to back."""
+
+    def __init__(self, idx: int, host: str, port: int, plan: dict, stop: threading.Event, start_at: float):
+        super().__init__(name=f'loadtest-client-{idx}', daemon=True)
+        self.host, self.port = host, port
+        self.plan = plan
+        self.stop = stop
+        self.start_at = start_at
+        self.rng = random.Random(idx)
+        self.conn = None
+        # (endpoint, start offset s, latency s, status, images)
+        self.records = []
+
+    def pick_image(self) -> bytes:
+        size = self.rng.choices(self.plan['sizes'], self.plan['size_weights'])[0]
+        data = self.rng.choice(self.plan['images'][size])
+        if not self.plan['allow_cache']:
+            # bytes after the JPEG EOI marker are ignored by decoders but change the cache key
+            data = data + self.rng.getrandbits(64).to_bytes(8, 'little')
+        return data
+
+    def build(self, endpoint: str):
+        if endpoint == 'labels':
+            return 'GET', '/labels', None, {}, 0
+        boundary = f'loadtest{self.rng.getrandbits(48):x}'
+        headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+        if endpoint == 'predict':
+            files = [('file', 'upload.jpg', self.pick_image())]
+        else:
+            n = self.plan['batch_files']
+            files = [('files', f'img{i}.jpg', self.pick_image()) for i in range(n)]
+        return 'POST', '/predict' if endpoint == 'predict' else '/predict/batch', multipart(files, boundary), headers, len(files)
+
+    def run(self):
+        while not self.stop.is_set():
+            endpoint = self.rng.choices(self.plan['endpoints'], self.plan['endpoint_weights'])[0]
+            method, path, body, headers, n_images = self.build(endpoint)
+            start = time.perf_counter()
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.plan['timeout_s'])
+                status, payload = request(self.conn, method, path, body, headers)
+                if endpoint == 'batch' and status == 200:
+                    # NDJSON stream; per-image failures are reported in the summary line
+                    summary = json.loads(payload.strip().rsplit(b'\n', 1)[-1])
+                    if summary.get('errors'):
+                        status = 'item_error'
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                status = type(e).__name__
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+            end = time.perf_counter()
+            self.records.append((endpoint, start - self.start_at, end - start, status, n_images))
+        if self.conn is not None:
+            self.conn.close()
+
+
+def percentile(sorted_values, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))]
+
+
+def latency_summary(latencies_s) -> dict:
+    ms = sorted(t * 1000 for t in latencies_s)
+    return {
+        'count': len(ms),
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'max_ms': ms[-1] if ms else 0.0,
+    }
+
+
+def run_level(host: str, port: int, concurrency: int, plan: dict, duration_s: float, warmup_s: float) -> dict:
+    """Run `concurrency` clients for warmup + duration seconds; only the measured window counts."""
+    stop = threading.Event()
+    start_at = time.perf_counter()
+    clients = [Client(i, host, port, plan, stop, start_at) for i in range(concurrency)]
+    for c in clients:
+        c.start()
+    time.sleep(warmup_s + duration_s)
+    stop.set()
+    for c in clients:
+        c.join(plan['timeout_s'] + 5)
+
+    # requests that started inside the measured window
+    records = [r for c in clients for r in c.records if warmup_s <= r[1] < warmup_s + duration_s]
+    ok = [r for r in records if r[3] == 200]
+    statuses = {}
+    for r in records:
+        statuses[str(r[3])] = statuses.get(str(r[3]), 0) + 1
+    per_endpoint = {}
+    for endpoint in plan['endpoints']:
+        rows = [r for r in ok if r[0] == endpoint]
+        per_endpoint[endpoint] = dict(latency_summary([r[2] for r in rows]), rps=len(rows) / duration_s)
+    return {
+        'concurrency': concurrency,
+        'requests': len(records),
+        'ok': len(ok),
+        'error_rate': 1 - len(ok) / len(records) if records else 1.0,
+        'statuses': statuses,
+        'rps': len(ok) / duration_s,
+        'images_per_s': sum(r[4] for r in ok) / duration_s,
+        'latency': latency_summary([r[2] for r in ok]),
+        'endpoints': per_endpoint,
+    }
+
+
+def meets_slo(level: dict, slo_p99_ms: float, max_error_rate: float) -> bool:
+    if level['error_rate'] > max_error_rate:
+        return False
+    return not slo_p99_ms or level['latency']['p99_ms'] <= slo_p99_ms
+
+
+def analyze(levels, slo_p99_ms: float, max_error_rate: float, saturation_gain: float) -> dict:
+    """Find the saturation point, the peak throughput and the highest level within the SLO."""
+    best_rps = 0.0
+    saturation = None
+    for lv in levels:
+        if saturation is None and best_rps > 0 and lv['rps'] < best_rps * (1 + saturation_gain):
+            saturation = lv['concurrency']
+        best_rps = max(best_rps, lv['rps'])
+    passing = [lv for lv in levels if lv['slo_ok']]
+    peak = max(levels, key=lambda lv: lv['rps']) if levels else None
+    return {
+        'saturation_concurrency': saturation,
+        'peak_rps': peak['rps'] if peak else 0.0,
+        'peak_rps_concurrency': peak['concurrency'] if peak else None,
+        'max_concurrency_within_slo': passing[-1]['concurrency'] if passing else None,
+        'slo': {'p99_ms': slo_p99_ms, 'max_error_rate': max_error_rate},
+    }
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--url', type=str, default=None, help='test an already running server instead of starting one')
+    p.add_argument('--server', type=str, default='uvicorn', choices=['uvicorn', 'inprocess'])
+    p.add_argument('--workers', type=int, default=1, help='uvicorn worker processes (--server uvicorn)')
+    p.add_argument('--model', type=Path, default=None, help='serve this ONNX model instead of a generated dummy')
+    p.add_argument('--num-classes', type=int, default=38)
+    p.add_argument('--img-size', type=int, default=224)
+    p.add_argument('--dummy-channels', type=int, default=16, help='width of the generated model (more = slower)')
+    p.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8, 16, 32, 64, 128, 256])
+    p.add_argument('--duration', type=float, default=10.0, help='measured seconds per concurrency level')
+    p.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds at the start of each level')
+    p.add_argument('--mix', nargs='+', default=['predict=0.8', 'labels=0.15', 'batch=0.05'],
+                   help='endpoint weights (predict, labels, batch)')
+    p.add_argument('--image-sizes', nargs='+', default=['320x240:2', '640x480:4', '1280x960:3', '4000x3000:1'],
+                   help='WxH:weight upload resolutions')
+    p.add_argument('--image-variants', type=int, default=4, help='distinct base images per resolution')
+    p.add_argument('--batch-files', type=int, default=8, help='images per /predict/batch request')
+    p.add_argument('--allow-cache', action='store_true', help='send identical bytes so repeats hit the prediction cache')
+    p.add_argument('--timeout', type=float, default=60.0, help='per-request timeout in seconds')
+    p.add_argument('--startup-timeout', type=float, default=60.0)
+    p.add_argument('--slo-p99-ms', type=float, default=500.0, help='p99 latency objective (0 = none)')
+    p.add_argument('--max-error-rate', type=float, default=0.01)
+    p.add_argument('--saturation-gain', type=float, default=0.05,
+                   help='a level adding less than this relative throughput marks saturation')
+    p.add_argument('--fail-on-slo', action='store_true', help='exit non-zero if no concurrency level meets the SLO')
+    p.add_argument('--output', type=Path, default=None, help='also write the JSON report here')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    mix = [(e, w) for e, w in parse_weights(args.mix) if w > 0]
+    unknown = [e for e, _ in mix if e not in ENDPOINTS]
+    if unknown:
+        raise SystemExit(f'unknown endpoints in --mix: {unknown} (choose from {ENDPOINTS})')
+    sizes = parse_weights(args.image_sizes, parse_size)
+
+    tmp = None
+    proc = log = server = None
+    try:
+        if args.url:
+            parts = urlsplit(args.url)
+            host, port = parts.hostname, parts.port or 80
+        else:
+            tmp = Path(tempfile.mkdtemp(prefix='pdp_loadtest_'))
+            prepare_models_dir(tmp, args)
+            host, port = '127.0.0.1', free_port()
+            env = server_env(tmp)
+            if args.server == 'uvicorn':
+                proc, log = start_uvicorn(port, env, args.workers, tmp / 'server.log')
+            else:
+                server, _ = start_inprocess(port, env)
+        stats = wait_ready(host, port, args.startup_timeout, proc)
+        print('Server ready:', json.dumps({k: stats.get(k) for k in ('model', 'execution_mode', 'microbatch')}))
+
+        if any(e == 'batch' for e, _ in mix) and not has_batch_endpoint(host, port):
+            print('Server has no /predict/batch endpoint; dropping it from the mix')
+            mix = [(e, w) for e, w in mix if e != 'batch']
+        plan = {
+            'endpoints': [e for e, _ in mix], 'endpoint_weights': [w for _, w in mix],
+            'sizes': [s for s, _ in sizes], 'size_weights': [w for _, w in sizes],
+            'images': make_images([s for s, _ in sizes], args.image_variants),
+            'batch_files': args.batch_files, 'allow_cache': args.allow_cache, 'timeout_s': args.timeout,
+        }
+
+        levels = []
+        print(f"{'clients':>7} {'req/s':>8} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'max ms':>8} {'errors':>7}  SLO")
+        for c in args.concurrency:
+            lv = run_level(host, port, c, plan, args.duration, args.warmup)
+            lv['slo_ok'] = meets_slo(lv, args.slo_p99_ms, args.max_error_rate)
+            lat = lv['latency']
+            print(f"{c:>7} {lv['rps']:8.1f} {lv['images_per_s']:8.1f} {lat['p50_ms']:8.1f} {lat['p95_ms']:8.1f} "
+                  f"{lat['p99_ms']:8.1f} {lat['max_ms']:8.1f} {lv['error_rate']:7.2%}  {'ok' if lv['slo_ok'] else 'FAIL'}")
+            levels.append(lv)
+    except Exception:
+        if tmp is not None and (tmp / 'server.log').exists():
+            log.flush()
+            print('--- server log ---')
+            print((tmp / 'server.log').read_text()[-4000:])
+        raise
+    finally:
+        if server is not None:
+            server.should_exit = True
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    summary = analyze(levels, args.slo_p99_ms, args.max_error_rate, args.saturation_gain)
+    print(f"\nPeak {summary['peak_rps']:.1f} req/s at {summary['peak_rps_concurrency']} clients; "
+          f"saturation at {summary['saturation_concurrency'] or 'none observed'}; "
+          f"max clients within SLO (p99 <= {args.slo_p99_ms:g} ms, errors <= {args.max_error_rate:.1%}): "
+          f"{summary['max_concurrency_within_slo']}")
+    config = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}
+    config['cpu_count'] = os.cpu_count()
+    payload = json.dumps({'config': config, 'server': stats, 'summary': summary, 'levels': levels}, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    print(payload)
+    if args.fail_on_slo and summary['max_concurrency_within_slo'] is None:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
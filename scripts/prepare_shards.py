@@ -0,0 +1,64 @@
+"""Decode the dataset once and pack it into memory-mapped uint8 shards.
+
+The shards are read by `ShardedImageDataset` (`src/train/shards.py`), so
+training no longer decodes full-size JPEGs every epoch. Images are resized so
+their short side is `--size` and center-cropped to a square; keep `--size`
+a bit larger than the training `--img-size` so RandomResizedCrop still has
+room to work.
+
+Usage:
+    python scripts/prepare_shards.py --data-dir data/plant-disease-classification-dataset --out-dir data/shards --size 256
+    python src/train/train.py --shard-dir data/shards ...
+"""
+import argparse
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.train.data_utils import find_image_root, list_image_folder
+from src.train.dataset_index import find_split_dirs
+from src.train.shards import prepare_shards
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--data-dir', type=Path, required=True, help='dataset root (ImageFolder layout)')
+    p.add_argument('--out-dir', type=Path, required=True)
+    p.add_argument('--size', type=int, default=256, help='short side (and square crop) stored in the shards')
+    p.add_argument('--shard-size', type=int, default=4096, help='images per shard file')
+    p.add_argument('--num-workers', type=int, default=None, help='decode processes (default: all cores)')
+    return p.parse_args()
+
+
+def pack_dataset(data_dir: Path, out_dir: Path, size: int = 256, shard_size: int = 4096, num_workers=None) -> dict:
+    """Shard the dataset under `data_dir`; returns the image count per split (`None` for a flat tree).
+
+    An existing train/val/test layout (see `find_split_dirs`) is kept as
+    separate shard sets under `out_dir/train`, `out_dir/val` and `out_dir/test`.
+    """
+    root = find_image_root(data_dir)
+    print('Using dataset root', root)
+    counts = {}
+    classes = None
+    for split, src_dir in find_split_dirs(root) or [(None, root)]:
+        split_classes, samples = list_image_folder(src_dir)
+        classes = classes or split_classes
+        if split_classes != classes:
+            raise RuntimeError(f'class folders under {src_dir} do not match the train split')
+        split_out = out_dir / split if split else out_dir
+        print(f'Packing {len(samples)} images from {src_dir} into {split_out}')
+        prepare_shards(samples, classes, split_out, size=size, shard_size=shard_size, num_workers=num_workers)
+        counts[split] = len(samples)
+    return counts
+
+
+def main():
+    args = parse_args()
+    if not args.data_dir.exists():
+        raise FileNotFoundError(args.data_dir)
+    pack_dataset(args.data_dir, args.out_dir, size=args.size, shard_size=args.shard_size,
+                 num_workers=args.num_workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""Post-training INT8 quantization of the exported ONNX model.
+
+Produces `models/model.int8.onnx` (plus a `models/model.int8.json` sidecar
+manifest) from the fp32 `models/model.onnx`:
+
+- `--mode static`: QDQ quantization of weights and activations, with
+  activation ranges calibrated on images from the validation split built by
+  `prepare_dataloaders` (the same preprocessing as training/serving);
+- `--mode dynamic`: weights-only int8, activations quantized on the fly
+  (no calibration data needed, usually a smaller speedup for CNNs);
+- `--mode both`: builds both, evaluates them, and keeps the fastest one whose
+  top-1 accuracy drop stays within `--max-accuracy-drop`.
+
+Each candidate is compared with the fp32 model on the test split (top-1
+accuracy, agreement with fp32 predictions, batch-1 and batch-N latency) and
+the results are written to `models/model.int8.report.json`.
+
+Serve the quantized model with `PDP_MODEL_VARIANT=int8` (see README).
+
+Usage:
+    python scripts/quantize_onnx.py --data-dir data/plant-disease-classification-dataset
+    python scripts/quantize_onnx.py --shard-dir data/shards --mode both --calib-samples 512
+"""
+import argparse
+import json
+from pathlib import Path
+import shutil
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.api.session import SessionConfig, build_session
+from src.model.artifacts import file_digest, load_manifest, manifest_path_for, write_manifest
+
+
+def loader_batches(loader, limit: int):
+    """Yield float32 NCHW numpy batches (and labels) until `limit` samples were produced."""
+    seen = 0
+    for imgs, labels in loader:
+        if seen >= limit:
+            break
+        take = min(len(imgs), limit - seen)
+        yield imgs[:take].numpy().astype(np.float32, copy=False), labels[:take].numpy()
+        seen += take
+
+
+class LoaderCalibrationReader:
+    """`CalibrationDataReader` over the first `limit` validation images."""
+
+    def __init__(self, input_name: str, loader, limit: int):
+        self.input_name = input_name
+        self.batches = (x for x, _ in loader_batches(loader, limit))
+
+    def get_next(self):
+        x = next(self.batches, None)
+        return None if x is None else {self.input_name: x}
+
+    def rewind(self):
+        pass
+
+
+def preprocess_model(src: Path, dst: Path) -> Path:
+    """Run ORT's quantization pre-processing (shape inference + graph cleanup) when available."""
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+
+        quant_pre_process(str(src), str(dst), skip_symbolic_shape=True)
+        return dst
+    except Exception as e:
+        print('Skipping quantization pre-processing:', e)
+        return src
+
+
+def quantize(mode: str, src: Path, dst: Path, calib_loader, args) -> dict:
+    from onnxruntime import quantization as q
+
+    start = time.perf_counter()
+    if mode == 'dynamic':
+        q.quantize_dynamic(str(src), str(dst), weight_type=q.QuantType.QInt8, per_channel=args.per_channel)
+        settings = {'weight_type': 'int8', 'per_channel': args.per_channel}
+    else:
+        import onnxruntime as ort
+
+        input_name = ort.InferenceSession(str(src), providers=['CPUExecutionProvider']).get_inputs()[0].name
+        method = {
+            'minmax': q.CalibrationMethod.MinMax,
+            'entropy': q.CalibrationMethod.Entropy,
+            'percentile': q.CalibrationMethod.Percentile,
+        }[args.calib_method]
+        reader = LoaderCalibrationReader(input_name, calib_loader, args.calib_samples)
+        q.quantize_static(
+            str(src), str(dst), reader,
+            quant_format=q.QuantFormat.QDQ,
+            activation_type=q.QuantType.QUInt8,
+            weight_type=q.QuantType.QInt8,
+            per_channel=args.per_channel,
+            calibrate_method=method,
+        )
+        settings = {'format': 'QDQ', 'activation_type': 'uint8', 'weight_type': 'int8',
+                    'per_channel': args.per_channel, 'calibration': args.calib_method,
+                    'calibration_samples': args.calib_samples}
+    print(f'{mode} quantization -> {dst} in {time.perf_counter() - start:.1f}s')
+    return {'mode': mode, **settings}
+
+
+def latency_ms(session, x: np.ndarray, warmup: int, runs: int) -> dict:
+    name = session.get_inputs()[0].name
+    for _ in range(warmup):
+        session.run(None, {name: x})
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, {name: x})
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        'batch': int(x.shape[0]),
+        'p50_ms': statistics.median(times),
+        'p95_ms': times[min(len(times) - 1, int(0.95 * len(times)))],
+        'images_per_s': x.shape[0] / (statistics.median(times) / 1000),
+    }
+
+
+def evaluate(sessions: dict, test_loader, args) -> dict:
+    """Top-1 accuracy of each session on the test split, plus agreement with fp32."""
+    correct = {k: 0 for k in sessions}
+    agree = {k: 0 for k in sessions}
+    total = 0
+    sample = None
+    for x, y in loader_batches(test_loader, args.eval_samples):
+        if sample is None:
+            sample = x
+        preds = {}
+        for k, sess in sessions.items():
+            logits = sess.run(None, {sess.get_inputs()[0].name: x})[0]
+            preds[k] = logits.argmax(1)
+            correct[k] += int((preds[k] == y).sum())
+        for k in sessions:
+            agree[k] += int((preds[k] == preds['fp32']).sum())
+        total += len(y)
+    if total == 0:
+        raise RuntimeError('test split is empty; pass --test-split > 0 or use a dataset with a test/ folder')
+
+    report = {}
+    for k, sess in sessions.items():
+        report[k] = {
+            'accuracy': correct[k] / total,
+            'agreement_with_fp32': agree[k] / total,
+            'latency': [
+                latency_ms(sess, sample[:1], args.warmup, args.runs),
+                latency_ms(sess, sample, args.warmup, args.runs),
+            ],
+        }
+    report['samples'] = total
+    return report
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--model', type=Path, default=Path('models/model.onnx'), help='fp32 ONNX model')
+    p.add_argument('--output', type=Path, default=Path('models/model.int8.onnx'))
+    p.add_argument('--mode', type=str, default='static', choices=['static', 'dynamic', 'both'])
+    p.add_argument('--data-dir', type=str, default='data/plant-disease-classification-dataset')
+    p.add_argument('--shard-dir', type=str, default=None)
+    p.add_argument('--img-size', type=int, default=None, help='default: input size from the model manifest')
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--num-workers', type=int, default=4)
+    p.add_argument('--val-split', type=float, default=0.1)
+    p.add_argument('--test-split', type=float, default=0.1)
+    p.add_argument('--calib-samples', type=int, default=512, help='validation images used for static calibration')
+    p.add_argument('--calib-method', type=str, default='minmax', choices=['minmax', 'entropy', 'percentile'])
+    p.add_argument('--per-channel', action='store_true', help='per-channel weight scales (usually more accurate for convs)')
+    p.add_argument('--eval-samples', type=int, default=2000, help='test images used for the accuracy report')
+    p.add_argument('--max-accuracy-drop', type=float, default=0.01, help='--mode both: largest acceptable top-1 drop vs fp32')
+    p.add_argument('--warmup', type=int, default=3)
+    p.add_argument('--runs', type=int, default=20)
+    p.add_argument('--intra-op-threads', type=int, default=0, help='ONNX Runtime threads for the latency numbers (0 = default)')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.model.exists():
+        raise FileNotFoundError(f'{args.model} not found; run scripts/export_onnx.py first')
+    manifest = load_manifest(manifest_path_for(args.model)) or {}
+    img_size = args.img_size or manifest.get('input_size', [224, 224])[0]
+
+    from src.train.data_utils import prepare_dataloaders
+
+    # normalized float batches exactly like training/export (no batch augmentation)
+    _, val_loader, test_loader, classes = prepare_dataloaders(
+        args.data_dir, img_size=img_size, batch_size=args.batch_size, val_split=args.val_split,
+        test_split=args.test_split, num_workers=args.num_workers, shard_dir=args.shard_dir,
+    )
+    if manifest.get('classes') and list(manifest['classes']) != list(classes):
+        print('Warning: dataset classes differ from the model manifest; accuracy numbers will be meaningless')
+
+    work = args.output.parent / '.quant'
+    work.mkdir(parents=True, exist_ok=True)
+    src = preprocess_model(args.model, work / 'preprocessed.onnx')
+    modes = ['static', 'dynamic'] if args.mode == 'both' else [args.mode]
+    candidates = {}
+    for mode in modes:
+        dst = work / f'model.int8-{mode}.onnx'
+        candidates[mode] = (dst, quantize(mode, src, dst, val_loader, args))
+
+    cfg = SessionConfig(intra_op_threads=args.intra_op_threads)
+    sessions = {'fp32': build_session(args.model, cfg)}
+    for mode, (path, _) in candidates.items():
+        sessions[mode] = build_session(path, cfg)
+    results = evaluate(sessions, test_loader, args)
+
+    fp32_acc = results['fp32']['accuracy']
+    ok = [m for m in candidates if fp32_acc - results[m]['accuracy'] <= args.max_accuracy_drop]
+    pool = ok or list(candidates)
+    if not ok:
+        print(f'No candidate within {args.max_accuracy_drop:.3f} of fp32 accuracy; keeping the most accurate one')
+        chosen = max(pool, key=lambda m: results[m]['accuracy'])
+    else:
+        chosen = min(pool, key=lambda m: results[m]['latency'][1]['p50_ms'])
+
+    path, quant_info = candidates[chosen]
+    shutil.copyfile(path, args.output)
+    int8_manifest = dict(manifest)
+    int8_manifest.update({
+        'variant': 'int8',
+        'quantization': quant_info,
+        'source_onnx': str(args.model),
+        'source_onnx_sha256': file_digest(args.model),
+        'onnx_sha256': file_digest(args.output),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    })
+    write_manifest(manifest_path_for(args.output), int8_manifest)
+
+    print(f"\n{'model':>8} {'acc':>7} {'agree':>7} {'b1 p50 ms':>10} {'bN p50 ms':>10} {'bN img/s':>9}  size MB")
+    sizes = {'fp32': args.model.stat().st_size, **{m: p.stat().st_size for m, (p, _) in candidates.items()}}
+    for k in sessions:
+        r = results[k]
+        b1, bn = r['latency']
+        print(f"{k:>8} {r['accuracy']:7.4f} {r['agreement_with_fp32']:7.4f} {b1['p50_ms']:10.2f} "
+              f"{bn['p50_ms']:10.2f} {bn['images_per_s']:9.1f}  {sizes[k] / 1e6:.1f}")
+        r['size_bytes'] = sizes[k]
+    speedup = results['fp32']['latency'][1]['p50_ms'] / results[chosen]['latency'][1]['p50_ms']
+    print(f'\nWrote {args.output} ({chosen}, {speedup:.2f}x batch throughput vs fp32, '
+          f"top-1 {results[chosen]['accuracy'] - fp32_acc:+.4f})")
+
+    report = {
+        'chosen': chosen,
+        'output': str(args.output),
+        'speedup_vs_fp32': speedup,
+        'accuracy_drop': fp32_acc - results[chosen]['accuracy'],
+        'candidates': {m: info for m, (_, info) in candidates.items()},
+        'results': results,
+    }
+    report_path = args.output.with_suffix('.report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Wrote report to', report_path)
+
+
+if __name__ == '__main__':
+    main()
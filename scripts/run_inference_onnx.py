@@ -10,8 +10,7 @@ import numpy as np
 import onnxruntime as ort
 import sys
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from src.model.utils import preprocess_image_pil
-from PIL import Image
+from src.model.utils import PreprocessEngine, decode_image
 
 
 def softmax(x: np.ndarray):
@@ -43,9 +42,9 @@ def main():
             labels = json.load(f)
 
     sess = ort.InferenceSession(str(args.model))
-    img = Image.open(str(args.image)).convert('RGB')
-    x = preprocess_image_pil(img, size=(args.img_size, args.img_size))
-    x = np.expand_dims(x, axis=0).astype(np.float32)
+    engine = PreprocessEngine((args.img_size, args.img_size))
+    img = decode_image(args.image.read_bytes(), engine.size)
+    x = engine.batch_images([img])
     input_name = sess.get_inputs()[0].name
     out = sess.run(None, {input_name: x})[0]
     probs = out[0]
@@ -13,11 +13,10 @@ import json
 import torch
 import torch.nn as nn
 import numpy as np
-from PIL import Image
 import sys
 # ensure project root is on sys.path so `src` package can be imported when running this script directly
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from src.model.utils import preprocess_image_pil
+from src.model.utils import PreprocessEngine, decode_image
 from torchvision import models
 
 
@@ -85,9 +84,9 @@ def main():
     model.to(device)
     model.eval()
 
-    img = Image.open(str(args.image)).convert('RGB')
-    x = preprocess_image_pil(img, size=(args.img_size, args.img_size))
-    x = torch.from_numpy(x).unsqueeze(0).to(device)
+    engine = PreprocessEngine((args.img_size, args.img_size))
+    img = decode_image(args.image.read_bytes(), engine.size)
+    x = torch.from_numpy(engine.batch_images([img])).to(device)
 
     with torch.no_grad():
         out = model(x)
@@ -0,0 +1,58 @@
+"""Start the inference API with ONNX Runtime session options from the command line.
+
+Flags are translated to the `PDP_ORT_*` environment variables read by
+`src/api/session.py`, so they can be mixed with a JSON config file
+(`--ort-config`) and plain environment variables.
+
+Usage:
+    python scripts/serve.py --workers 4 --intra-op-threads auto --graph-opt all --optimized-cache
+"""
+import argparse
+import os
+from pathlib import Path
+import sys
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--host', type=str, default='0.0.0.0')
+    p.add_argument('--port', type=int, default=8000)
+    p.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    p.add_argument('--ort-config', type=str, default=None, help='JSON file with ONNX Runtime session options')
+    p.add_argument('--intra-op-threads', type=str, default=None, help="threads per session, or 'auto' (cores / workers)")
+    p.add_argument('--inter-op-threads', type=int, default=None)
+    p.add_argument('--execution-mode', type=str, default=None, choices=['sequential', 'parallel'])
+    p.add_argument('--graph-opt', type=str, default=None, choices=['disable', 'basic', 'extended', 'all'])
+    p.add_argument('--optimized-cache', action='store_true', help='save/load the optimized graph under models/.ort_cache')
+    p.add_argument('--no-mem-arena', action='store_true')
+    p.add_argument('--providers', type=str, default=None, help='comma-separated provider priority list')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    env = {
+        'PDP_UVICORN_WORKERS': str(args.workers),
+        'PDP_ORT_CONFIG': args.ort_config,
+        'PDP_ORT_INTRA_OP_THREADS': args.intra_op_threads,
+        'PDP_ORT_INTER_OP_THREADS': args.inter_op_threads,
+        'PDP_ORT_EXECUTION_MODE': args.execution_mode,
+        'PDP_ORT_GRAPH_OPT': args.graph_opt,
+        'PDP_ORT_OPTIMIZED_CACHE': '1' if args.optimized_cache else None,
+        'PDP_ORT_MEM_ARENA': '0' if args.no_mem_arena else None,
+        'PDP_ORT_PROVIDERS': args.providers,
+    }
+    for key, value in env.items():
+        if value is not None:
+            os.environ[key] = str(value)
+
+    import uvicorn
+
+    uvicorn.run('src.api.app:app', host=args.host, port=args.port, workers=args.workers, app_dir=str(PROJECT_ROOT))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,35 @@
 """FastAPI app (inference) — loads ONNX model and serves /predict endpoint.
 
 This is a minimal skeleton that expects an ONNX model at `models/model.onnx`.
+Serving only needs onnxruntime/numpy/Pillow: model metadata comes from the
+`models/model.json` manifest written at export time, and torch is imported
+only if the ONNX artifact has to be rebuilt from the checkpoint.
 """
 from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import numpy as np
 from PIL import Image
-import onnxruntime as ort
 import io
+import time
+import asyncio
+import threading
+import zipfile
 from pathlib import Path
-from src.model.utils import preprocess_image_pil
-import torch
+from typing import List
+from dataclasses import asdict
+from src.model.artifacts import load_manifest, manifest_is_stale, manifest_path_for, read_classes_json, write_manifest
+from src.model.utils import IMAGENET_MEAN, IMAGENET_STD, PreprocessEngine, ImageTooLarge, InvalidImage, decode_image, is_image_file
+from src.api.labels import LabelRegistry, file_signature
+from src.api.cache import PredictionCache
+from src.api.batching import MicroBatcher
+from src.api.workers import BoundedPool, Overloaded
+from src.api.timing import RunningStats
+from src.api.session import build_session, load_session_config
+from src.api import metrics, settings
+from src.train.scan import find_class_root
 import json
-import subprocess
 
 app = FastAPI(title='Plant Disease Predictor')
 
@@ -26,10 +41,29 @@ app.add_middleware(
     allow_headers=['*'],
 )
 
+# request latency / in-flight metrics for `/metrics` (+ Server-Timing with PDP_SERVER_TIMING=1)
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    endpoints=('/', '/predict', '/predict/batch', '/labels', '/labels/regenerate', '/stats', '/metrics'),
+    server_timing=settings.SERVER_TIMING,
+)
+
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
-MODEL_PATH = PROJECT_ROOT / 'models' / 'model.onnx'
+MODELS_DIR = Path(settings.MODELS_DIR) if settings.MODELS_DIR else PROJECT_ROOT / 'models'
+MODEL_PATH = MODELS_DIR / 'model.onnx'
 WEB_DIR = PROJECT_ROOT / 'src' / 'web'
-CHECKPOINT_PATH = PROJECT_ROOT / 'checkpoints' / 'best.pth'
+CHECKPOINT_PATH = Path(settings.CHECKPOINT) if settings.CHECKPOINT else PROJECT_ROOT / 'checkpoints' / 'best.pth'
+CLASSES_JSON_PATH = MODELS_DIR / 'classes.json'
+MANIFEST_PATH = manifest_path_for(MODEL_PATH)
+INT8_MODEL_PATH = MODEL_PATH.with_name('model.int8.onnx')
+# the artifact actually loaded into SESSION (MODEL_PATH unless a variant/override is selected)
+SERVED_MODEL_PATH = MODEL_PATH
+
+# ONNX Runtime threads/optimization/providers (PDP_ORT_* env vars or PDP_ORT_CONFIG file)
+SESSION_CONFIG = load_session_config()
+
+# class list loaded once and refreshed only when the manifest/classes.json change
+LABELS = LabelRegistry(MANIFEST_PATH, CLASSES_JSON_PATH, CHECKPOINT_PATH)
 
 if WEB_DIR.exists():
     # serve JS/CSS under /static to avoid catching API routes
@@ -45,96 +79,322 @@ def root():
     return JSONResponse({'error': 'frontend not found'}, status_code=404)
 
 
+def output_class_dim(session):
+    """Return the numeric class dimension of the session output, if static."""
+    out_shape = session.get_outputs()[0].shape
+    if isinstance(out_shape, (list, tuple)) and len(out_shape) >= 2:
+        dim = out_shape[1]
+        if isinstance(dim, int):
+            return dim
+    return None
+
+
+def select_model_path() -> Path:
+    """Pick the artifact to serve from PDP_MODEL_PATH / PDP_MODEL_VARIANT.
+
+    `models/model.onnx` is always the artifact that is (re)built from the
+    checkpoint. The int8 variant is only served while it was quantized from the
+    current fp32 model; otherwise (or if it is missing) fp32 is served.
+    """
+    if settings.MODEL_PATH:
+        return Path(settings.MODEL_PATH)
+    if settings.MODEL_VARIANT == 'int8':
+        int8_manifest = load_manifest(manifest_path_for(INT8_MODEL_PATH))
+        if not INT8_MODEL_PATH.exists() or int8_manifest is None:
+            print('PDP_MODEL_VARIANT=int8 but', INT8_MODEL_PATH, 'is missing; serving fp32 (run scripts/quantize_onnx.py)')
+            return MODEL_PATH
+        fp32_manifest = load_manifest(MANIFEST_PATH) or {}
+        source = int8_manifest.get('source_onnx_sha256')
+        if source and fp32_manifest.get('onnx_sha256') and source != fp32_manifest['onnx_sha256']:
+            print(INT8_MODEL_PATH, 'was quantized from an older model.onnx; serving fp32 until it is re-quantized')
+            return MODEL_PATH
+        return INT8_MODEL_PATH
+    if settings.MODEL_VARIANT != 'fp32':
+        print(f'Unknown PDP_MODEL_VARIANT={settings.MODEL_VARIANT!r}; serving fp32')
+    return MODEL_PATH
+
+
+def served_variant() -> str:
+    if SERVED_MODEL_PATH == MODEL_PATH:
+        return 'fp32'
+    return 'int8' if SERVED_MODEL_PATH == INT8_MODEL_PATH else 'custom'
+
+
+def load_served_session():
+    """Build a session for the selected artifact; returns (session, path)."""
+    path = select_model_path()
+    return build_session(path, SESSION_CONFIG), path
+
+
+REBUILD_LOCK = threading.Lock()
+
+
+def rebuild_model(use_classes_json: bool = True):
+    """Rebuild models/model.onnx from the checkpoint in-process and hot-swap the session.
+
+    With `use_classes_json` the class list comes from models/classes.json (the
+    label-fix case, like scripts/rebuild_and_export.py); otherwise from the
+    checkpoint itself (a retrained checkpoint).
+
+    Uses the cached artifact pipeline (`src/model/artifacts.py`): the
+    checkpoint is read once and an unchanged checkpoint only costs a copy.
+    Requests keep being served by the previous session until the swap. The
+    export's latency benchmark is skipped here: it would compete for CPU with
+    live inference (scripts/export_onnx.py records it offline).
+    """
+    global SESSION, SERVED_MODEL_PATH
+    if not REBUILD_LOCK.acquire(blocking=False):
+        print('ONNX rebuild already running')
+        return
+    try:
+        from src.model.artifacts import build_onnx_artifact
+
+        start = time.perf_counter()
+        info = build_onnx_artifact(CHECKPOINT_PATH, MODEL_PATH,
+                                   classes_json=CLASSES_JSON_PATH if use_classes_json else None,
+                                   benchmark=False)
+        configure_preprocessing(load_manifest(MANIFEST_PATH))
+        SESSION, SERVED_MODEL_PATH = load_served_session()
+        elapsed = time.perf_counter() - start
+        metrics.MODEL_LOAD_SECONDS.observe(elapsed, 'rebuild')
+        print(f"Rebuilt ({info['model']}, cached={info['cached']}) and reloaded ONNX model in {elapsed:.1f}s")
+    except Exception as e:
+        metrics.MODEL_LOAD_FAILURES.inc('rebuild')
+        print('Failed to rebuild ONNX model:', e)
+    finally:
+        REBUILD_LOCK.release()
+
+
+def schedule_rebuild(use_classes_json: bool = True):
+    if settings.REBUILD_MODE == 'off':
+        print('Automatic ONNX rebuild disabled (PDP_REBUILD_MODE=off)')
+    elif settings.REBUILD_MODE == 'blocking':
+        rebuild_model(use_classes_json)
+    else:
+        threading.Thread(target=rebuild_model, args=(use_classes_json,), name='pdp-rebuild', daemon=True).start()
+
+
+def sync_labels_with_model(classes) -> str:
+    """Make the served labels follow `classes` (the contents of models/classes.json).
+
+    `LABELS` reads the model manifest before classes.json, so a new class list
+    only takes effect once it reaches the manifest. With the same number of
+    classes only the names change and the manifest's `classes` are rewritten
+    in place. A different count needs a new output layer, so an ONNX rebuild
+    from classes.json is scheduled; the old labels stay in use (they still
+    match the served model) until the rebuilt model and manifest are swapped in.
+
+    Returns 'unchanged', 'relabelled', 'rebuild' or 'no-manifest' (classes.json
+    is then served directly).
+    """
+    manifest = load_manifest(MANIFEST_PATH)
+    if manifest is None:
+        LABELS.invalidate()
+        return 'no-manifest'
+    current = manifest.get('classes')
+    if current == list(classes):
+        return 'unchanged'
+    if current is not None and len(current) != len(classes):
+        print(f'Class list changed from {len(current)} to {len(classes)} classes. Rebuilding ONNX...')
+        schedule_rebuild(use_classes_json=True)
+        return 'rebuild'
+    manifest['classes'] = list(classes)
+    write_manifest(MANIFEST_PATH, manifest)
+    LABELS.invalidate()
+    print('Updated the class names in', MANIFEST_PATH)
+    return 'relabelled'
+
+
 @app.on_event('startup')
 def load_model():
-    global SESSION
+    global SESSION, SERVED_MODEL_PATH
     SESSION = None
+    # warm the label registry so the first request does not pay for it
+    LABELS.get()
+    manifest = load_manifest(MANIFEST_PATH)
+    if manifest is None:
+        print('No model manifest at', MANIFEST_PATH, '- using classes.json and ImageNet preprocessing defaults')
+    configure_preprocessing(manifest)
     try:
-        if MODEL_PATH.exists():
-            SESSION = ort.InferenceSession(str(MODEL_PATH))
-            print('Loaded ONNX model from', MODEL_PATH)
-            # verify output dimension matches classes, attempt to fix if not
+        if MODEL_PATH.exists() or settings.MODEL_PATH:
+            start = time.perf_counter()
+            SESSION, SERVED_MODEL_PATH = load_served_session()
+            metrics.MODEL_LOAD_SECONDS.observe(time.perf_counter() - start, 'startup')
+            print('Loaded ONNX model from', SERVED_MODEL_PATH)
+            # verify the labels and output dimension match the model, rebuild if not
             try:
+                # the manifest outranks classes.json in LABELS, so compare the two explicitly
+                classes_json = read_classes_json(CLASSES_JSON_PATH) if manifest is not None else None
                 classes = load_labels_from_checkpoint()
-                if classes is not None:
-                    out_shape = SESSION.get_outputs()[0].shape
-                    # try to find numeric class dimension in output shape
-                    class_dim = None
-                    if isinstance(out_shape, (list, tuple)) and len(out_shape) >= 2:
-                        dim = out_shape[1]
-                        if isinstance(dim, int):
-                            class_dim = dim
-                    if class_dim is not None and len(classes) != class_dim:
-                        print(f"ONNX output dim ({class_dim}) != num classes ({len(classes)}). Rebuilding ONNX...")
-                        try:
-                            model_name = infer_model_name_from_checkpoint()
-                            subprocess.run([
-                                'python', str(PROJECT_ROOT / 'scripts' / 'rebuild_and_export.py'),
-                                '--checkpoint', str(CHECKPOINT_PATH),
-                                '--output', str(MODEL_PATH),
-                                '--model', model_name,
-                            ], check=True)
-                            # reload session
-                            SESSION = ort.InferenceSession(str(MODEL_PATH))
-                            print('Rebuilt and reloaded ONNX model')
-                        except Exception as e:
-                            print('Failed to rebuild ONNX model:', e)
-            except Exception:
-                pass
+                class_dim = output_class_dim(SESSION)
+                if classes_json is not None and classes_json != manifest.get('classes'):
+                    print('models/classes.json differs from the model manifest')
+                    sync_labels_with_model(classes_json)
+                elif classes is not None and class_dim is not None and len(classes) != class_dim:
+                    print(f"ONNX output dim ({class_dim}) != num classes ({len(classes)}). Rebuilding ONNX...")
+                    # keep serving the current artifact while the rebuild runs
+                    schedule_rebuild()
+                elif manifest_is_stale(manifest, CHECKPOINT_PATH):
+                    print('Checkpoint changed since the ONNX model was exported. Rebuilding ONNX...')
+                    schedule_rebuild(use_classes_json=False)
+            except Exception as e:
+                print('Failed to verify ONNX output dimension:', e)
+        elif CHECKPOINT_PATH.exists():
+            print('Model file not found at', MODEL_PATH, '- building it from', CHECKPOINT_PATH)
+            schedule_rebuild(use_classes_json=False)
         else:
             print('Model file not found at', MODEL_PATH)
     except Exception as e:
         SESSION = None
+        metrics.MODEL_LOAD_FAILURES.inc('startup')
         print('ONNX model not loaded:', e)
 
 
-def infer_model_name_from_checkpoint():
-    """Try to infer model architecture from checkpoint classifier weight shapes.
+def load_labels_from_checkpoint():
+    """Return the class list (model manifest, else models/classes.json, else checkpoint).
 
-    Returns one of: 'resnet50', 'resnet18', 'efficientnet_b0' (best-effort).
+    Served from the in-memory `LABELS` registry; the files are only re-read
+    when they change on disk.
     """
-    try:
-        if not CHECKPOINT_PATH.exists():
-            return 'resnet18'
-        ckpt = torch.load(str(CHECKPOINT_PATH), map_location='cpu')
-        state = ckpt.get('model_state', ckpt)
-        # look for common classifier weight keys
-        for key in state.keys():
-            if key.endswith('fc.weight'):
-                in_feat = state[key].shape[1]
-                if in_feat == 2048:
-                    return 'resnet50'
-                if in_feat == 512:
-                    return 'resnet18'
-            if 'classifier' in key and state[key].ndim == 2:
-                in_feat = state[key].shape[1]
-                # efficientnet_b0 has 1280 in_features typically
-                if in_feat in (1280, 1536):
-                    return 'efficientnet_b0'
-        # fallback
-        return 'resnet18'
-    except Exception:
-        return 'resnet18'
+    return LABELS.get()
 
 
-def load_labels_from_checkpoint():
-    if CHECKPOINT_PATH.exists():
-        try:
-            ckpt = torch.load(str(CHECKPOINT_PATH), map_location='cpu')
-            classes = ckpt.get('classes', None)
-            if classes is not None:
-                return classes
-        except Exception as e:
-            print('Failed to load checkpoint for labels:', e)
-    # fallback: try models/classes.json
-    classes_json = PROJECT_ROOT / 'models' / 'classes.json'
-    if classes_json.exists():
-        try:
-            with open(classes_json, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print('Failed to read models/classes.json:', e)
-    return None
+def run_session_batch(x: np.ndarray) -> np.ndarray:
+    """Run the ONNX session on an NCHW float32 batch and return (B, C) logits."""
+    input_name = SESSION.get_inputs()[0].name
+    with metrics.stage('inference'):
+        return SESSION.run(None, {input_name: x})[0]
+
+
+# fused resize/normalize writing into per-thread reusable NCHW buffers;
+# reconfigured from the model manifest at startup
+ENGINE = PreprocessEngine((224, 224))
+
+
+def configure_preprocessing(manifest):
+    """Set input size and normalization from the model manifest (ImageNet defaults otherwise)."""
+    global ENGINE
+    if not manifest:
+        return
+    size = manifest.get('input_size', [224, 224])
+    ENGINE = PreprocessEngine(
+        (size[1], size[0]),
+        mean=manifest.get('mean', IMAGENET_MEAN),
+        std=manifest.get('std', IMAGENET_STD),
+    )
+
+
+def run_prepared_batch(arrays) -> np.ndarray:
+    """Fill one NCHW batch from prepared uint8 images and run the session on it."""
+    with metrics.stage('normalize'):
+        x = ENGINE.batch(arrays)
+    return run_session_batch(x)
+
+
+DECODE_STATS = RunningStats()
+
+# content-hash cache of /predict responses (PDP_CACHE=0 disables it)
+CACHE = PredictionCache(
+    max_entries=settings.CACHE_MAX_ENTRIES,
+    ttl_s=settings.CACHE_TTL_S,
+    persist_dir=settings.CACHE_DIR or None,
+) if settings.CACHE_ENABLED else None
+
+
+def model_identity() -> str:
+    """Identity of the served model: ONNX file signature plus class-list digest."""
+    LABELS.get()
+    return f'{SERVED_MODEL_PATH}:{file_signature(SERVED_MODEL_PATH)}:{LABELS.digest}'
+
+
+def decode_and_preprocess(contents: bytes) -> np.ndarray:
+    """Decode an upload into a resized RGB uint8 array ready for `ENGINE.batch`.
+
+    JPEGs are decoded at reduced resolution (DCT scaling) when that still
+    covers the model input size.
+    """
+    start = time.perf_counter()
+    img = decode_image(contents, ENGINE.size, max_bytes=settings.MAX_UPLOAD_BYTES,
+                       max_pixels=settings.MAX_IMAGE_PIXELS)
+    elapsed = time.perf_counter() - start
+    DECODE_STATS.record(elapsed)
+    metrics.record('decode', elapsed)
+    with metrics.stage('preprocess'):
+        return ENGINE.prepare(img)
+
+
+async def read_upload(file: UploadFile, limit: int = None) -> bytes:
+    """Copy an upload into memory, rejecting files over `limit` (PDP_MAX_UPLOAD_BYTES by default).
+
+    Starlette has already received and spooled the whole multipart body
+    (to disk for large files) before the endpoint runs, so this limit does not
+    protect the network/disk side; it keeps an oversized file from also being
+    copied into memory. When the parser recorded the file size, oversized
+    files are rejected without reading them at all.
+    """
+    limit = settings.MAX_UPLOAD_BYTES if limit is None else limit
+    size = getattr(file, 'size', None)
+    if limit and size is not None and size > limit:
+        raise ImageTooLarge(f'upload is {size} bytes (limit {limit})')
+    # a local copy from the spooled file, not network I/O
+    with metrics.stage('upload_copy'):
+        contents = await file.read(limit + 1) if limit else await file.read()
+    if limit and len(contents) > limit:
+        raise ImageTooLarge(f'upload exceeds {limit} bytes')
+    return contents
+
+
+# bounded pools for decode/preprocess and inference (PDP_EXECUTION_MODE=pool)
+if settings.EXECUTION_MODE == 'pool':
+    DECODE_POOL = BoundedPool('decode', settings.DECODE_WORKERS, settings.DECODE_QUEUE)
+    INFER_POOL = BoundedPool('inference', settings.INFER_WORKERS, settings.INFER_QUEUE)
+else:
+    DECODE_POOL = None
+    INFER_POOL = None
+
+# coalesces concurrent /predict calls into one session run (PDP_MICROBATCH=1)
+BATCHER = MicroBatcher(
+    run_prepared_batch,
+    max_batch_size=settings.BATCH_MAX_SIZE,
+    max_latency_ms=settings.BATCH_MAX_LATENCY_MS,
+    run_async=INFER_POOL.run if INFER_POOL is not None else None,
+    max_queue=settings.BATCH_MAX_QUEUE,
+    # one batch in flight per inference worker
+    max_concurrency=INFER_POOL.max_workers if INFER_POOL is not None else 1,
+) if settings.MICROBATCH_ENABLED else None
+
+
+async def offload(pool, fn, *args):
+    """Run `fn` on `pool`, or inline on the event loop when pools are disabled."""
+    if pool is None:
+        return fn(*args)
+    return await pool.run(fn, *args)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    return JSONResponse(
+        {'error': f'server busy ({exc.pool_name} queue full), retry later'},
+        status_code=settings.OVERLOAD_STATUS,
+        headers={'Retry-After': str(settings.OVERLOAD_RETRY_AFTER_S)},
+    )
+
+
+@app.exception_handler(ImageTooLarge)
+async def image_too_large_handler(request, exc: ImageTooLarge):
+    return JSONResponse({'error': str(exc)}, status_code=413)
+
+
+@app.exception_handler(InvalidImage)
+async def invalid_image_handler(request, exc: InvalidImage):
+    return JSONResponse({'error': str(exc)}, status_code=400)
+
+
+@app.on_event('shutdown')
+def shutdown_pools():
+    for pool in (DECODE_POOL, INFER_POOL):
+        if pool is not None:
+            pool.shutdown()
 
 
 def prettify_label(raw: str) -> str:
@@ -179,27 +439,52 @@ def prettify_label(raw: str) -> str:
 async def predict(file: UploadFile = File(...)):
     if SESSION is None:
         return JSONResponse({'error': 'model not loaded (export ONNX using scripts/export_onnx.py)'}, status_code=503)
-    contents = await file.read()
-    img = Image.open(io.BytesIO(contents))
-    x = preprocess_image_pil(img)
-    # add batch dimension
-    x = np.expand_dims(x, axis=0).astype(np.float32)
-    input_name = SESSION.get_inputs()[0].name
-    preds = SESSION.run(None, {input_name: x})[0]
-    # preds is (B, C) logits; convert to probabilities with softmax
+    # fail fast before reading the upload when the pools are saturated
+    for pool in (DECODE_POOL, INFER_POOL):
+        if pool is not None:
+            pool.check_capacity()
+    contents = await read_upload(file)
+    cache_key = None
+    if CACHE is not None:
+        with metrics.stage('cache'):
+            CACHE.set_model_identity(model_identity())
+            cache_key = CACHE.key(contents)
+            cached = CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+    x = await offload(DECODE_POOL, decode_and_preprocess, contents)
+    if BATCHER is not None:
+        # queue wait + the shared batch run (the batch itself is timed as 'inference')
+        with metrics.stage('microbatch'):
+            preds = np.expand_dims(await BATCHER.submit(x), axis=0)
+    else:
+        preds = await offload(INFER_POOL, run_prepared_batch, [x])
+    with metrics.stage('labels'):
+        classes = load_labels_from_checkpoint()
+    with metrics.stage('postprocess'):
+        result = format_prediction(softmax_rows(preds)[0], classes)
+    if cache_key is not None:
+        CACHE.put(cache_key, result)
+    return result
+
+
+def softmax_rows(preds: np.ndarray) -> list:
+    """Convert (B, C) logits to a list of per-row probability lists."""
     try:
         logits = preds.astype('float64')
         # stable softmax
         logits = logits - np.max(logits, axis=1, keepdims=True)
         exp = np.exp(logits)
         probs_np = exp / np.sum(exp, axis=1, keepdims=True)
-        probs = probs_np[0].tolist()
+        return probs_np.tolist()
     except Exception:
         # fallback: try to coerce to list
-        probs = preds[0].tolist()
+        return preds.tolist()
 
+
+def format_prediction(probs: list, classes) -> dict:
+    """Build the `{top, topk, probs}` response for one image."""
     # prepare top-k structured output if labels are available
-    classes = load_labels_from_checkpoint()
     ranked = []
     # topk default 1 if client didn't ask; we return full probs too
     # compute top indices
@@ -214,10 +499,269 @@ async def predict(file: UploadFile = File(...)):
     return {'top': top, 'topk': ranked, 'probs': probs}
 
 
+class ZipMembers:
+    """Image members of an uploaded zip archive, checked before anything is decompressed.
+
+    The member count (`max_members`) and every member's uncompressed size
+    (`max_member_bytes`) are checked from the central directory when the
+    archive is opened, and `read` never inflates more than that, so a small
+    zip bomb is rejected with `ImageTooLarge` instead of being expanded in
+    memory. `ZipFile` handles are not safe to share between threads: each
+    decode worker opens its own over the same bytes, and `close` closes them all.
+    """
+
+    def __init__(self, data: bytes, max_member_bytes: int = 0, max_members: int = 0):
+        self.data = data
+        self.max_member_bytes = max_member_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._handles = []
+        try:
+            self.infos = [i for i in self._handle().infolist() if not i.is_dir() and is_image_file(i.filename)
+                          and not Path(i.filename).name.startswith('.')]
+            if max_members and len(self.infos) > max_members:
+                raise ImageTooLarge(f'zip archive has {len(self.infos)} images (limit {max_members})')
+            for info in self.infos:
+                if max_member_bytes and info.file_size > max_member_bytes:
+                    raise ImageTooLarge(f'{info.filename} is {info.file_size} bytes uncompressed '
+                                        f'(limit {max_member_bytes})')
+        except BaseException:
+            self.close()
+            raise
+
+    def _handle(self) -> zipfile.ZipFile:
+        zf = getattr(self._local, 'zf', None)
+        if zf is None:
+            zf = self._local.zf = zipfile.ZipFile(io.BytesIO(self.data))
+            with self._lock:
+                self._handles.append(zf)
+        return zf
+
+    def names(self):
+        return [i.filename for i in self.infos]
+
+    def read(self, name: str) -> bytes:
+        limit = self.max_member_bytes
+        with self._handle().open(name) as f:
+            data = f.read(limit + 1) if limit else f.read()
+        if limit and len(data) > limit:
+            raise ImageTooLarge(f'{name} exceeds {limit} bytes uncompressed')
+        return data
+
+    def close(self):
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for zf in handles:
+            zf.close()
+
+
+def decode_batch_item(item):
+    """Decode one `(name, bytes | (ZipMembers, member))` item; runs on the decode pool."""
+    _, source = item
+    if isinstance(source, Exception):
+        raise source
+    if isinstance(source, tuple):
+        members, member = source
+        source = members.read(member)
+    return decode_and_preprocess(source)
+
+
+async def run_with_retry(coro_fn, *args):
+    """Await `coro_fn(*args)`, backing off while the pool is saturated.
+
+    Used inside streaming responses where the status line was already sent and
+    a 503 can no longer be returned.
+    """
+    delay = 0.01
+    while True:
+        try:
+            return await coro_fn(*args)
+        except Overloaded:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+async def decode_chunk(chunk):
+    """Read uploads and decode a chunk in parallel; returns arrays or exceptions."""
+    items = []
+    for name, source in chunk:
+        if not isinstance(source, (bytes, tuple)):
+            try:
+                source = await read_upload(source)
+            except ImageTooLarge as e:
+                source = e
+        items.append((name, source))
+    if DECODE_POOL is None:
+        results = []
+        for item in items:
+            try:
+                results.append(decode_batch_item(item))
+            except Exception as e:
+                results.append(e)
+        return results
+    return await run_with_retry(DECODE_POOL.run_many, decode_batch_item, items)
+
+
+async def predict_chunk(arrays):
+    if INFER_POOL is None:
+        return run_prepared_batch(arrays)
+    return await run_with_retry(INFER_POOL.run, run_prepared_batch, arrays)
+
+
+async def stream_batch_predictions(sources, archives=()):
+    """Yield one NDJSON line per image, chunk by chunk.
+
+    Decoding of chunk k+1 overlaps with inference of chunk k. The uploaded
+    `archives` are closed when the stream ends (or the client disconnects).
+    """
+    try:
+        async for line in _stream_batch_predictions(sources):
+            yield line
+    finally:
+        for members in archives:
+            members.close()
+
+
+async def _stream_batch_predictions(sources):
+    chunk_size = max(1, settings.BATCH_CHUNK_SIZE)
+    chunks = [sources[i:i + chunk_size] for i in range(0, len(sources), chunk_size)]
+    with metrics.stage('labels'):
+        classes = load_labels_from_checkpoint()
+    n_ok = 0
+    n_err = 0
+    next_decode = asyncio.ensure_future(decode_chunk(chunks[0])) if chunks else None
+    for ci, chunk in enumerate(chunks):
+        decoded = await next_decode
+        next_decode = asyncio.ensure_future(decode_chunk(chunks[ci + 1])) if ci + 1 < len(chunks) else None
+        good = [(j, arr) for j, arr in enumerate(decoded) if not isinstance(arr, BaseException)]
+        results = [None] * len(chunk)
+        if good:
+            try:
+                preds = await predict_chunk([arr for _, arr in good])
+                with metrics.stage('postprocess'):
+                    for (j, _), probs in zip(good, softmax_rows(preds)):
+                        results[j] = format_prediction(probs, classes)
+            except Exception as e:
+                for j, _ in good:
+                    decoded[j] = e
+        for j, (name, _) in enumerate(chunk):
+            index = ci * chunk_size + j
+            if results[j] is not None:
+                n_ok += 1
+                line = {'index': index, 'filename': name, **results[j]}
+            else:
+                n_err += 1
+                line = {'index': index, 'filename': name, 'error': str(decoded[j])}
+            yield json.dumps(line) + '\n'
+    yield json.dumps({'done': True, 'count': len(sources), 'ok': n_ok, 'errors': n_err}) + '\n'
+
+
+@app.post('/predict/batch')
+async def predict_batch(files: List[UploadFile] = File(...)):
+    """Predict many images in one request.
+
+    Accepts any number of image uploads under the `files` form field; zip
+    archives among them are expanded. Results are streamed back as NDJSON, one
+    line per image (`index`, `filename` and the same fields as `/predict`, or
+    `error`), followed by a final `{"done": true, ...}` summary line.
+    """
+    if SESSION is None:
+        return JSONResponse({'error': 'model not loaded (export ONNX using scripts/export_onnx.py)'}, status_code=503)
+    for pool in (DECODE_POOL, INFER_POOL):
+        if pool is not None:
+            pool.check_capacity()
+    sources = []
+    archives = []
+    streaming = False
+    try:
+        for f in files:
+            name = f.filename or 'upload'
+            if name.lower().endswith('.zip') or f.content_type in ('application/zip', 'application/x-zip-compressed'):
+                data = await read_upload(f, settings.MAX_ARCHIVE_BYTES)
+                try:
+                    members = ZipMembers(data, settings.MAX_UPLOAD_BYTES, settings.BATCH_MAX_FILES)
+                except zipfile.BadZipFile:
+                    return JSONResponse({'error': f'invalid zip archive: {name}'}, status_code=400)
+                archives.append(members)
+                sources.extend((f'{name}/{m}', (members, m)) for m in members.names())
+            else:
+                sources.append((name, f))
+        if not sources:
+            return JSONResponse({'error': 'no images found in upload'}, status_code=400)
+        if len(sources) > settings.BATCH_MAX_FILES:
+            return JSONResponse({'error': f'too many images ({len(sources)} > {settings.BATCH_MAX_FILES})'},
+                                status_code=413)
+        streaming = True
+        return StreamingResponse(stream_batch_predictions(sources, archives), media_type='application/x-ndjson')
+    finally:
+        if not streaming:
+            for members in archives:
+                members.close()
+
+
+@app.get('/stats')
+def stats():
+    """Runtime statistics (worker pools, micro-batching batch sizes and latencies)."""
+    return {
+        'execution_mode': settings.EXECUTION_MODE,
+        'model': {'path': str(SERVED_MODEL_PATH), 'variant': served_variant()},
+        'onnxruntime': {**asdict(SESSION_CONFIG), 'providers': SESSION.get_providers() if SESSION is not None else []},
+        'pools': {p.name: p.stats() for p in (DECODE_POOL, INFER_POOL) if p is not None},
+        'microbatch': BATCHER.stats() if BATCHER is not None else {'enabled': False},
+        'decode': DECODE_STATS.stats(),
+        'cache': CACHE.stats() if CACHE is not None else {'enabled': False},
+    }
+
+
+def pool_samples(attr: str):
+    return [((p.name,), getattr(p, attr)) for p in (DECODE_POOL, INFER_POOL) if p is not None]
+
+
+def pool_queued():
+    return [((p.name,), max(0, p.in_flight - p.max_workers)) for p in (DECODE_POOL, INFER_POOL) if p is not None]
+
+
+def register_app_metrics():
+    """Scrape-time views of the pools, micro-batcher, cache and served model."""
+    r = metrics.REGISTRY
+    r.callback('pdp_pool_in_flight', 'Calls running or queued on a worker pool.',
+               lambda: pool_samples('in_flight'), ('pool',))
+    r.callback('pdp_pool_queue_depth', 'Calls waiting for a free pool worker.', pool_queued, ('pool',))
+    r.callback('pdp_pool_rejected_total', 'Calls rejected because the pool queue was full.',
+               lambda: pool_samples('rejected'), ('pool',), kind='counter')
+    if BATCHER is not None:
+        r.callback('pdp_microbatch_queue_depth', 'Requests waiting for the next micro-batch.',
+                   lambda: BATCHER.stats()['queue_depth'])
+        r.callback('pdp_microbatch_batches_total', 'Micro-batches run.', lambda: BATCHER.batches, kind='counter')
+        r.callback('pdp_microbatch_items_total', 'Images run through micro-batches.', lambda: BATCHER.items,
+                   kind='counter')
+        r.callback('pdp_microbatch_rejected_total', 'Requests rejected because the micro-batch queue was full.',
+                   lambda: BATCHER.rejected, kind='counter')
+    if CACHE is not None:
+        r.callback('pdp_cache_hits_total', 'Prediction cache hits.', lambda: CACHE.hits, kind='counter')
+        r.callback('pdp_cache_misses_total', 'Prediction cache misses.', lambda: CACHE.misses, kind='counter')
+        r.callback('pdp_cache_hit_ratio', 'Prediction cache hit ratio since startup.',
+                   lambda: CACHE.stats()['hit_ratio'])
+        r.callback('pdp_cache_entries', 'Entries in the in-memory prediction cache.', lambda: CACHE.stats()['entries'])
+    r.callback('pdp_model_loaded', '1 while an ONNX session is loaded.', lambda: int(SESSION is not None))
+    r.callback('pdp_model_info', 'Served model artifact.',
+               lambda: [((str(SERVED_MODEL_PATH), served_variant()), 1)], ('path', 'variant'))
+
+
+register_app_metrics()
+
+
+@app.get('/metrics')
+def prometheus_metrics():
+    """Prometheus text-format metrics (see `src/api/metrics.py`)."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get('/labels')
 def labels():
-    """Return class labels from checkpoint if available."""
-    classes = load_labels_from_checkpoint()
+    """Return class labels from the model manifest / classes.json if available."""
+    with metrics.stage('labels'):
+        classes = load_labels_from_checkpoint()
     if classes is None:
         return JSONResponse({'error': 'labels not found; ensure checkpoint exists at checkpoints/best.pth or export ONNX'}, status_code=404)
     # return enhanced objects with prettified labels for frontend consumption
@@ -234,37 +778,29 @@ def regenerate_labels_from_data(data_root: str = None):
     POST body or query param `data_root` may specify path to ImageFolder root.
     If omitted, defaults to `data/plant-disease-classification-dataset`.
     This helps if labels were saved incorrectly (for example the entire archive
-    became a single-folder named `dataset`).
+    became a single-folder named `dataset`). The new names are served right
+    away when the class count is unchanged; otherwise the ONNX model is rebuilt
+    for the new count (see `sync_labels_with_model`, reported as `model`).
     """
     root = PROJECT_ROOT / 'data' / 'plant-disease-classification-dataset' if not data_root else Path(data_root)
     if not root.exists():
         return JSONResponse({'error': f'data root not found: {root}'}, status_code=404)
-    # find class subfolders (top-level directories)
-    classes = [p.name for p in sorted(root.iterdir()) if p.is_dir()]
-    if not classes:
-        # try deeper: look for folders that contain many image files
-        candidates = [p for p in root.rglob('*') if p.is_dir()]
-        best = None
-        best_count = 0
-        for p in candidates:
-            cnt = sum(1 for _ in p.rglob('*') if is_image_file(str(_)))
-            if cnt > best_count:
-                best = p
-                best_count = cnt
-        if best is not None:
-            classes = [p.name for p in sorted(best.iterdir()) if p.is_dir()]
+    # one scandir pass; handles archives that wrap the class folders in extra directories
+    scan = find_class_root(root)
+    classes = scan.classes
 
     if not classes:
         return JSONResponse({'error': 'could not find class folders under data root'}, status_code=400)
 
     # write models/classes.json
     try:
-        models_dir = PROJECT_ROOT / 'models'
-        models_dir.mkdir(parents=True, exist_ok=True)
-        classes_path = models_dir / 'classes.json'
+        MODELS_DIR.mkdir(parents=True, exist_ok=True)
+        classes_path = CLASSES_JSON_PATH
         import json as _json
         with open(classes_path, 'w') as f:
             _json.dump(classes, f)
-        return {'classes': classes, 'written_to': str(classes_path)}
+        model = sync_labels_with_model(classes)
+        return {'classes': classes, 'counts': scan.counts, 'data_root': str(scan.root), 'written_to': str(classes_path),
+                'model': model}
     except Exception as e:
         return JSONResponse({'error': str(e)}, status_code=500)
@@ -0,0 +1,156 @@
+"""Dynamic micro-batching for the ONNX session.
+
+Concurrent `/predict` requests each submit one prepared image. A single
+background task drains the queue, waiting at most `max_latency_ms` after the
+first item (or until `max_batch_size` items are queued), passes the list of
+images to `run_batch` (which fills one NCHW batch and runs the session once)
+and hands each caller its own row of logits.
+
+`run_async` (e.g. `BoundedPool.run`) moves the batched session run off the
+event loop; `max_queue` bounds the number of waiting requests. Up to
+`max_concurrency` batches run at once (set it to the inference pool size so
+every worker has a batch); the next batch is only collected once a slot is
+free, so under load requests keep accumulating into larger batches instead
+of queueing behind the pool.
+"""
+from typing import Callable, Dict, List, Tuple
+import asyncio
+import contextvars
+import time
+
+import numpy as np
+
+from src.api.workers import Overloaded
+
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[List[np.ndarray]], np.ndarray],
+                 max_batch_size: int = 8, max_latency_ms: float = 5.0,
+                 run_async=None, max_queue: int = 0, max_concurrency: int = 1):
+        self.run_batch = run_batch
+        self.run_async = run_async
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._slots = None
+        self._running = set()
+        self.max_queue = max(0, int(max_queue))
+        self.rejected = 0
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max(0.0, float(max_latency_ms)) / 1000.0
+        self._queue = None
+        self._task = None
+        # stats
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Dict[int, int] = {}
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.total_run_s = 0.0
+        self.max_run_s = 0.0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            # start from an empty context: the long-lived worker must not keep the
+            # request-scoped context vars of whichever request happened to start it
+            loop = asyncio.get_running_loop()
+            self._task = contextvars.Context().run(loop.create_task, self._worker())
+
+    async def submit(self, x: np.ndarray) -> np.ndarray:
+        """Queue one prepared image and wait for its logits row."""
+        self._ensure_started()
+        if self.max_queue and self._queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded('microbatch')
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((x, fut, time.perf_counter()))
+        return await fut
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future, float]]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # still take whatever is already waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch):
+        try:
+            # images of different sizes cannot be stacked together
+            groups: Dict[tuple, list] = {}
+            for item in batch:
+                groups.setdefault(item[0].shape, []).append(item)
+            for items in groups.values():
+                await self._run_group(items)
+        finally:
+            self._slots.release()
+
+    async def _run_group(self, items):
+        start = time.perf_counter()
+        try:
+            x = [x for x, _, _ in items]
+            if self.run_async is not None:
+                out = await self.run_async(self.run_batch, x)
+            else:
+                out = self.run_batch(x)
+        except Exception as e:
+            for _, fut, _ in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        end = time.perf_counter()
+        for i, (_, fut, queued_at) in enumerate(items):
+            wait = start - queued_at
+            self.total_wait_s += wait
+            self.max_wait_s = max(self.max_wait_s, wait)
+            if not fut.done():
+                fut.set_result(out[i])
+        run = end - start
+        n = len(items)
+        self.batches += 1
+        self.items += n
+        self.batch_sizes[n] = self.batch_sizes.get(n, 0) + 1
+        self.total_run_s += run
+        self.max_run_s = max(self.max_run_s, run)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': True,
+            'max_batch_size': self.max_batch_size,
+            'max_latency_ms': self.max_latency * 1000.0,
+            'max_concurrency': self.max_concurrency,
+            'running_batches': len(self._running),
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'batch_size_histogram': {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            'mean_queue_wait_ms': 1000.0 * self.total_wait_s / self.items if self.items else 0.0,
+            'max_queue_wait_ms': 1000.0 * self.max_wait_s,
+            'mean_run_ms': 1000.0 * self.total_run_s / self.batches if self.batches else 0.0,
+            'max_run_ms': 1000.0 * self.max_run_s,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue': self.max_queue,
+            'rejected': self.rejected,
+        }
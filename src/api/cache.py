@@ -0,0 +1,159 @@
+"""Prediction cache keyed by upload content and model identity.
+
+Re-submitted images (retries, the history page, shared links) skip the whole
+decode -> preprocess -> ONNX path. Keys combine a fast content hash of the
+uploaded bytes with an identity string for the served model (ONNX file
+signature + class list), and the cache is cleared as soon as that identity
+changes. Entries live in an in-memory LRU with a TTL and can optionally be
+persisted as small JSON files so they survive restarts.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+import hashlib
+import json
+import shutil
+import threading
+import time
+
+try:
+    import xxhash
+except ImportError:  # optional, blake2b is fast enough without it
+    xxhash = None
+
+
+def content_hash(data: bytes) -> str:
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, max_entries: int = 2048, ttl_s: float = 3600.0, persist_dir: Optional[Path] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.model_identity = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, data: bytes) -> str:
+        return content_hash(data)
+
+    def set_model_identity(self, identity: str):
+        """Drop every entry when the served model (or its labels) changed."""
+        if identity == self.model_identity:
+            return
+        with self._lock:
+            if identity == self.model_identity:
+                return
+            if self.model_identity is not None:
+                self.invalidations += 1
+                print('Model changed, clearing prediction cache')
+            self._entries.clear()
+            self.model_identity = identity
+            if self.persist_dir is not None:
+                self._prune_disk()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_s > 0 and time.time() - stored_at > self.ttl_s
+
+    def _disk_dir(self) -> Path:
+        return self.persist_dir / hashlib.blake2b(self.model_identity.encode(), digest_size=8).hexdigest()
+
+    def _prune_disk(self):
+        # entries written for other model identities can never be hit again
+        try:
+            keep = self._disk_dir()
+            if self.persist_dir.exists():
+                for p in self.persist_dir.iterdir():
+                    if p.is_dir() and p != keep:
+                        shutil.rmtree(p, ignore_errors=True)
+        except OSError as e:
+            print('Failed to prune prediction cache dir:', e)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._expired(stored_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += 1
+        return value
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        self._disk_put(key, now, value)
+
+    def _disk_get(self, key: str):
+        if self.persist_dir is None or self.model_identity is None:
+            return None
+        path = self._disk_dir() / f'{key}.json'
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(record.get('stored_at', 0.0)):
+            path.unlink(missing_ok=True)
+            return None
+        with self._lock:
+            self._entries[key] = (record['stored_at'], record['value'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return record['value']
+
+    def _disk_put(self, key: str, stored_at: float, value: dict):
+        if self.persist_dir is None or self.model_identity is None:
+            return
+        try:
+            d = self._disk_dir()
+            d.mkdir(parents=True, exist_ok=True)
+            tmp = d / f'.{key}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'stored_at': stored_at, 'value': value}, f)
+            tmp.replace(d / f'{key}.json')
+        except OSError as e:
+            print('Failed to persist prediction cache entry:', e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'enabled': True,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_s': self.ttl_s,
+            'persist_dir': str(self.persist_dir) if self.persist_dir else None,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,112 @@
+"""Label registry shared by the API endpoints.
+
+Reading the class list used to mean a full `torch.load` of the checkpoint on
+every request. The registry loads the labels once and only reloads them when
+the backing files change: a cheap `os.stat` signature (mtime + size) is
+checked on each access and, when it differs, a content hash decides whether
+the file really changed (e.g. a `touch` or a copy with identical bytes does
+not trigger a reload).
+
+Only the first source that exists is tracked (and hashed), so with a model
+manifest in place the checkpoint is never read and torch is never imported.
+"""
+from pathlib import Path
+from typing import List, Optional
+import hashlib
+import json
+import threading
+
+from src.model.artifacts import file_digest, file_signature
+
+
+def read_checkpoint_classes(path: Path):
+    import torch
+
+    ckpt = torch.load(str(path), map_location='cpu')
+    return ckpt.get('classes', None)
+
+
+def read_classes_json(path: Path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def read_manifest_classes(path: Path):
+    with open(path, 'r') as f:
+        return json.load(f).get('classes', None)
+
+
+class LabelRegistry:
+    """Thread-safe, lazily refreshed view of the model class list.
+
+    Sources are tried in order: the model manifest written at export time,
+    then `models/classes.json`, and only as a last resort the checkpoint
+    `classes` (which needs torch).
+    """
+
+    def __init__(self, manifest_path: Path, classes_json_path: Path, checkpoint_path: Path):
+        self.sources = [
+            (Path(manifest_path), read_manifest_classes),
+            (Path(classes_json_path), read_classes_json),
+            (Path(checkpoint_path), read_checkpoint_classes),
+        ]
+        self._lock = threading.Lock()
+        self._signature = None
+        self._digests = None
+        self._classes = None
+        self._loaded = False
+        # bumped every time the class list actually changes
+        self.version = 0
+        # stable digest of the class list (survives restarts, unlike `version`)
+        self.digest = None
+
+    def _current_signature(self):
+        # signatures up to and including the first existing source
+        sigs = []
+        for path, _ in self.sources:
+            sig = file_signature(path)
+            sigs.append(sig)
+            if sig is not None:
+                break
+        return tuple(sigs)
+
+    def _read(self) -> Optional[List[str]]:
+        for path, reader in self.sources:
+            if not path.exists():
+                continue
+            try:
+                classes = reader(path)
+                if classes is not None:
+                    return list(classes)
+            except Exception as e:
+                print(f'Failed to read labels from {path}:', e)
+        return None
+
+    def get(self) -> Optional[List[str]]:
+        """Return the current class list, reloading it if the files changed."""
+        signature = self._current_signature()
+        if self._loaded and signature == self._signature:
+            return self._classes
+        with self._lock:
+            if self._loaded and signature == self._signature:
+                return self._classes
+            digests = tuple(file_digest(path) if sig is not None else None
+                            for (path, _), sig in zip(self.sources, signature))
+            if not self._loaded or digests != self._digests:
+                classes = self._read()
+                if classes != self._classes or not self._loaded:
+                    self.version += 1
+                self._classes = classes
+                self.digest = hashlib.sha256(json.dumps(classes).encode()).hexdigest()[:16]
+                self._digests = digests
+                self._loaded = True
+                print('Loaded labels:', len(classes) if classes else 0, 'classes')
+            self._signature = signature
+            return self._classes
+
+    def invalidate(self):
+        """Force the next `get()` to re-read the label sources."""
+        with self._lock:
+            self._loaded = False
+            self._signature = None
+            self._digests = None
@@ -0,0 +1,286 @@
+"""Prometheus metrics and per-request stage timing for the API.
+
+`GET /metrics` renders everything in the Prometheus text format (0.0.4)
+without the `prometheus_client` dependency:
+
+- `pdp_request_duration_seconds{endpoint,method,status}`: whole-request
+  latency, recorded by `MetricsMiddleware`,
+- `pdp_requests_in_flight{endpoint}`,
+- `pdp_stage_duration_seconds{stage}`: upload copy out of Starlette's spooled
+  file, decode (`Image.open` + draft decode), preprocess, normalize,
+  inference, label lookup, postprocess, ...; recorded with `stage()` /
+  `record()`,
+- `pdp_model_load_duration_seconds{kind}`: startup load and in-process
+  rebuilds,
+- callback gauges registered by the app (pool and micro-batch queue depths,
+  cache hit ratio, ...), read only when `/metrics` is scraped,
+- `process_resident_memory_bytes` and `process_cpu_seconds_total`.
+
+The hot path costs one `perf_counter` pair and a short lock per observation.
+With `PDP_SERVER_TIMING=1` every response also gets a `Server-Timing` header
+with the stages that ran before the response started (for the streamed
+`/predict/batch` response, that is only the stages before the first line).
+`BoundedPool` runs work in a copy of the caller's context, so stages timed on
+the decode and inference pools are included.
+
+Metrics are kept per process. With several uvicorn workers each scrape sees
+only the worker that served it.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+import os
+import resource
+import sys
+import threading
+import time
+
+# seconds; covers ~0.1 ms label lookups up to multi-second batch requests and rebuilds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last = +Inf), sum]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1]) for k, v in sorted(self._series.items())]
+        for values, counts, total in snapshot:
+            cumulative = 0
+            for le, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le_label = 'le="' + _number(le) + '"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, values, le_label)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, values)} {cumulative}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for values, v in snapshot:
+            yield f'{self.name}{_labels(self.labelnames, values)} {_number(v)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class CallbackMetric:
+    """Gauge/counter whose samples come from `fn()` at scrape time.
+
+    `fn` returns a number, or an iterable of `(labelvalues tuple, number)`.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable, labelnames: Tuple[str, ...] = (), kind: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f'metrics: {self.name} callback failed:', e)
+            return
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        samples = [((), value)] if isinstance(value, (int, float)) else value
+        for values, v in samples:
+            yield f'{self.name}{_labels(self.labelnames, values)} {_number(v)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics = [m for m in self._metrics if m.name != metric.name] + [metric]
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def callback(self, name, help, fn, labelnames=(), kind='gauge') -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, fn, labelnames, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def process_rss_bytes() -> int:
+    """Current resident set size (Linux /proc), else the peak from getrusage."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def process_cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'pdp_request_duration_seconds', 'Time from request start to the end of the response body.',
+    ('endpoint', 'method', 'status'))
+IN_FLIGHT = REGISTRY.gauge('pdp_requests_in_flight', 'Requests currently being handled.', ('endpoint',))
+STAGE_SECONDS = REGISTRY.histogram(
+    'pdp_stage_duration_seconds', 'Time spent in each processing stage (one observation per call).', ('stage',))
+MODEL_LOAD_SECONDS = REGISTRY.histogram(
+    'pdp_model_load_duration_seconds', 'ONNX session load (startup) and in-process rebuild+reload durations.',
+    ('kind',), buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+MODEL_LOAD_FAILURES = REGISTRY.counter(
+    'pdp_model_load_failures_total', 'Failed model loads/rebuilds.', ('kind',))
+REGISTRY.callback('process_resident_memory_bytes', 'Resident memory size in bytes.', process_rss_bytes)
+REGISTRY.callback('process_cpu_seconds_total', 'Total user and system CPU time in seconds.',
+                  process_cpu_seconds, kind='counter')
+
+# (stage, seconds) pairs for the current request; None unless Server-Timing is enabled
+REQUEST_TIMINGS: ContextVar[Optional[list]] = ContextVar('pdp_request_timings', default=None)
+
+
+def record(name: str, seconds: float):
+    """Record an already measured stage duration."""
+    STAGE_SECONDS.observe(seconds, name)
+    timings = REQUEST_TIMINGS.get()
+    if timings is not None:
+        # list.append is atomic, so pool threads can add to the same request
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def server_timing(timings) -> str:
+    """`[(stage, s), ...]` -> `upload_copy;dur=0.41, decode;dur=3.2` (durations summed per stage, in ms)."""
+    totals: Dict[str, float] = {}
+    for name, seconds in list(timings):
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in totals.items())
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request latency, in-flight gauge and the optional Server-Timing header.
+
+    Paths outside `endpoints` (static files, 404s) are grouped as 'other' to
+    keep label cardinality bounded.
+    """
+
+    def __init__(self, app, endpoints=(), server_timing: bool = False):
+        self.app = app
+        self.endpoints = frozenset(endpoints)
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        endpoint = scope['path'] if scope['path'] in self.endpoints else 'other'
+        timings = [] if self.server_timing else None
+        token = REQUEST_TIMINGS.set(timings)
+        status = [500]
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                if timings is not None:
+                    value = server_timing(timings + [('total', time.perf_counter() - start)])
+                    message = dict(message, headers=list(message.get('headers', [])) + [
+                        (b'server-timing', value.encode('latin-1'))])
+            await send(message)
+
+        IN_FLIGHT.inc(endpoint)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec(endpoint)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, scope['method'], str(status[0]))
+            REQUEST_TIMINGS.reset(token)
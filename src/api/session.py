@@ -0,0 +1,132 @@
+"""ONNX Runtime session configuration.
+
+Settings are resolved in three layers, later ones winning:
+
+1. defaults below (ONNX Runtime's own defaults),
+2. a JSON config file named by `PDP_ORT_CONFIG` (keys = `SessionConfig` fields),
+3. `PDP_ORT_*` environment variables (also set by `scripts/serve.py` flags).
+
+Example config file::
+
+    {"intra_op_threads": 4, "inter_op_threads": 1, "graph_optimization": "all",
+     "optimized_model_cache": true, "providers": ["CPUExecutionProvider"]}
+"""
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import List
+import json
+import os
+
+import onnxruntime as ort
+
+from src.api.settings import env_bool, env_int, env_str
+from src.model.ort_graph import GRAPH_OPT_LEVELS, optimized_model_path
+
+EXECUTION_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+@dataclass
+class SessionConfig:
+    # 0 = let ONNX Runtime decide; 'auto' divides the cores between uvicorn workers
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    execution_mode: str = 'sequential'
+    graph_optimization: str = 'all'
+    # save the optimized graph next to the model and load it on later starts
+    optimized_model_cache: bool = False
+    enable_mem_arena: bool = True
+    enable_mem_pattern: bool = True
+    # tried in order; unavailable providers are skipped
+    providers: List[str] = field(default_factory=lambda: ['CPUExecutionProvider'])
+
+
+def auto_intra_op_threads() -> int:
+    """Split the cores evenly between the uvicorn worker processes."""
+    workers = max(1, env_int('PDP_UVICORN_WORKERS', env_int('WEB_CONCURRENCY', 1)))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def load_session_config() -> SessionConfig:
+    cfg = SessionConfig()
+    config_file = env_str('PDP_ORT_CONFIG', '')
+    if config_file:
+        try:
+            with open(config_file, 'r') as f:
+                data = json.load(f)
+            known = {f.name for f in fields(SessionConfig)}
+            for key, value in data.items():
+                if key in known:
+                    setattr(cfg, key, value)
+                else:
+                    print(f'Ignoring unknown ONNX Runtime option in {config_file}: {key}')
+        except Exception as e:
+            print(f'Failed to read ONNX Runtime config {config_file}:', e)
+
+    intra = os.environ.get('PDP_ORT_INTRA_OP_THREADS')
+    if intra is not None:
+        cfg.intra_op_threads = intra if intra == 'auto' else env_int('PDP_ORT_INTRA_OP_THREADS', 0)
+    cfg.inter_op_threads = env_int('PDP_ORT_INTER_OP_THREADS', cfg.inter_op_threads)
+    cfg.execution_mode = env_str('PDP_ORT_EXECUTION_MODE', cfg.execution_mode)
+    cfg.graph_optimization = env_str('PDP_ORT_GRAPH_OPT', cfg.graph_optimization)
+    cfg.optimized_model_cache = env_bool('PDP_ORT_OPTIMIZED_CACHE', cfg.optimized_model_cache)
+    cfg.enable_mem_arena = env_bool('PDP_ORT_MEM_ARENA', cfg.enable_mem_arena)
+    cfg.enable_mem_pattern = env_bool('PDP_ORT_MEM_PATTERN', cfg.enable_mem_pattern)
+    providers = env_str('PDP_ORT_PROVIDERS', '')
+    if providers:
+        cfg.providers = [p.strip() for p in providers.split(',') if p.strip()]
+
+    if cfg.intra_op_threads == 'auto':
+        cfg.intra_op_threads = auto_intra_op_threads()
+    if cfg.execution_mode not in EXECUTION_MODES:
+        print(f'Unknown execution mode {cfg.execution_mode!r}, using sequential')
+        cfg.execution_mode = 'sequential'
+    if cfg.graph_optimization not in GRAPH_OPT_LEVELS:
+        print(f'Unknown graph optimization level {cfg.graph_optimization!r}, using all')
+        cfg.graph_optimization = 'all'
+    return cfg
+
+
+def resolve_providers(requested: List[str]) -> List[str]:
+    available = ort.get_available_providers()
+    chosen = [p for p in requested if p in available]
+    skipped = [p for p in requested if p not in available]
+    if skipped:
+        print('Skipping unavailable ONNX Runtime providers:', ', '.join(skipped))
+    if 'CPUExecutionProvider' not in chosen:
+        chosen.append('CPUExecutionProvider')
+    return chosen
+
+
+def build_session(model_path: Path, cfg: SessionConfig) -> ort.InferenceSession:
+    model_path = Path(model_path)
+    so = ort.SessionOptions()
+    if cfg.intra_op_threads:
+        so.intra_op_num_threads = int(cfg.intra_op_threads)
+    if cfg.inter_op_threads:
+        so.inter_op_num_threads = int(cfg.inter_op_threads)
+    so.execution_mode = EXECUTION_MODES[cfg.execution_mode]
+    so.enable_cpu_mem_arena = bool(cfg.enable_mem_arena)
+    so.enable_mem_pattern = bool(cfg.enable_mem_pattern)
+    so.graph_optimization_level = GRAPH_OPT_LEVELS[cfg.graph_optimization]
+
+    load_path = model_path
+    if cfg.optimized_model_cache and cfg.graph_optimization != 'disable':
+        cached = optimized_model_path(model_path, cfg.graph_optimization)
+        if cached.exists():
+            # already optimized offline; skip the optimizer at load time
+            load_path = cached
+            so.graph_optimization_level = GRAPH_OPT_LEVELS['disable']
+        else:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            so.optimized_model_filepath = str(cached)
+
+    providers = resolve_providers(cfg.providers)
+    session = ort.InferenceSession(str(load_path), sess_options=so, providers=providers)
+    effective = asdict(cfg)
+    effective['providers'] = session.get_providers()
+    effective['loaded_from'] = str(load_path)
+    print('ONNX Runtime session settings:', json.dumps(effective))
+    return session
@@ -0,0 +1,84 @@
+"""Runtime knobs for the inference API, read from environment variables.
+
+All variables use the `PDP_` prefix so they can be set in front of uvicorn:
+
+    PDP_MICROBATCH=1 PDP_BATCH_MAX_SIZE=16 uvicorn src.api.app:app
+"""
+import os
+
+
+def env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        print(f'Invalid integer for {name}, using default {default}')
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        print(f'Invalid number for {name}, using default {default}')
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# dynamic micro-batching of concurrent /predict requests
+MICROBATCH_ENABLED = env_bool('PDP_MICROBATCH', False)
+BATCH_MAX_SIZE = env_int('PDP_BATCH_MAX_SIZE', 8)
+BATCH_MAX_LATENCY_MS = env_float('PDP_BATCH_MAX_LATENCY_MS', 5.0)
+
+# where blocking work runs: 'pool' (bounded thread pools) or 'inline' (event loop)
+EXECUTION_MODE = env_str('PDP_EXECUTION_MODE', 'pool').strip().lower()
+DECODE_WORKERS = env_int('PDP_DECODE_WORKERS', min(4, os.cpu_count() or 1))
+DECODE_QUEUE = env_int('PDP_DECODE_QUEUE', 64)
+INFER_WORKERS = env_int('PDP_INFER_WORKERS', 2)
+INFER_QUEUE = env_int('PDP_INFER_QUEUE', 32)
+BATCH_MAX_QUEUE = env_int('PDP_BATCH_MAX_QUEUE', 256)
+# status returned when a queue is full (503 Service Unavailable or 429 Too Many Requests)
+OVERLOAD_STATUS = env_int('PDP_OVERLOAD_STATUS', 503)
+OVERLOAD_RETRY_AFTER_S = env_int('PDP_OVERLOAD_RETRY_AFTER', 1)
+
+# POST /predict/batch
+BATCH_CHUNK_SIZE = env_int('PDP_BATCH_CHUNK_SIZE', 16)
+BATCH_MAX_FILES = env_int('PDP_BATCH_MAX_FILES', 1000)
+
+# upload limits (0 disables a limit); zip members are held to MAX_UPLOAD_BYTES uncompressed
+MAX_UPLOAD_BYTES = env_int('PDP_MAX_UPLOAD_BYTES', 20 * 1024 * 1024)
+MAX_ARCHIVE_BYTES = env_int('PDP_MAX_ARCHIVE_BYTES', 200 * 1024 * 1024)
+MAX_IMAGE_PIXELS = env_int('PDP_MAX_IMAGE_PIXELS', 50_000_000)
+
+# content-hash prediction cache for /predict
+CACHE_ENABLED = env_bool('PDP_CACHE', True)
+CACHE_MAX_ENTRIES = env_int('PDP_CACHE_MAX_ENTRIES', 2048)
+CACHE_TTL_S = env_float('PDP_CACHE_TTL_S', 3600.0)
+# directory for on-disk persistence of cache entries ('' disables it)
+CACHE_DIR = env_str('PDP_CACHE_DIR', '')
+
+# add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = env_bool('PDP_SERVER_TIMING', False)
+
+# which exported artifact to serve: 'fp32' (models/model.onnx) or 'int8'
+# (models/model.int8.onnx from scripts/quantize_onnx.py); PDP_MODEL_PATH overrides both
+MODEL_VARIANT = env_str('PDP_MODEL_VARIANT', 'fp32').strip().lower()
+MODEL_PATH = env_str('PDP_MODEL_PATH', '')
+
+# where the exported artifacts (model.onnx, model.json, classes.json) and the
+# checkpoint live; default to models/ and checkpoints/best.pth in the project
+MODELS_DIR = env_str('PDP_MODELS_DIR', '')
+CHECKPOINT = env_str('PDP_CHECKPOINT', '')
+
+# what to do when models/model.onnx is missing or does not match the class list:
+# 'background' (serve the old artifact while rebuilding), 'blocking' or 'off'
+REBUILD_MODE = env_str('PDP_REBUILD_MODE', 'background').strip().lower()
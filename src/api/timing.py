@@ -0,0 +1,25 @@
+"""Small thread-safe latency accumulator used for the `/stats` endpoint."""
+import threading
+
+
+class RunningStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total_s += seconds
+            if seconds > self.max_s:
+                self.max_s = seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'count': self.count,
+                'mean_ms': 1000.0 * self.total_s / self.count if self.count else 0.0,
+                'max_ms': 1000.0 * self.max_s,
+            }
@@ -0,0 +1,86 @@
+"""Bounded worker pools that keep blocking work off the asyncio event loop.
+
+Image decode/preprocessing and `InferenceSession.run` both block (and both
+release the GIL for most of their runtime), so running them on the event loop
+stalls every other connection. `BoundedPool` runs them on a dedicated thread
+pool and applies backpressure: once `max_workers + max_queue` calls are in
+flight, new calls are rejected with `Overloaded` instead of piling up.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+
+
+class Overloaded(Exception):
+    """Raised when a pool's queue is full; mapped to a 503/429 response."""
+
+    def __init__(self, pool_name: str):
+        super().__init__(f'{pool_name} queue is full')
+        self.pool_name = pool_name
+
+
+class BoundedPool:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f'pdp-{name}')
+        # only touched from the event loop thread, so no lock is needed
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def limit(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def check_capacity(self):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            raise Overloaded(self.name)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` on the pool, raising `Overloaded` when saturated."""
+        self.check_capacity()
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # run in the caller's context so request-scoped stage timings reach the pool thread
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, functools.partial(ctx.run, fn, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def run_many(self, fn, args_list):
+        """Run `fn(args)` for every item of `args_list` in parallel.
+
+        Capacity is checked once for the whole group (so a large batch request
+        is admitted or rejected as a unit), but every item counts towards
+        `in_flight` while it runs so single requests still see the backpressure.
+        """
+        self.check_capacity()
+        n = len(args_list)
+        self.in_flight += n
+        try:
+            loop = asyncio.get_running_loop()
+            futures = [loop.run_in_executor(self.executor, contextvars.copy_context().run, fn, args)
+                       for args in args_list]
+            return await asyncio.gather(*futures, return_exceptions=True)
+        finally:
+            self.in_flight -= n
+            self.completed += n
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'in_flight': self.in_flight,
+            'queued': max(0, self.in_flight - self.max_workers),
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
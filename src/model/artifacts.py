@@ -0,0 +1,273 @@
+"""In-process checkpoint -> ONNX artifact pipeline.
+
+Replaces shelling out to `scripts/rebuild_and_export.py` at API startup. The
+checkpoint is loaded exactly once, the architecture is inferred from its
+weights, the model is exported, and the result is cached under
+`models/.artifacts/` keyed by the checkpoint content hash (plus class list,
+architecture, input size, strictness and optimization), so repeating a build
+for an unchanged checkpoint is just a file copy. By default the exported
+graph is optimized first (constant folding on top of the BatchNorm folding
+the exporter already does; see `src/model/optimize.py`).
+
+Every export also writes a sidecar manifest (`models/model.json` next to
+`models/model.onnx`) with the class list, architecture, input size,
+normalization and the checkpoint it came from, so the API can serve without
+importing torch at all. torch is only imported on the (rare) build path.
+"""
+from pathlib import Path
+from typing import List, Optional
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+MANIFEST_VERSION = 1
+
+
+def file_signature(path: Path):
+    """Return a cheap (mtime_ns, size) signature for `path` or None if missing."""
+    try:
+        st = Path(path).stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def file_digest(path: Path, chunk_size: int = 1 << 20) -> Optional[str]:
+    """Return the sha256 hex digest of `path` or None if it cannot be read."""
+    try:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        return h.hexdigest()
+    except OSError:
+        return None
+
+
+def read_classes_json(path: Path):
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def atomic_copy(src: Path, dst: Path):
+    """Copy `src` over `dst` so readers never observe a half-written file."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f'.{dst.name}.', dir=str(dst.parent))
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def manifest_path_for(onnx_path: Path) -> Path:
+    """`models/model.onnx` -> `models/model.json`."""
+    return Path(onnx_path).with_suffix('.json')
+
+
+def load_manifest(path: Path) -> Optional[dict]:
+    """Read a sidecar manifest, returning None if it is missing or unreadable."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f'Failed to read model manifest {path}:', e)
+        return None
+
+
+def write_manifest(path: Path, manifest: dict):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def manifest_is_stale(manifest: Optional[dict], checkpoint_path: Path) -> bool:
+    """True when the manifest was built from a different checkpoint than the one on disk.
+
+    The recorded (mtime, size) signature is compared first; the checkpoint is
+    only hashed when that signature changed.
+    """
+    if manifest is None or not Path(checkpoint_path).exists():
+        return False
+    recorded = manifest.get('checkpoint_signature')
+    if recorded is not None and tuple(recorded) == file_signature(checkpoint_path):
+        return False
+    digest = manifest.get('checkpoint_sha256')
+    return digest is not None and digest != file_digest(checkpoint_path)
+
+
+def artifact_key(ckpt_digest: str, classes: List[str], model_name: str, img_size: int, strict: bool,
+                 optimize: bool = False) -> str:
+    classes_digest = hashlib.sha256(json.dumps(classes).encode()).hexdigest()[:12]
+    mode = 'strict' if strict else 'loose'
+    opt = '-opt' if optimize else ''
+    return f'{ckpt_digest[:16]}-{classes_digest}-{model_name}-{img_size}-{mode}{opt}'
+
+
+def export_model(model, output_path: Path, img_size: int = 224, opset: int = 12):
+    import torch
+
+    model.eval()
+    dummy = torch.randn(1, 3, img_size, img_size)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.onnx.export(
+        model,
+        dummy,
+        str(output_path),
+        opset_version=opset,
+        input_names=['input'],
+        output_names=['output'],
+        dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'}, 'output': {0: 'batch'}},
+    )
+
+
+def build_onnx_artifact(
+    checkpoint_path: Path,
+    output_path: Path,
+    model_name: Optional[str] = None,
+    classes_json: Optional[Path] = None,
+    img_size: int = 224,
+    opset: int = 12,
+    strict: bool = False,
+    cache_dir: Optional[Path] = None,
+    optimize: bool = True,
+    benchmark: bool = True,
+) -> dict:
+    """Export `checkpoint_path` to `output_path` (cached by checkpoint hash).
+
+    Classes come from `classes_json` when it exists (the rebuild use case:
+    the checkpoint's own `classes` metadata was wrong), otherwise from the
+    checkpoint. With `strict=False` classifier shape mismatches are tolerated
+    and the final layer is left freshly initialized. With `optimize` the
+    graph is constant folded and checked against the PyTorch
+    model (`src/model/optimize.py`), and the fully optimized ONNX Runtime
+    graph is pre-built for the API. `benchmark=False` leaves the before/after
+    latency out of the optimization report.
+
+    Returns a dict describing the artifact (`model`, `classes`, `cached`, ...).
+    """
+    checkpoint_path = Path(checkpoint_path)
+    output_path = Path(output_path)
+    if not checkpoint_path.exists():
+        raise FileNotFoundError(checkpoint_path)
+    cache_dir = Path(cache_dir) if cache_dir else output_path.parent / '.artifacts'
+    ckpt_digest = file_digest(checkpoint_path)
+
+    classes = read_classes_json(classes_json) if classes_json else None
+    ckpt = None
+    if classes is None or model_name is None:
+        import torch
+
+        ckpt = torch.load(str(checkpoint_path), map_location='cpu')
+        if classes is None:
+            classes = ckpt.get('classes', None)
+    if classes is None:
+        raise RuntimeError('Could not find class list in classes.json or checkpoint')
+
+    if model_name is None:
+        from src.model.models import infer_architecture
+
+        model_name = infer_architecture(ckpt.get('model_state', ckpt))
+
+    if optimize:
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            print('onnxruntime not installed; exporting without graph optimization')
+            optimize = False
+
+    key = artifact_key(ckpt_digest, classes, model_name, img_size, strict, optimize)
+    cached = cache_dir / f'{key}.onnx'
+    report_path = cache_dir / f'{key}.optimization.json'
+    info = {
+        'model': model_name,
+        'classes': list(classes),
+        'checkpoint': str(checkpoint_path),
+        'checkpoint_sha256': ckpt_digest,
+        'img_size': img_size,
+        'key': key,
+        'cached': cached.exists(),
+    }
+    if not cached.exists():
+        import torch
+        from src.model.models import build_model
+
+        if ckpt is None:
+            ckpt = torch.load(str(checkpoint_path), map_location='cpu')
+        print(f'Building {model_name} with num_classes={len(classes)}')
+        model = build_model(model_name, len(classes))
+        state = ckpt.get('model_state', ckpt)
+        if not strict:
+            # load_state_dict raises on shape mismatches even with strict=False
+            own = model.state_dict()
+            skipped = [k for k, v in state.items() if k in own and own[k].shape != v.shape]
+            if skipped:
+                print('Reinitializing mismatched layers:', ', '.join(skipped))
+            state = {k: v for k, v in state.items() if k not in skipped}
+        model.load_state_dict(state, strict=strict)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cache_dir / f'.{key}.tmp.onnx'
+        if optimize:
+            from src.model.optimize import optimize_export
+
+            report = optimize_export(model, tmp, img_size=img_size, opset=opset, benchmark=benchmark)
+            write_manifest(report_path, report)
+        else:
+            export_model(model, tmp, img_size=img_size, opset=opset)
+        os.replace(tmp, cached)
+    else:
+        print('Using cached ONNX artifact', cached)
+
+    atomic_copy(cached, output_path)
+    print('Exported ONNX model to', output_path)
+    optimization = None
+    if optimize:
+        optimization = load_manifest(report_path)
+        try:
+            from src.model.optimize import preoptimize_for_ort
+
+            print('Pre-optimized ONNX Runtime graph saved to', preoptimize_for_ort(output_path))
+        except Exception as e:
+            print('Could not pre-optimize the graph for ONNX Runtime:', e)
+    # also save classes.json next to the ONNX so the API/frontend can read labels
+    classes_path = output_path.parent / 'classes.json'
+    with open(classes_path, 'w') as f:
+        json.dump(list(classes), f)
+    print('Wrote classes to', classes_path)
+
+    from src.model.utils import IMAGENET_MEAN, IMAGENET_STD
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'model': model_name,
+        'classes': list(classes),
+        'input_size': [img_size, img_size],
+        'mean': list(IMAGENET_MEAN),
+        'std': list(IMAGENET_STD),
+        'opset': opset,
+        'checkpoint': str(checkpoint_path),
+        'checkpoint_sha256': ckpt_digest,
+        'checkpoint_signature': list(file_signature(checkpoint_path)),
+        'onnx_sha256': file_digest(output_path),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    if optimization is not None:
+        manifest['optimization'] = optimization
+    manifest_path = manifest_path_for(output_path)
+    write_manifest(manifest_path, manifest)
+    print('Wrote model manifest to', manifest_path)
+    info['manifest'] = str(manifest_path)
+    return info
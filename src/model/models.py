@@ -2,9 +2,9 @@
 
 This module provides a small ResNet-10 implemented from scratch plus
 convenience factory wrappers for ResNet-50 and EfficientNet-B0 so you can
-demonstrate custom model code without changing the existing training
-script. The training script in `src/train/train.py` is unchanged and will
-continue to use its own model builders.
+demonstrate custom model code. The training script in `src/train/train.py`
+keeps its own torchvision builders and uses `resnet10` from here for
+`--model resnet10`.
 """
 from typing import Type, Callable, List
 
@@ -133,4 +133,48 @@ def efficientnet_b0(num_classes: int = 1000, pretrained: bool = False) -> nn.Mod
     return model
 
 
-__all__ = ['resnet10', 'resnet50', 'efficientnet_b0']
+def resnet18(num_classes: int = 1000, pretrained: bool = False) -> nn.Module:
+    """Wrapper that returns torchvision's ResNet-18 with modified final layer."""
+    model = tv_models.resnet18(pretrained=pretrained)
+    in_features = model.fc.in_features
+    model.fc = nn.Linear(in_features, num_classes)
+    return model
+
+
+MODEL_BUILDERS = {
+    'resnet10': lambda num_classes, pretrained=False: resnet10(num_classes),
+    'resnet18': resnet18,
+    'resnet50': resnet50,
+    'efficientnet_b0': efficientnet_b0,
+}
+
+
+def build_model(name: str, num_classes: int, pretrained: bool = False) -> nn.Module:
+    """Build any supported architecture by name with `num_classes` outputs."""
+    if name not in MODEL_BUILDERS:
+        raise ValueError('unsupported model: ' + name)
+    return MODEL_BUILDERS[name](num_classes, pretrained=pretrained)
+
+
+def infer_architecture(state: dict) -> str:
+    """Guess the architecture name from a checkpoint `state_dict` (best-effort).
+
+    ResNet-10 and ResNet-18 share the 512-wide classifier, so the number of
+    blocks in `layer1` tells them apart.
+    """
+    for key, value in state.items():
+        if key.endswith('fc.weight'):
+            in_feat = value.shape[1]
+            if in_feat == 2048:
+                return 'resnet50'
+            if in_feat == 512:
+                return 'resnet18' if any(k.startswith('layer1.1.') for k in state) else 'resnet10'
+        if 'classifier' in key and getattr(value, 'ndim', 0) == 2:
+            # efficientnet_b0 has 1280 in_features typically
+            if value.shape[1] in (1280, 1536):
+                return 'efficientnet_b0'
+    # fallback
+    return 'resnet18'
+
+
+__all__ = ['resnet10', 'resnet18', 'resnet50', 'efficientnet_b0', 'build_model', 'infer_architecture']
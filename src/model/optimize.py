@@ -0,0 +1,162 @@
+"""Export-time graph optimization.
+
+Applied by `build_onnx_artifact` before an artifact is cached:
+
+1. BatchNorm folding needs no pass of its own: `torch.onnx.export` of an
+   eval-mode model already folds every BatchNorm2d into the Conv2d that feeds
+   it (constant folding in the exporter), so the plain export has no
+   BatchNormalization nodes left. `batchnorm_ops` in the report counts any
+   that survive (e.g. a BN that does not follow a convolution).
+2. `fold_constants`: onnxsim (`pip install onnxsim`) when installed, otherwise
+   ONNX Runtime's hardware-independent "basic" level (constant folding,
+   redundant node elimination), saved back as a portable ONNX file.
+   ReLU/SiLU stay separate ops; ONNX Runtime fuses the activation into the
+   convolution itself (Conv+Relu / FusedConv) when the session is created.
+3. `preoptimize_for_ort`: runs the full ONNX Runtime optimizer once and stores
+   the result in the optimized-graph cache (`models/.ort_cache/`, layout in
+   `src/model/ort_graph.py`), so the API can skip graph optimization at
+   startup when `PDP_ORT_OPTIMIZED_CACHE=1`.
+
+`check_equivalence` compares the optimized graph with the original PyTorch
+model, and `op_counts`/`ort_latency_ms` feed the report stored in the model
+manifest. "Before" in that report is the plain eval-mode export, so the op
+and latency deltas are those of step 2 only.
+"""
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional
+import os
+import statistics
+import time
+
+import numpy as np
+
+
+def op_counts(onnx_path: Path) -> Optional[Dict[str, int]]:
+    """Node count per op type (None if the `onnx` package is unavailable)."""
+    try:
+        import onnx
+    except ImportError:
+        return None
+    model = onnx.load(str(onnx_path), load_external_data=False)
+    return dict(Counter(n.op_type for n in model.graph.node))
+
+
+def _ort_optimize(src: Path, dst: Path, level: str):
+    import onnxruntime as ort
+
+    from src.model.ort_graph import GRAPH_OPT_LEVELS
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = GRAPH_OPT_LEVELS[level]
+    so.optimized_model_filepath = str(dst)
+    ort.InferenceSession(str(src), sess_options=so, providers=['CPUExecutionProvider'])
+
+
+def fold_constants(src: Path, dst: Path) -> str:
+    """Constant-fold/simplify `src` into `dst`; returns the tool that was used."""
+    try:
+        import onnx
+        from onnxsim import simplify
+
+        model, ok = simplify(onnx.load(str(src)))
+        if ok:
+            onnx.save(model, str(dst))
+            return 'onnxsim'
+        print('onnxsim could not validate the simplified model; falling back to ONNX Runtime')
+    except ImportError:
+        pass
+    _ort_optimize(src, dst, 'basic')
+    return 'onnxruntime-basic'
+
+
+def preoptimize_for_ort(model_path: Path, level: str = 'all') -> Path:
+    """Write the fully optimized graph into the session's optimized-model cache."""
+    from src.model.ort_graph import optimized_model_path
+
+    cached = optimized_model_path(Path(model_path), level)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_name(f'.{cached.name}.tmp')
+    _ort_optimize(model_path, tmp, level)
+    os.replace(tmp, cached)
+    return cached
+
+
+def _session(path: Path, level: str = 'all'):
+    import onnxruntime as ort
+
+    from src.model.ort_graph import GRAPH_OPT_LEVELS
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = GRAPH_OPT_LEVELS[level]
+    return ort.InferenceSession(str(path), sess_options=so, providers=['CPUExecutionProvider'])
+
+
+def check_equivalence(model, onnx_path: Path, img_size: int, batch: int = 2, seed: int = 0) -> float:
+    """Max absolute difference between the PyTorch `model` and the ONNX graph on random inputs."""
+    import torch
+
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((batch, 3, img_size, img_size)).astype(np.float32)
+    with torch.no_grad():
+        expected = model.eval()(torch.from_numpy(x)).numpy()
+    sess = _session(onnx_path, 'disable')
+    actual = sess.run(None, {sess.get_inputs()[0].name: x})[0]
+    return float(np.abs(expected - actual).max())
+
+
+def ort_latency_ms(onnx_path: Path, img_size: int, batch: int = 1, runs: int = 20, warmup: int = 3) -> float:
+    """Median ONNX Runtime latency (default optimization level) for one batch."""
+    sess = _session(onnx_path)
+    name = sess.get_inputs()[0].name
+    x = np.random.default_rng(0).standard_normal((batch, 3, img_size, img_size)).astype(np.float32)
+    for _ in range(warmup):
+        sess.run(None, {name: x})
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        sess.run(None, {name: x})
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def optimize_export(model, output_path: Path, img_size: int = 224, opset: int = 12, atol: float = 1e-3,
+                    benchmark: bool = True) -> dict:
+    """Export `model` to `output_path` and constant-fold the graph.
+
+    Raises if the optimized graph drifts from the original model by more than
+    `atol`. Returns a report with op counts and latency of the plain export
+    (BatchNorm already folded by the exporter) and of the optimized graph.
+    `benchmark=False` skips the latency runs (reported as None), e.g. when
+    the export runs inside the serving process next to live inference.
+    """
+    from src.model.artifacts import export_model
+
+    output_path = Path(output_path)
+    base_path = output_path.with_name(output_path.stem + '.base.onnx')
+    try:
+        export_model(model, base_path, img_size=img_size, opset=opset)
+        tool = fold_constants(base_path, output_path)
+        max_diff = check_equivalence(model, output_path, img_size)
+        if max_diff > atol:
+            raise RuntimeError(f'optimized ONNX graph differs from the PyTorch model by {max_diff:.2e} (> {atol:.0e})')
+        ops_before, ops_after = op_counts(base_path), op_counts(output_path)
+        latency_before = ort_latency_ms(base_path, img_size) if benchmark else None
+        latency_after = ort_latency_ms(output_path, img_size) if benchmark else None
+    finally:
+        base_path.unlink(missing_ok=True)
+
+    report = {
+        'batchnorm_ops': ops_before.get('BatchNormalization', 0) if ops_before else None,
+        'constant_folding': tool,
+        'max_abs_diff': max_diff,
+        'ops_before': sum(ops_before.values()) if ops_before else None,
+        'ops_after': sum(ops_after.values()) if ops_after else None,
+        'op_types_after': ops_after,
+        'latency_ms_before': latency_before,
+        'latency_ms_after': latency_after,
+    }
+    ops = f"{report['ops_before']} -> {report['ops_after']} ops, " if ops_before else ''
+    latency = f'batch-1 latency {latency_before:.2f} -> {latency_after:.2f} ms, ' if benchmark else ''
+    print(f'Optimized export ({tool}): {ops}{latency}max |diff| {max_diff:.2e}')
+    return report
@@ -0,0 +1,24 @@
+"""ONNX Runtime graph-optimization levels and the optimized-graph cache layout.
+
+Shared by the export-time optimizer (`src/model/optimize.py`) and the API's
+session builder (`src/api/session.py`), so both agree on where a
+pre-optimized graph lives.
+"""
+from pathlib import Path
+
+import onnxruntime as ort
+
+GRAPH_OPT_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def optimized_model_path(model_path: Path, graph_optimization: str) -> Path:
+    """Cache file for the optimized graph, keyed by the source model's signature."""
+    model_path = Path(model_path)
+    st = model_path.stat()
+    tag = f'{st.st_mtime_ns:x}-{st.st_size:x}-{graph_optimization}'
+    return model_path.parent / '.ort_cache' / f'{model_path.stem}.{tag}.onnx'
@@ -1,16 +1,125 @@
-from PIL import Image
+from functools import lru_cache
+import io
+import threading
+
+from PIL import Image, UnidentifiedImageError
 import numpy as np
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def is_image_file(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an upload exceeds the configured byte or pixel limits."""
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload is not a decodable image."""
+
+
+def decode_image(data: bytes, target_size=(224, 224), max_bytes: int = 0, max_pixels: int = 0) -> Image.Image:
+    """Decode image bytes at the lowest resolution that still covers `target_size`.
+
+    For JPEGs, `Image.draft` lets libjpeg apply DCT scaling (1/2, 1/4, 1/8)
+    while decoding, so a 12 MP phone photo destined for 224x224 is decoded at
+    roughly 1/8 of its size instead of fully decoded and then thrown away.
+    Other formats are decoded normally. The header is inspected before any
+    pixel data is decoded, so oversized images are rejected cheaply.
+
+    Raises `ImageTooLarge` for oversized uploads (including PIL's own
+    decompression-bomb guard) and `InvalidImage` for data PIL cannot decode.
+    """
+    if max_bytes and len(data) > max_bytes:
+        raise ImageTooLarge(f'upload is {len(data)} bytes (limit {max_bytes})')
+    try:
+        img = Image.open(io.BytesIO(data))
+        w, h = img.size
+        if max_pixels and w * h > max_pixels:
+            raise ImageTooLarge(f'image is {w}x{h} pixels (limit {max_pixels})')
+        if img.format == 'JPEG':
+            # picks the largest scale reduction whose result is still >= target_size
+            img.draft('RGB', tuple(target_size))
+        img.load()
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        # truncated/corrupt data surfaces as OSError (or SyntaxError from some plugins)
+        raise InvalidImage(f'cannot decode image: {e}') from e
+    return img
+
+
+class PreprocessEngine:
+    """Resize + normalize images straight into a reusable NCHW float32 buffer.
+
+    `(x / 255 - mean) / std` is folded into a single per-channel
+    `x * scale + offset`, computed once. `prepare` turns a PIL image into a
+    resized RGB uint8 HWC array; `batch` writes N prepared arrays into a
+    thread-local batch buffer (grown on demand, never shrunk) and returns a
+    view of the first N rows. The returned view is overwritten by the next
+    `batch` call on the same thread, so consume it (e.g. `session.run`)
+    before preprocessing the next batch.
+    """
+
+    def __init__(self, size=(224, 224), mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        self.size = (int(size[0]), int(size[1]))
+        mean = np.asarray(mean, dtype=np.float32)
+        std = np.asarray(std, dtype=np.float32)
+        self.scale = (1.0 / (255.0 * std)).astype(np.float32).reshape(3, 1, 1)
+        self.offset = (-mean / std).astype(np.float32).reshape(3, 1, 1)
+        self._local = threading.local()
+
+    def prepare(self, img: Image.Image) -> np.ndarray:
+        """Return the image as a resized RGB uint8 array (H, W, 3)."""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.size != self.size:
+            img = img.resize(self.size)
+        return np.asarray(img)
+
+    def buffer(self, n: int) -> np.ndarray:
+        buf = getattr(self._local, 'buf', None)
+        if buf is None or buf.shape[0] < n:
+            cap = max(n, 2 * buf.shape[0] if buf is not None else n)
+            w, h = self.size
+            buf = np.empty((cap, 3, h, w), dtype=np.float32)
+            self._local.buf = buf
+        return buf[:n]
+
+    def fill(self, out: np.ndarray, arr: np.ndarray):
+        """Write one prepared HWC uint8 array into the CHW float32 slot `out`."""
+        # HWC -> CHW is a strided view; the multiply writes the transposed result directly
+        np.multiply(arr.transpose(2, 0, 1), self.scale, out=out, casting='unsafe')
+        np.add(out, self.offset, out=out)
+
+    def batch(self, arrays) -> np.ndarray:
+        """Fill an (N, 3, H, W) float32 input tensor from N prepared arrays."""
+        out = self.buffer(len(arrays))
+        for i, arr in enumerate(arrays):
+            self.fill(out[i], arr)
+        return out
+
+    def batch_images(self, images) -> np.ndarray:
+        """Prepare and fill a batch from PIL images in one pass."""
+        out = self.buffer(len(images))
+        for i, img in enumerate(images):
+            self.fill(out[i], self.prepare(img))
+        return out
+
+
+@lru_cache(maxsize=8)
+def get_engine(size=(224, 224)) -> PreprocessEngine:
+    return PreprocessEngine(size)
+
 
 def preprocess_image_pil(img: Image.Image, size=(224,224)) -> np.ndarray:
     """Resize and normalize PIL image to numpy array (CHW, float32)"""
-    img = img.convert('RGB')
-    img = img.resize(size)
-    arr = np.array(img).astype('float32') / 255.0
-    # normalize with ImageNet stats by default
-    mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
-    std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
-    arr = (arr - mean) / std
-    # HWC -> CHW
-    arr = np.transpose(arr, (2,0,1))
-    return arr
+    engine = get_engine(tuple(size))
+    out = np.empty((3, engine.size[1], engine.size[0]), dtype=np.float32)
+    engine.fill(out, engine.prepare(img))
+    return out
@@ -0,0 +1,123 @@
+"""Batched augmentation on uint8 image tensors.
+
+The default `train_tf` runs RandomResizedCrop/flip/ToTensor/Normalize once
+per PIL image inside the DataLoader workers and ships float32 tensors (4x the
+bytes of uint8) back through IPC. With `--batch-augment` the workers only
+produce fixed-size uint8 tensors; after collation, `BatchAugment` applies a
+random resized crop and horizontal flip to the whole batch with a single
+`affine_grid` + `grid_sample` call and folds the normalization into one
+scale/offset at the end.
+
+To fit one batch tensor the workers resize every image to a fixed square,
+which stretches non-square images. Stretching is a per-axis scale, so a crop
+box given as fractions of the width and height selects the same content
+either way; what the stretch loses is the source aspect ratio, which
+RandomResizedCrop needs to turn its (area, ratio) sample into a box. The
+train transform is therefore wrapped in `WithAspect`, the loader yields
+`((images, aspects), labels)`, and `BatchAugment.train` samples each crop box
+in source pixel terms, exactly like RandomResizedCrop. When a sampled box
+does not fit, RandomResizedCrop retries up to 10 times before falling back to
+the whole image (clamped to the ratio range); here the fallback is taken
+right away, so crops near the size limits are slightly more frequent.
+
+Note: `grid_sample` does bilinear interpolation without antialiasing, so very
+small crops upscale exactly like RandomResizedCrop but large downscales are a
+little sharper than PIL's antialiased resize.
+"""
+import math
+
+import torch
+import torch.nn.functional as F
+
+from src.model.utils import IMAGENET_MEAN, IMAGENET_STD
+
+
+class WithAspect:
+    """Wrap a worker-side transform so it returns `(output, source width / height)`."""
+
+    def __init__(self, transform):
+        self.transform = transform
+
+    def __call__(self, img):
+        if isinstance(img, torch.Tensor):
+            h, w = img.shape[-2:]
+        else:
+            w, h = img.size
+        return self.transform(img), torch.tensor(w / h, dtype=torch.float32)
+
+
+def split_aspect(batch):
+    """`(images, aspects)` from a `WithAspect` batch, `(images, None)` for a plain tensor batch."""
+    if isinstance(batch, (list, tuple)):
+        return batch[0], batch[1]
+    return batch, None
+
+
+class BatchAugment:
+    def __init__(self, img_size: int, scale=(0.08, 1.0), ratio=(3.0 / 4.0, 4.0 / 3.0), hflip_p: float = 0.5,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD, device='cpu'):
+        self.img_size = int(img_size)
+        self.scale = scale
+        self.log_ratio = (math.log(ratio[0]), math.log(ratio[1]))
+        self.hflip_p = hflip_p
+        std_t = torch.tensor(std, dtype=torch.float32)
+        # (x / 255 - mean) / std == x * norm_scale + norm_offset
+        self.norm_scale = (1.0 / (255.0 * std_t)).view(1, 3, 1, 1)
+        self.norm_offset = (-torch.tensor(mean, dtype=torch.float32) / std_t).view(1, 3, 1, 1)
+        self.to(device)
+
+    def to(self, device):
+        self.norm_scale = self.norm_scale.to(device)
+        self.norm_offset = self.norm_offset.to(device)
+        return self
+
+    def normalize(self, x: torch.Tensor) -> torch.Tensor:
+        """uint8 (B, 3, H, W) -> normalized float32, in one fused pass."""
+        x = x.float() if x.dtype == torch.uint8 else x
+        return torch.addcmul(self.norm_offset, x, self.norm_scale)
+
+    def crop_params(self, batch: int, device, source_aspect=None) -> torch.Tensor:
+        """Sample per-image affine matrices (B, 2, 3) for crop + flip.
+
+        `source_aspect` is the (B,) width / height of the images before they
+        were resized to a square (None = they were square).
+        """
+        area = torch.empty(batch, device=device).uniform_(*self.scale)
+        log_r = torch.empty(batch, device=device).uniform_(*self.log_ratio)
+        aspect = torch.exp(log_r)
+        src = torch.ones(batch, device=device) if source_aspect is None else source_aspect.to(device).float()
+        # crop width/height as fractions of the source image: a box of `area * W * H`
+        # pixels with width / height == aspect, as RandomResizedCrop samples it
+        w = torch.sqrt(area * aspect / src)
+        h = torch.sqrt(area * src / aspect)
+        # boxes that do not fit fall back to the whole image, clamped to the ratio range
+        clamped = src.clamp(math.exp(self.log_ratio[0]), math.exp(self.log_ratio[1]))
+        misfit = (w > 1) | (h > 1)
+        w = torch.where(misfit, (clamped / src).clamp(max=1.0), w)
+        h = torch.where(misfit, (src / clamped).clamp(max=1.0), h)
+        # crop centers in [-1, 1] normalized coordinates, keeping the crop inside the image
+        cx = (torch.rand(batch, device=device) * 2 - 1) * (1 - w)
+        cy = (torch.rand(batch, device=device) * 2 - 1) * (1 - h)
+        flip = 1.0 - 2.0 * (torch.rand(batch, device=device) < self.hflip_p).float()
+        theta = torch.zeros(batch, 2, 3, device=device)
+        theta[:, 0, 0] = w * flip
+        theta[:, 0, 2] = cx
+        theta[:, 1, 1] = h
+        theta[:, 1, 2] = cy
+        return theta
+
+    def train(self, x: torch.Tensor, source_aspect=None) -> torch.Tensor:
+        """Random resized crop + horizontal flip + normalize for a uint8 batch.
+
+        Pass the aspects from `split_aspect` when the workers squashed
+        non-square images (see the module docstring).
+        """
+        b = x.shape[0]
+        theta = self.crop_params(b, x.device, source_aspect)
+        grid = F.affine_grid(theta, (b, 3, self.img_size, self.img_size), align_corners=False)
+        out = F.grid_sample(x.float(), grid, mode='bilinear', padding_mode='border', align_corners=False)
+        return self.normalize(out)
+
+    def eval(self, x: torch.Tensor) -> torch.Tensor:
+        """Validation batches are already resized/cropped by the workers; only normalize."""
+        return self.normalize(x)
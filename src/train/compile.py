@@ -0,0 +1,104 @@
+"""Graph-compiled training/eval forward passes with an eager fallback.
+
+`--compile` wraps the model with `torch.compile` (torch >= 2.0) or
+`torch.jit.script` (`--compile-backend torchscript`, or automatically when
+`torch.compile` is unavailable). Both share parameters with the original
+module, so the optimizer and checkpoints keep using the plain eager model and
+its `state_dict()` has no `_orig_mod.` prefixes.
+
+`torch.compile` compiles lazily on the first call (and again the first time
+the model switches to eval mode), so `CompiledModel` times the first call in
+each mode; the training loop reports steady-state step times separately. Any
+failure while compiling or running the compiled graph permanently falls back
+to eager mode. Failures are not limited to the first forward: the backward
+graph is compiled on the first `backward()`, and a new input shape (the last
+partial batch) recompiles later on. The training loop therefore runs every
+step (forward, loss and backward) through `CompiledModel.run_step`, which
+redoes a failed step eagerly; calling the model directly only guards the
+forward pass (enough for evaluation under `no_grad`).
+"""
+import time
+
+import torch
+import torch.nn as nn
+
+BACKENDS = ('auto', 'inductor', 'torchscript')
+
+
+def compile_model(model: nn.Module, backend: str = 'auto'):
+    """Return (compiled_callable, backend_name) or (None, reason) if compilation is unavailable."""
+    if backend == 'auto':
+        backend = 'inductor' if hasattr(torch, 'compile') else 'torchscript'
+    try:
+        if backend == 'torchscript':
+            return torch.jit.script(model), 'torchscript'
+        if not hasattr(torch, 'compile'):
+            return None, 'torch.compile requires torch >= 2.0'
+        return torch.compile(model, backend=backend), backend
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+class CompiledModel:
+    """Callable that runs the compiled graph, falling back to `model` on failure."""
+
+    def __init__(self, model: nn.Module, backend: str = 'auto'):
+        self.model = model
+        start = time.perf_counter()
+        self.compiled, self.backend = compile_model(model, backend)
+        self.setup_s = time.perf_counter() - start
+        if self.compiled is None:
+            print(f'Compilation unavailable ({self.backend}); training in eager mode')
+        else:
+            print(f'Compiling model with {self.backend} (setup {self.setup_s:.2f}s)')
+        # first call per train/eval mode includes tracing + codegen
+        self.first_call_s = {}
+
+    def train(self, mode: bool = True):
+        self.model.train(mode)
+        if self.compiled is not None and self.compiled is not self.model:
+            self.compiled.train(mode)
+        return self
+
+    def eval(self):
+        return self.train(False)
+
+    def _fall_back(self, what: str, e: Exception):
+        print(f'Compiled {what} failed ({type(e).__name__}: {e}); falling back to eager mode')
+        self.compiled = None
+
+    def run_step(self, step_fn, *args):
+        """Run `step_fn(forward, *args)` (forward, loss and backward) and return its result.
+
+        `forward` is this wrapper while the compiled graph works, else the
+        eager model. If anything in the step fails while compiled (including
+        compiling or running the backward graph), the step is run again in
+        eager mode, so `step_fn` must be safe to repeat: zero the gradients
+        before the forward pass, and step the optimizer after `run_step` returns.
+        """
+        if self.compiled is None:
+            return step_fn(self.model, *args)
+        try:
+            return step_fn(self, *args)
+        except Exception as e:
+            if self.compiled is None:
+                # the forward already fell back and the eager step itself failed
+                raise
+            self._fall_back('train step', e)
+            return step_fn(self.model, *args)
+
+    def __call__(self, x):
+        if self.compiled is None:
+            return self.model(x)
+        phase = 'train' if self.model.training else 'eval'
+        start = time.perf_counter()
+        try:
+            out = self.compiled(x)
+        except Exception as e:
+            self._fall_back(f'{phase} forward', e)
+            return self.model(x)
+        elapsed = time.perf_counter() - start
+        if phase not in self.first_call_s:
+            self.first_call_s[phase] = elapsed
+            print(f'Compiled {phase} graph in {self.setup_s + elapsed:.2f}s')
+        return out
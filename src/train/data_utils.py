@@ -9,9 +9,10 @@ It provides `prepare_dataloaders` which returns train/val/test loaders
 and the class names mapping.
 """
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 import os
 import random
+import time
 
 from PIL import Image
 import numpy as np
@@ -21,9 +22,15 @@ from torchvision.datasets import ImageFolder
 from torchvision import transforms
 from sklearn.model_selection import train_test_split
 
-
-def is_image_file(name: str) -> bool:
-    return any(name.lower().endswith(ext) for ext in ('.jpg', '.jpeg', '.png', '.bmp'))
+from src.train.augment import WithAspect
+from src.train.scan import find_class_root
+from src.train.shards import ShardedImageDataset, has_shards
+from src.train.loader_config import LoaderConfig, autotune_workers, make_loader
+from src.train.distributed import barrier, eval_sampler, is_distributed, is_main_process, train_sampler
+from src.train.dataset_index import (
+    DEFAULT_INDEX_DIR, IndexedImageFolder, assignment_from, index_path_for, is_dataset_image, read_index,
+    scan_dataset, split_indices, split_key, write_index,
+)
 
 
 def try_download_kaggle(dataset_id: str, dest: str) -> Path:
@@ -44,6 +51,33 @@ def try_download_kaggle(dataset_id: str, dest: str) -> Path:
         return dest_path
 
 
+def find_image_root(root: Path, max_depth: int = 3) -> Path:
+    """Heuristically find the directory that contains class subfolders.
+
+    Strategy (see `src.train.scan.best_class_node`, one `os.scandir` pass):
+    - If `root` has at least two immediate subdirectories which themselves
+      contain images, prefer that.
+    - Otherwise, pick the directory up to `max_depth` deep with the most
+      candidate class subfolders (each subfolder must contain at least one image).
+    - If that directory is a train/val/test split, return the directory
+      holding the splits so all of them are used.
+    """
+    return find_class_root(root, max_depth).root
+
+
+def list_image_folder(root: Path):
+    """Return `(classes, samples)` for an ImageFolder-style tree without building a dataset."""
+    root = Path(root)
+    classes = sorted(p.name for p in root.iterdir() if p.is_dir())
+    samples = []
+    for label, name in enumerate(classes):
+        for dirpath, _, filenames in sorted(os.walk(root / name)):
+            for fn in sorted(filenames):
+                if is_dataset_image(fn):
+                    samples.append((os.path.join(dirpath, fn), label))
+    return classes, samples
+
+
 class SubsetWithTransform(Dataset):
     def __init__(self, base: ImageFolder, indices, transform=None):
         self.base = base
@@ -62,123 +96,239 @@ class SubsetWithTransform(Dataset):
         return img, target
 
 
-def prepare_dataloaders(
-    data_dir: str,
-    img_size: int = 224,
-    batch_size: int = 32,
-    val_split: float = 0.1,
-    test_split: float = 0.1,
-    num_workers: int = 4,
-    seed: int = 42,
-) -> Tuple[DataLoader, DataLoader, DataLoader, list]:
-    data_dir = Path(data_dir)
-    if not data_dir.exists():
-        raise FileNotFoundError(f'data_dir not found: {data_dir}')
+def stratified_split(targets, val_split: float, test_split: float, seed: int):
+    """Split sample indices into train/val/test, stratified by class."""
+    indices = list(range(len(targets)))
+    train_idx, rest_idx, y_train, y_rest = train_test_split(
+        indices, targets, test_size=(val_split + test_split), random_state=seed, stratify=targets
+    )
 
-    def is_image_dir(p: Path) -> bool:
-        # directory that contains at least one image file
-        return any(is_image_file(str(x)) for x in p.iterdir() if x.is_file())
-
-    def find_image_root(root: Path, max_depth: int = 3) -> Path:
-        """Heuristically find the directory that contains class subfolders.
-
-        Strategy:
-        - If `root` has many immediate subdirectories which themselves contain images,
-          prefer that.
-        - Otherwise, walk up to `max_depth` and pick the directory with the most
-          candidate class subfolders (each subfolder must contain at least one image).
-        """
-        # check immediate children
-        children = [p for p in root.iterdir() if p.is_dir()]
-        class_dirs = [p for p in children if any(is_image_file(str(x)) for x in p.iterdir())]
-        if len(class_dirs) >= 2:
-            return root
-
-        # search deeper up to max_depth
-        best = root
-        best_count = 0
-        for dirpath, dirnames, filenames in os.walk(root):
-            depth = Path(dirpath).relative_to(root).parts
-            if len(depth) > max_depth:
-                continue
-            p = Path(dirpath)
-            # count immediate subdirs that contain images
-            subs = [sd for sd in (p.iterdir() if p.exists() else []) if sd.is_dir()]
-            cnt = 0
-            for sd in subs:
-                if any(is_image_file(str(x)) for x in sd.rglob('*')):
-                    cnt += 1
-            if cnt > best_count:
-                best_count = cnt
-                best = p
-
-        return best
-
-    # find best image root automatically and inform the user
-    chosen_root = find_image_root(data_dir)
-    if chosen_root != data_dir:
-        print(f'Using detected dataset root: {chosen_root} (passed {data_dir})')
-    data_dir = chosen_root
+    if test_split > 0:
+        relative_test = test_split / (val_split + test_split)
+        val_idx, test_idx, _, _ = train_test_split(
+            rest_idx, y_rest, test_size=relative_test, random_state=seed, stratify=y_rest
+        )
+    else:
+        val_idx = rest_idx
+        test_idx = []
+    return train_idx, val_idx, test_idx
+
+
+def build_transforms(img_size: int, tensor_input: bool = False, uint8_output: bool = False):
+    """Return `(train_tf, val_tf)`.
+
+    With `tensor_input` the pipelines take uint8 CHW tensors (as produced by
+    `ShardedImageDataset`) instead of PIL images. With `uint8_output` they only
+    produce fixed-size uint8 tensors; crop/flip/normalize are then applied per
+    batch by `src.train.augment.BatchAugment`, and the train pipeline also
+    returns each image's source aspect ratio (`WithAspect`) so the batched crop
+    matches RandomResizedCrop on the original image.
+    """
+    normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    if uint8_output:
+        # train samples keep some margin around the crop, like the val resize
+        resize = int(img_size * 1.14)
+        to_uint8 = [] if tensor_input else [transforms.PILToTensor()]
+        antialias = {'antialias': True} if tensor_input else {}
+        train_tf = WithAspect(transforms.Compose([
+            transforms.Resize((resize, resize), **antialias),
+            *to_uint8,
+        ]))
+        val_tf = transforms.Compose([
+            transforms.Resize(resize, **antialias),
+            transforms.CenterCrop(img_size),
+            *to_uint8,
+        ])
+        return train_tf, val_tf
+    if tensor_input:
+        to_float = transforms.ConvertImageDtype(torch.float32)
+        train_tf = transforms.Compose([
+            transforms.RandomResizedCrop(img_size, antialias=True),
+            transforms.RandomHorizontalFlip(),
+            to_float,
+            normalize,
+        ])
+        val_tf = transforms.Compose([
+            transforms.Resize(int(img_size * 1.14), antialias=True),
+            transforms.CenterCrop(img_size),
+            to_float,
+            normalize,
+        ])
+        return train_tf, val_tf
 
     # Basic transforms
     train_tf = transforms.Compose([
         transforms.RandomResizedCrop(img_size),
         transforms.RandomHorizontalFlip(),
         transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        normalize,
     ])
 
     val_tf = transforms.Compose([
         transforms.Resize(int(img_size * 1.14)),
         transforms.CenterCrop(img_size),
         transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        normalize,
     ])
+    return train_tf, val_tf
 
-    # If folder contains train/val/test subfolders, prefer that structure
-    if (data_dir / 'train').exists():
-        print('Detected train/ subfolder structure under', data_dir)
-        train_ds = ImageFolder(str(data_dir / 'train'), transform=train_tf)
-        if (data_dir / 'val').exists():
-            val_ds = ImageFolder(str(data_dir / 'val'), transform=val_tf)
-        else:
-            val_ds = ImageFolder(str(data_dir / 'train'), transform=val_tf)
-        if (data_dir / 'test').exists():
-            test_ds = ImageFolder(str(data_dir / 'test'), transform=val_tf)
+
+def load_dataset_index(data_dir: Path, seed: int, val_split: float, test_split: float,
+                       cache_dir: Optional[str] = DEFAULT_INDEX_DIR):
+    """Return `(index, (train_idx, val_idx, test_idx))`, reusing the cached index when fresh.
+
+    With an existing train/val/test folder layout the folders are the split
+    (val falls back to the train images, test to val, as before); otherwise the
+    stratified split for this seed/fractions is computed once and cached.
+
+    Under torchrun only rank 0 scans and writes the index; the other ranks
+    wait for it and then read the fresh file.
+    """
+    path = index_path_for(data_dir, cache_dir) if cache_dir else None
+    if path is None or not is_distributed():
+        return _load_dataset_index(data_dir, seed, val_split, test_split, path)
+    if is_main_process():
+        result = _load_dataset_index(data_dir, seed, val_split, test_split, path)
+        barrier()
+        return result
+    barrier()
+    return _load_dataset_index(data_dir, seed, val_split, test_split, path, write=False)
+
+
+def _load_dataset_index(data_dir: Path, seed: int, val_split: float, test_split: float,
+                        path: Optional[Path], write: bool = True):
+    index = read_index(path, data_dir) if path else None
+    dirty = index is None
+    if index is None:
+        start = time.perf_counter()
+        index = scan_dataset(data_dir, find_image_root(data_dir))
+        print(f'Indexed {len(index["paths"])} images in {time.perf_counter() - start:.1f}s')
+    else:
+        print(f'Using cached dataset index {path} ({len(index["paths"])} images)')
+
+    if index['layout'] == 'split':
+        train_idx, val_idx, test_idx = split_indices(index['split'])
+        if not val_idx:
+            val_idx = train_idx
+    else:
+        key = split_key(seed, val_split, test_split)
+        if key in index['splits']:
+            train_idx, val_idx, test_idx = split_indices(index['splits'][key])
         else:
-            test_ds = val_ds
+            train_idx, val_idx, test_idx = stratified_split(index['labels'], val_split, test_split, seed)
+            index['splits'][key] = assignment_from(train_idx, val_idx, test_idx, len(index['labels']))
+            dirty = True
+    if dirty and path and write:
+        write_index(path, index)
+    return index, (train_idx, val_idx, test_idx)
+
+
+def build_loaders(train_ds, val_ds, test_ds, batch_size: int, cfg: LoaderConfig, seed: int = 42):
+    """Create the train/val/test loaders, auto-tuning the worker count first if requested.
+
+    Under `torchrun` each rank gets its own shard of every split (see
+    `src.train.distributed`); `batch_size` is per process.
+    """
+    if cfg.autotune:
+        print('Auto-tuning DataLoader workers...')
+        autotune_workers(train_ds, batch_size, cfg)
+    train_loader = make_loader(train_ds, batch_size, True, cfg, sampler=train_sampler(train_ds, seed))
+    val_loader = make_loader(val_ds, batch_size, False, cfg, sampler=eval_sampler(val_ds))
+    # reuse the val loader (and its persistent workers) when the test split is the same dataset
+    if test_ds is val_ds:
+        test_loader = val_loader
+    else:
+        test_loader = make_loader(test_ds, batch_size, False, cfg, sampler=eval_sampler(test_ds))
+    return train_loader, val_loader, test_loader
+
+
+def prepare_shard_dataloaders(
+    shard_dir: str,
+    img_size: int = 224,
+    batch_size: int = 32,
+    val_split: float = 0.1,
+    test_split: float = 0.1,
+    num_workers: int = 4,
+    seed: int = 42,
+    batch_augment: bool = False,
+    loader_config: Optional[LoaderConfig] = None,
+) -> Tuple[DataLoader, DataLoader, DataLoader, list]:
+    """Like `prepare_dataloaders`, but reading shards written by `scripts/prepare_shards.py`."""
+    shard_dir = Path(shard_dir)
+    loader_config = loader_config or LoaderConfig(num_workers=num_workers)
+    train_tf, val_tf = build_transforms(img_size, tensor_input=True, uint8_output=batch_augment)
+
+    if has_shards(shard_dir / 'train'):
+        print('Using pre-split shards under', shard_dir)
+        train_ds = ShardedImageDataset(shard_dir / 'train', transform=train_tf)
+        val_dir = shard_dir / 'val' if has_shards(shard_dir / 'val') else shard_dir / 'train'
+        val_ds = ShardedImageDataset(val_dir, transform=val_tf)
+        test_ds = ShardedImageDataset(shard_dir / 'test', transform=val_tf) if has_shards(shard_dir / 'test') else val_ds
         class_names = train_ds.classes
-        train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True, num_workers=num_workers)
-        val_loader = DataLoader(val_ds, batch_size=batch_size, shuffle=False, num_workers=num_workers)
-        test_loader = DataLoader(test_ds, batch_size=batch_size, shuffle=False, num_workers=num_workers)
-        return train_loader, val_loader, test_loader, class_names
-
-    # Otherwise, use ImageFolder on root and split indices stratified by class
-    base = ImageFolder(str(data_dir))
-    targets = base.targets
-    indices = list(range(len(base)))
-    test_size = test_split
-    val_size = val_split / (1.0 - test_size) if (val_split + test_split) < 1.0 else 0.0
+    else:
+        print('Using shards under', shard_dir)
+        base = ShardedImageDataset(shard_dir)
+        train_idx, val_idx, test_idx = stratified_split(base.targets, val_split, test_split, seed)
+        train_ds = ShardedImageDataset(shard_dir, train_idx, transform=train_tf)
+        val_ds = ShardedImageDataset(shard_dir, val_idx, transform=val_tf)
+        test_ds = ShardedImageDataset(shard_dir, test_idx, transform=val_tf) if len(test_idx) > 0 else val_ds
+        class_names = base.classes
 
-    train_idx, rest_idx, y_train, y_rest = train_test_split(
-        indices, targets, test_size=(val_split + test_split), random_state=seed, stratify=targets
-    )
+    train_loader, val_loader, test_loader = build_loaders(train_ds, val_ds, test_ds, batch_size, loader_config, seed)
+    return train_loader, val_loader, test_loader, class_names
 
-    if test_split > 0:
-        relative_test = test_split / (val_split + test_split)
-        val_idx, test_idx, _, _ = train_test_split(
-            rest_idx, y_rest, test_size=relative_test, random_state=seed, stratify=y_rest
+
+def prepare_dataloaders(
+    data_dir: str,
+    img_size: int = 224,
+    batch_size: int = 32,
+    val_split: float = 0.1,
+    test_split: float = 0.1,
+    num_workers: int = 4,
+    seed: int = 42,
+    shard_dir: Optional[str] = None,
+    batch_augment: bool = False,
+    loader_config: Optional[LoaderConfig] = None,
+    index_cache: Optional[str] = DEFAULT_INDEX_DIR,
+) -> Tuple[DataLoader, DataLoader, DataLoader, list]:
+    """Build train/val/test loaders and return them with the class names.
+
+    If `shard_dir` contains shards written by `scripts/prepare_shards.py`, they
+    are used instead of decoding the images under `data_dir`. With
+    `batch_augment` the loaders yield un-normalized uint8 batches that must be
+    passed through `BatchAugment.train` / `BatchAugment.eval`. `loader_config`
+    controls pinned memory, persistent workers, prefetching and worker
+    auto-tuning (defaults to `LoaderConfig(num_workers=num_workers)`).
+    The file list and split are cached under `index_cache` (None disables
+    it, see `src.train.dataset_index`).
+    """
+    loader_config = loader_config or LoaderConfig(num_workers=num_workers)
+    if shard_dir is not None and (has_shards(shard_dir) or has_shards(Path(shard_dir) / 'train')):
+        return prepare_shard_dataloaders(
+            shard_dir, img_size=img_size, batch_size=batch_size, val_split=val_split,
+            test_split=test_split, num_workers=num_workers, seed=seed, batch_augment=batch_augment,
+            loader_config=loader_config,
         )
-    else:
-        val_idx = rest_idx
-        test_idx = []
+    if shard_dir is not None:
+        print(f'No shards found under {shard_dir}; decoding images from {data_dir}')
+
+    data_dir = Path(data_dir)
+    if not data_dir.exists():
+        raise FileNotFoundError(f'data_dir not found: {data_dir}')
+
+    index, (train_idx, val_idx, test_idx) = load_dataset_index(data_dir, seed, val_split, test_split, index_cache)
+    chosen_root = Path(index['root'])
+    if chosen_root != data_dir.resolve():
+        print(f'Using detected dataset root: {chosen_root} (passed {data_dir})')
+    if index['layout'] == 'split':
+        print('Detected train/ subfolder structure under', chosen_root)
+    base = IndexedImageFolder(index)
 
+    train_tf, val_tf = build_transforms(img_size, uint8_output=batch_augment)
     train_ds = SubsetWithTransform(base, train_idx, transform=train_tf)
     val_ds = SubsetWithTransform(base, val_idx, transform=val_tf)
     test_ds = SubsetWithTransform(base, test_idx, transform=val_tf) if len(test_idx) > 0 else val_ds
 
-    train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True, num_workers=num_workers)
-    val_loader = DataLoader(val_ds, batch_size=batch_size, shuffle=False, num_workers=num_workers)
-    test_loader = DataLoader(test_ds, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    train_loader, val_loader, test_loader = build_loaders(train_ds, val_ds, test_ds, batch_size, loader_config, seed)
 
     return train_loader, val_loader, test_loader, base.classes
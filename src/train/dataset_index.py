@@ -0,0 +1,206 @@
+"""Persisted dataset file index and split cache.
+
+Scanning a 50k+ image tree (root discovery, ImageFolder's per-file listing,
+the stratified split) is the slowest part of starting a training run. The
+first run writes an index under `.cache/dataset_index/` with every sample's
+path (relative to the detected class root), label and size, the class list,
+the train/val/test assignment for each (seed, val_split, test_split) that has
+been used, and the mtime of every directory involved.
+
+Later runs only `stat` those directories: adding, removing or renaming an
+image changes the mtime of the directory holding it, so the index is rebuilt
+exactly when the file set changes. (Rewriting an existing file in place does
+not change its directory and is not detected; delete the index file or pass
+`--index-cache none` to force a rescan.)
+
+Both dataset layouts are indexed: a flat class-per-folder tree (split
+stratified per seed/fractions) and a train/val/test tree (`val/` may also be
+called `valid/` or `validation/`), where the folders are the split. Files are
+filtered with torchvision's `IMG_EXTENSIONS`, so the index lists exactly the
+samples `ImageFolder` would.
+"""
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import json
+import os
+import tempfile
+
+INDEX_VERSION = 2
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parents[2] / '.cache' / 'dataset_index'
+SPLIT_NAMES = ('train', 'val', 'test')
+# folder name (lowercase) -> split
+SPLIT_ALIASES = {'train': 'train', 'val': 'val', 'valid': 'val', 'validation': 'val', 'test': 'test'}
+# same as torchvision.datasets.folder.IMG_EXTENSIONS (kept here so this module stays torch-free)
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+
+def is_dataset_image(name: str) -> bool:
+    """The file filter `ImageFolder` applies."""
+    return name.lower().endswith(IMG_EXTENSIONS)
+
+
+def find_split_dirs(root: Path) -> List[Tuple[str, Path]]:
+    """`[(split, dir), ...]` in train/val/test order for a split layout, `[]` if `root` has no train folder."""
+    root = Path(root)
+    found = {}
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        split = SPLIT_ALIASES.get(entry.name.lower())
+        if split is not None and split not in found and entry.is_dir():
+            found[split] = root / entry.name
+    if 'train' not in found:
+        return []
+    return [(name, found[name]) for name in SPLIT_NAMES if name in found]
+
+
+def index_path_for(data_dir: Path, cache_dir: Path) -> Path:
+    key = hashlib.sha1(str(Path(data_dir).resolve()).encode()).hexdigest()[:16]
+    return Path(cache_dir) / f'{Path(data_dir).name}-{key}.json'
+
+
+def dir_mtimes(dirs: Iterable[Path]) -> Dict[str, int]:
+    return {str(d): os.stat(d).st_mtime_ns for d in dirs}
+
+
+def is_fresh(index: dict, data_dir: Path) -> bool:
+    """Cheap staleness check: one `stat` per directory recorded in the index."""
+    if index.get('version') != INDEX_VERSION or index.get('data_dir') != str(Path(data_dir).resolve()):
+        return False
+    for d, mtime in index.get('dirs', {}).items():
+        try:
+            if os.stat(d).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def read_index(path: Path, data_dir: Path) -> Optional[dict]:
+    """Return the cached index at `path` if it exists and is still fresh."""
+    try:
+        with open(path, 'r') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f'Ignoring unreadable dataset index {path}:', e)
+        return None
+    return index if is_fresh(index, data_dir) else None
+
+
+def write_index(path: Path, index: dict):
+    path = Path(path)
+    tmp = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # unique tmp name so concurrent writers never share (and truncate) one file
+        fd, tmp = tempfile.mkstemp(prefix=f'.{path.name}.', dir=str(path.parent))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        if tmp is not None:
+            Path(tmp).unlink(missing_ok=True)
+        print(f'Could not write dataset index {path}:', e)
+
+
+def _walk_images(top: str, dirs: List[str]):
+    """Yield (path, size) for image files under `top` in ImageFolder order; records visited dirs.
+
+    Same order as `sorted(os.walk(top))` (a directory's own files, then its
+    subdirectories), so split indices match the previous ImageFolder-based runs.
+    """
+    dirs.append(top)
+    with os.scandir(top) as it:
+        entries = list(it)
+    subdirs = sorted(e.path for e in entries if e.is_dir())
+    for entry in sorted((e for e in entries if not e.is_dir()), key=lambda e: e.name):
+        if is_dataset_image(entry.name):
+            yield entry.path, entry.stat().st_size
+    for sub in subdirs:
+        yield from _walk_images(sub, dirs)
+
+
+def scan_dataset(data_dir: Path, root: Path) -> dict:
+    """Build a fresh index for the class tree at `root` (found under `data_dir`).
+
+    If `root` has a `train/` folder (as returned by `find_image_root` for a
+    train/val/test tree), the existing split folders are the split assignment
+    and labels come from the class folders in `train/`.
+    """
+    data_dir = Path(data_dir).resolve()
+    root = Path(root).resolve()
+    split_dirs = find_split_dirs(root)
+    layout = 'split' if split_dirs else 'flat'
+    if not split_dirs:
+        split_dirs = [(None, root)]
+    class_dir = split_dirs[0][1]
+    classes = sorted(e.name for e in os.scandir(class_dir) if e.is_dir())
+    class_to_idx = {name: i for i, name in enumerate(classes)}
+
+    # root discovery looked at everything between data_dir and root
+    visited = [str(data_dir)] + [str(p) for p in root.parents if data_dir in p.parents] + [str(root)]
+    paths, labels, sizes, split = [], [], [], []
+    for split_name, top in split_dirs:
+        visited.append(str(top))
+        names = sorted(e.name for e in os.scandir(top) if e.is_dir())
+        for name in names:
+            if name not in class_to_idx:
+                print(f'Skipping {top / name}: not a class in {class_dir}')
+                continue
+            for path, size in _walk_images(str(top / name), visited):
+                paths.append(os.path.relpath(path, root))
+                labels.append(class_to_idx[name])
+                sizes.append(size)
+                if split_name is not None:
+                    split.append(SPLIT_NAMES.index(split_name))
+
+    index = {
+        'version': INDEX_VERSION,
+        'data_dir': str(data_dir),
+        'root': str(root),
+        'layout': layout,
+        'classes': classes,
+        'paths': paths,
+        'labels': labels,
+        'sizes': sizes,
+        # per-sample 0/1/2 = train/val/test for the folder layout; per split key otherwise
+        'split': split,
+        'splits': {},
+        'dirs': dir_mtimes(dict.fromkeys(visited)),
+    }
+    return index
+
+
+def split_key(seed: int, val_split: float, test_split: float) -> str:
+    return f'seed={seed},val={val_split},test={test_split}'
+
+
+def split_indices(assignment: List[int]) -> Tuple[List[int], List[int], List[int]]:
+    out = ([], [], [])
+    for i, s in enumerate(assignment):
+        out[s].append(i)
+    return out
+
+
+def assignment_from(train_idx, val_idx, test_idx, n: int) -> List[int]:
+    assignment = [0] * n
+    for s, idx in ((1, val_idx), (2, test_idx)):
+        for i in idx:
+            assignment[i] = s
+    return assignment
+
+
+class IndexedImageFolder:
+    """Minimal ImageFolder stand-in backed by an index (`samples`, `targets`, `classes`)."""
+
+    def __init__(self, index: dict):
+        root = index['root']
+        self.root = root
+        self.classes = index['classes']
+        self.class_to_idx = {name: i for i, name in enumerate(self.classes)}
+        self.targets = index['labels']
+        self.samples = [(os.path.join(root, p), t) for p, t in zip(index['paths'], self.targets)]
+
+    def __len__(self):
+        return len(self.samples)
@@ -0,0 +1,131 @@
+"""Multi-process data-parallel training helpers (torchrun compatible).
+
+Launch with e.g.
+
+    torchrun --standalone --nproc_per_node 4 src/train/train.py --data-dir data ...
+
+torchrun sets RANK / WORLD_SIZE / LOCAL_RANK / MASTER_ADDR / MASTER_PORT;
+`init_distributed` picks them up and joins a gloo process group (CPU
+friendly; nccl can be selected for multi-GPU hosts). Without those variables
+everything here degrades to single-process no-ops, so `train.py` runs exactly
+as before.
+
+Each rank trains on its own shard of the train split (`DistributedSampler`,
+reshuffled per epoch) and evaluates a disjoint, unpadded slice of the
+val/test splits (`EvalShardSampler`), so all-reduced metrics count every
+sample exactly once.
+"""
+from dataclasses import dataclass
+import os
+
+import torch
+import torch.distributed as dist
+from torch.utils.data import DistributedSampler, Sampler
+
+
+@dataclass
+class DistInfo:
+    rank: int = 0
+    world_size: int = 1
+    local_rank: int = 0
+    local_world_size: int = 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.world_size > 1
+
+    @property
+    def is_main(self) -> bool:
+        return self.rank == 0
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+
+def init_distributed(backend: str = 'gloo', threads_per_proc: int = 0) -> DistInfo:
+    """Join the process group described by the torchrun environment, if any.
+
+    torchrun defaults OMP_NUM_THREADS to 1 per process, which leaves most of a
+    large CPU box idle; unless `threads_per_proc` is given, each rank gets an
+    equal share of the host's cores instead.
+    """
+    world_size = int(os.environ.get('WORLD_SIZE', '1'))
+    if world_size <= 1:
+        return DistInfo()
+    info = DistInfo(
+        rank=int(os.environ['RANK']),
+        world_size=world_size,
+        local_rank=int(os.environ.get('LOCAL_RANK', '0')),
+        local_world_size=int(os.environ.get('LOCAL_WORLD_SIZE', str(world_size))),
+    )
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend, init_method='env://')
+    threads = threads_per_proc or max(1, (os.cpu_count() or 1) // info.local_world_size)
+    torch.set_num_threads(threads)
+    if info.is_main:
+        print(f'Distributed: {info.world_size} processes ({backend}), {threads} threads each')
+    return info
+
+
+def cleanup():
+    if dist.is_available() and dist.is_initialized():
+        dist.barrier()
+        dist.destroy_process_group()
+
+
+def is_main_process() -> bool:
+    return not is_distributed() or dist.get_rank() == 0
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+def rank0_print(*args, **kwargs):
+    if is_main_process():
+        print(*args, **kwargs)
+
+
+def all_reduce_sum(tensor: torch.Tensor) -> torch.Tensor:
+    """Sum `tensor` across ranks in place (no-op when not distributed)."""
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+class EvalShardSampler(Sampler):
+    """Strided, unpadded split of a dataset across ranks (rank r gets r, r+W, ...).
+
+    Unlike `DistributedSampler` it never repeats samples to even out the
+    shards, so summed metrics are exact.
+    """
+
+    def __init__(self, dataset, rank: int, world_size: int):
+        self.indices = list(range(rank, len(dataset), world_size))
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def train_sampler(dataset, seed: int = 42):
+    if not is_distributed():
+        return None
+    return DistributedSampler(dataset, shuffle=True, seed=seed)
+
+
+def eval_sampler(dataset):
+    if not is_distributed():
+        return None
+    return EvalShardSampler(dataset, dist.get_rank(), dist.get_world_size())
+
+
+def set_epoch(loader, epoch: int):
+    """Reseed a `DistributedSampler` so every epoch uses a different shuffle."""
+    sampler = getattr(loader, 'sampler', None)
+    if isinstance(sampler, DistributedSampler):
+        sampler.set_epoch(epoch)
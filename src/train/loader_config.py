@@ -0,0 +1,115 @@
+"""DataLoader performance settings and worker-count auto-tuning.
+
+`LoaderConfig` gathers the knobs that the plain `DataLoader(batch_size,
+shuffle, num_workers)` calls left at their defaults: persistent workers (so
+train/val/test workers are not torn down and respawned every epoch), pinned
+memory for faster host->GPU copies, the prefetch depth, and an optional
+shared-memory collate. With `autotune=True` a few worker counts are probed on
+the training set for a short window and the fastest one is used.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+import os
+import time
+
+import torch
+from torch.utils.data import DataLoader
+from torch.utils.data._utils.collate import default_collate
+
+
+@dataclass
+class LoaderConfig:
+    num_workers: int = 4
+    # None = pin only when CUDA is available
+    pin_memory: Optional[bool] = None
+    persistent_workers: bool = True
+    # batches prefetched per worker (None = torch default of 2)
+    prefetch_factor: Optional[int] = None
+    shm_collate: bool = False
+    autotune: bool = False
+    autotune_candidates: Sequence[int] = ()
+    autotune_window_s: float = 3.0
+    # filled by `autotune_workers`: [{'num_workers': n, 'samples_per_s': r}, ...]
+    autotune_results: List[dict] = field(default_factory=list)
+
+    def loader_kwargs(self, num_workers: Optional[int] = None) -> dict:
+        n = self.num_workers if num_workers is None else num_workers
+        pin = torch.cuda.is_available() if self.pin_memory is None else self.pin_memory
+        kwargs = {'num_workers': n, 'pin_memory': pin}
+        if n > 0:
+            kwargs['persistent_workers'] = self.persistent_workers
+            if self.prefetch_factor is not None:
+                kwargs['prefetch_factor'] = self.prefetch_factor
+        if self.shm_collate:
+            kwargs['collate_fn'] = shm_collate
+        return kwargs
+
+
+def shm_collate(batch):
+    """Collate `(tensor, label)` samples straight into a shared-memory batch tensor.
+
+    `default_collate` only allocates the output in shared memory inside
+    worker processes; this does it unconditionally (one allocation, one copy),
+    so batches built in the main process can also be handed to other
+    processes or pinned without an extra copy.
+    """
+    elem = batch[0][0]
+    if not isinstance(elem, torch.Tensor):
+        return default_collate(batch)
+    out = torch.empty((len(batch),) + tuple(elem.shape), dtype=elem.dtype).share_memory_()
+    torch.stack([sample for sample, _ in batch], out=out)
+    labels = torch.as_tensor([label for _, label in batch], dtype=torch.long)
+    return out, labels
+
+
+def make_loader(dataset, batch_size: int, shuffle: bool, cfg: LoaderConfig, sampler=None,
+                num_workers: Optional[int] = None) -> DataLoader:
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle if sampler is None else False,
+        sampler=sampler,
+        **cfg.loader_kwargs(num_workers),
+    )
+
+
+def default_candidates() -> List[int]:
+    cpus = os.cpu_count() or 1
+    cands = {0, 2, 4, 8, cpus // 2, cpus}
+    return sorted(c for c in cands if 0 <= c <= cpus)
+
+
+def probe_throughput(dataset, batch_size: int, cfg: LoaderConfig, num_workers: int, window_s: float) -> float:
+    """Samples/s over `window_s` seconds, excluding worker start-up and the first batch."""
+    kwargs = cfg.loader_kwargs(num_workers)
+    # probe loaders are thrown away, don't keep their workers alive
+    kwargs.pop('persistent_workers', None)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, **kwargs)
+    it = iter(loader)
+    try:
+        next(it)
+    except StopIteration:
+        return 0.0
+    n = 0
+    start = time.perf_counter()
+    for imgs, _ in it:
+        # `--batch-augment` train batches are `(images, aspects)`
+        n += len(imgs[0] if isinstance(imgs, (list, tuple)) else imgs)
+        if time.perf_counter() - start >= window_s:
+            break
+    elapsed = time.perf_counter() - start
+    del it
+    return n / elapsed if elapsed > 0 else 0.0
+
+
+def autotune_workers(dataset, batch_size: int, cfg: LoaderConfig) -> int:
+    """Pick the worker count with the best throughput; records results on `cfg`."""
+    candidates = list(cfg.autotune_candidates) or default_candidates()
+    results = []
+    for n in candidates:
+        rate = probe_throughput(dataset, batch_size, cfg, n, cfg.autotune_window_s)
+        results.append({'num_workers': n, 'samples_per_s': rate})
+    best = max(results, key=lambda r: r['samples_per_s'])
+    cfg.autotune_results = results
+    cfg.num_workers = best['num_workers']
+    return cfg.num_workers
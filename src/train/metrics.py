@@ -0,0 +1,73 @@
+"""Streaming classification metrics.
+
+`ConfusionMatrix` accumulates a (num_classes, num_classes) count matrix on the
+same device as the model outputs with one `bincount` per batch, and
+`RunningLoss` keeps the sample-weighted loss sum there too, so the training
+loop never syncs to the host or grows Python lists. Accuracy and
+weighted precision/recall/F1 are derived from the matrix once per epoch and
+match sklearn's `accuracy_score` / `precision_recall_fscore_support(...,
+average='weighted', zero_division=0)`.
+"""
+from typing import Dict
+
+import torch
+
+
+class RunningLoss:
+    def __init__(self, device='cpu'):
+        # MPS has no float64
+        dtype = torch.float32 if torch.device(device).type == 'mps' else torch.float64
+        # [sample-weighted loss sum, sample count]; all-reduce this tensor across ranks
+        self.totals = torch.zeros(2, dtype=dtype, device=device)
+
+    def reset(self):
+        self.totals.zero_()
+
+    @torch.no_grad()
+    def update(self, loss: torch.Tensor, n: int):
+        """Add a batch's mean loss, weighted by its `n` samples (no host sync)."""
+        self.totals[0] += loss.detach().to(self.totals.dtype) * n
+        self.totals[1] += n
+
+    def mean(self) -> float:
+        """Mean loss per sample; syncs, so call it once per epoch or every few steps."""
+        total, n = self.totals.tolist()
+        return total / n if n > 0 else 0.0
+
+
+class ConfusionMatrix:
+    def __init__(self, num_classes: int, device='cpu'):
+        self.num_classes = int(num_classes)
+        # rows = true label, columns = predicted label
+        self.matrix = torch.zeros(self.num_classes, self.num_classes, dtype=torch.long, device=device)
+
+    def reset(self):
+        self.matrix.zero_()
+
+    @torch.no_grad()
+    def update(self, outputs: torch.Tensor, labels: torch.Tensor):
+        """Add a batch of logits (B, C) or predicted indices (B,) with their true labels."""
+        preds = outputs.argmax(1) if outputs.dim() > 1 else outputs
+        idx = labels.to(self.matrix.device).long() * self.num_classes + preds.to(self.matrix.device).long()
+        self.matrix += torch.bincount(idx, minlength=self.num_classes ** 2).view(self.num_classes, self.num_classes)
+
+    def compute(self) -> Dict[str, float]:
+        """Accuracy and support-weighted precision/recall/F1 (0 where undefined)."""
+        cm = self.matrix.double().cpu()
+        tp = cm.diag()
+        support = cm.sum(1)
+        predicted = cm.sum(0)
+        total = support.sum()
+        if total == 0:
+            return {'accuracy': 0.0, 'precision': 0.0, 'recall': 0.0, 'f1': 0.0}
+        precision = torch.where(predicted > 0, tp / predicted.clamp(min=1), torch.zeros_like(tp))
+        recall = torch.where(support > 0, tp / support.clamp(min=1), torch.zeros_like(tp))
+        denom = precision + recall
+        f1 = torch.where(denom > 0, 2 * precision * recall / denom.clamp(min=1e-12), torch.zeros_like(tp))
+        weights = support / total
+        return {
+            'accuracy': float(tp.sum() / total),
+            'precision': float((precision * weights).sum()),
+            'recall': float((recall * weights).sum()),
+            'f1': float((f1 * weights).sum()),
+        }
@@ -0,0 +1,60 @@
+"""Mixed precision and memory-format helpers for training.
+
+`--amp` runs the forward pass under `torch.autocast`: bfloat16 on CPU (no loss
+scaling needed, the exponent range matches fp32) and float16 with a
+`GradScaler` on CUDA. Parameters and optimizer state stay fp32 either way, so
+checkpoints keep the existing `model_state` format.
+
+`--channels-last` stores weights and input batches as NHWC, which lets the
+oneDNN (CPU) and cuDNN convolution kernels skip layout conversions.
+"""
+import contextlib
+
+import torch
+
+
+def amp_dtype(device: torch.device):
+    return torch.float16 if device.type == 'cuda' else torch.bfloat16
+
+
+def autocast(device: torch.device, enabled: bool):
+    """Autocast context for `device`, or a no-op when disabled/unsupported."""
+    if not enabled:
+        return contextlib.nullcontext()
+    if device.type not in ('cpu', 'cuda'):
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.type, dtype=amp_dtype(device))
+
+
+def make_grad_scaler(device: torch.device, enabled: bool):
+    """GradScaler for fp16 on CUDA; a disabled (pass-through) scaler otherwise."""
+    use = enabled and device.type == 'cuda'
+    try:
+        return torch.amp.GradScaler('cuda', enabled=use)
+    except (AttributeError, TypeError):
+        return torch.cuda.amp.GradScaler(enabled=use)
+
+
+def memory_format(channels_last: bool):
+    return torch.channels_last if channels_last else torch.contiguous_format
+
+
+def to_memory_format(x: torch.Tensor, channels_last: bool) -> torch.Tensor:
+    if channels_last and x.dim() == 4:
+        return x.contiguous(memory_format=torch.channels_last)
+    return x
+
+
+def fp32_state_dict(model: torch.nn.Module) -> dict:
+    """Contiguous fp32 CPU copy of `model.state_dict()` for checkpoints.
+
+    Independent of the training layout/precision, so checkpoints written with
+    `--amp`/`--channels-last` load anywhere the plain fp32 ones do.
+    """
+    state = {}
+    for k, v in model.state_dict().items():
+        v = v.detach().cpu()
+        if v.is_floating_point():
+            v = v.float()
+        state[k] = v.contiguous()
+    return state
@@ -0,0 +1,187 @@
+"""Single-pass dataset tree scanner.
+
+Finding the class root used to be done three times with nested recursive
+globs (`find_image_root`, `find_best_candidate` in
+`scripts/download_and_prepare.py` and the `/labels/regenerate` fallback),
+re-listing every subtree once per ancestor. `scan_tree` walks the tree once
+with `os.scandir` (directory entries only, no per-file `stat`), aggregates
+image counts bottom-up, and `find_class_root` picks the class root from those
+counts in linear time.
+
+Torch-free so the API can use it.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import os
+
+from src.model.utils import is_image_file
+
+SPLIT_DIRS = ('train', 'val', 'valid', 'validation', 'test')
+
+
+@dataclass
+class DirNode:
+    path: Path
+    depth: int
+    # image files directly inside this directory
+    direct_images: int = 0
+    # image files anywhere below this directory
+    total_images: int = 0
+    children: List['DirNode'] = field(default_factory=list)
+
+    @property
+    def image_children(self) -> int:
+        """Number of subdirectories that contain at least one image (at any depth)."""
+        return sum(1 for c in self.children if c.total_images > 0)
+
+
+@dataclass
+class ScanResult:
+    # dataset root: the class root, or the parent of train/val/test split folders
+    root: Path
+    # directory whose subfolders are `classes` (`root` itself, or `root/train`)
+    class_dir: Path
+    classes: List[str]
+    counts: Dict[str, int]
+    total_images: int
+
+
+def scan_tree(top: Path, depth: int = 0) -> DirNode:
+    """Walk `top` once and return its `DirNode` tree with bottom-up image counts.
+
+    Symlinked directories are not followed (like `os.walk`); unreadable
+    directories count as empty.
+    """
+    node = DirNode(Path(top), depth)
+    try:
+        with os.scandir(top) as it:
+            entries = list(it)
+    except OSError:
+        return node
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                node.children.append(scan_tree(entry.path, depth + 1))
+            elif is_image_file(entry.name):
+                node.direct_images += 1
+        except OSError:
+            continue
+    node.children.sort(key=lambda c: c.path.name)
+    node.total_images = node.direct_images + sum(c.total_images for c in node.children)
+    return node
+
+
+def tree_from_paths(paths: Iterable[str]) -> DirNode:
+    """Build the same `DirNode` tree from relative file paths (e.g. archive member names).
+
+    Lets the class root be chosen from an archive listing before anything is
+    extracted. Node paths are relative to the archive root (`Path('.')`).
+    """
+    root = DirNode(Path('.'), 0)
+    index = {(): root}
+    for name in paths:
+        parts = tuple(p for p in name.replace('\\', '/').split('/') if p not in ('', '.'))
+        if not parts or not is_image_file(parts[-1]):
+            continue
+        node = root
+        for i in range(1, len(parts)):
+            key = parts[:i]
+            child = index.get(key)
+            if child is None:
+                child = DirNode(Path(*key), i)
+                node.children.append(child)
+                index[key] = child
+            node = child
+        node.direct_images += 1
+
+    def total(n: DirNode) -> int:
+        n.children.sort(key=lambda c: c.path.name)
+        n.total_images = n.direct_images + sum(total(c) for c in n.children)
+        return n.total_images
+
+    total(root)
+    return root
+
+
+def iter_nodes(node: DirNode):
+    """Pre-order traversal (parents before children, siblings sorted by name)."""
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        yield n
+        stack.extend(reversed(n.children))
+
+
+def is_split_dir(path: Path) -> bool:
+    return path.name.lower() in SPLIT_DIRS
+
+
+def holds_only_splits(node: DirNode) -> bool:
+    children = [c for c in node.children if c.total_images > 0]
+    return bool(children) and all(is_split_dir(c.path) for c in children)
+
+
+def best_class_node(tree: DirNode, max_depth: Optional[int] = 3) -> DirNode:
+    """Pick the directory that most likely holds one subfolder per class.
+
+    If the top directory has at least two subfolders with images directly in
+    them it is the class root. Otherwise the directory (up to `max_depth`
+    below the top) with the most image-bearing subfolders wins, the shallowest
+    one on ties. A directory whose image-bearing subfolders are all
+    train/val/test splits is never picked itself (with only two classes it
+    would otherwise beat the splits); see `keep_splits_together`.
+    """
+    if sum(1 for c in tree.children if c.direct_images > 0) >= 2:
+        return tree
+    best, best_count = tree, 0
+    for n in iter_nodes(tree):
+        if max_depth is not None and n.depth > max_depth:
+            continue
+        if holds_only_splits(n):
+            continue
+        cnt = n.image_children
+        if cnt > best_count:
+            best, best_count = n, cnt
+    return best
+
+
+def keep_splits_together(root: Path, top: Path) -> Path:
+    """`root`, or its parent when `root` is a train/val/test folder below `top`.
+
+    With a split layout every split holds the same class folders, so the class
+    root found by `best_class_node` is one of the splits (whichever sorts
+    first); the dataset root is the directory holding all of them.
+    """
+    if root != top and is_split_dir(root):
+        return root.parent
+    return root
+
+
+def dataset_node(tree: DirNode, max_depth: Optional[int] = 3):
+    """Return `(dataset root node, class node)` for `tree`.
+
+    They are the same node for a flat class-per-folder tree. For a
+    train/val/test layout the dataset root is the parent of the splits and
+    the classes are read from `train/` (or the first split with images).
+    """
+    node = best_class_node(tree, max_depth)
+    root = keep_splits_together(node.path, tree.path)
+    if root == node.path:
+        return node, node
+    parent = next(n for n in iter_nodes(tree) if n.path == root)
+    splits = [c for c in parent.children if is_split_dir(c.path) and c.total_images > 0]
+    train = [c for c in splits if c.path.name.lower() == 'train']
+    return parent, (train or splits or [node])[0]
+
+
+def find_class_root(top: Path, max_depth: Optional[int] = 3) -> ScanResult:
+    """Scan `top` once; return the dataset root with its class names and per-class image counts.
+
+    For a train/val/test layout `root` is the directory holding the splits and
+    the classes and counts come from the train split (see `dataset_node`).
+    """
+    root, node = dataset_node(scan_tree(Path(top)), max_depth)
+    counts = {c.path.name: c.total_images for c in node.children}
+    return ScanResult(root=root.path, class_dir=node.path, classes=sorted(counts), counts=counts,
+                      total_images=root.total_images)
@@ -0,0 +1,130 @@
+"""Pre-decoded, memory-mapped dataset shards.
+
+`SubsetWithTransform` decodes the original full-size JPEGs every epoch, so
+DataLoader workers end up decode-bound. `prepare_shards` decodes every image
+once, resizes it so the short side is `size` and center-crops it to
+`size x size`, and packs the pixels into uint8 `.npy` shards (N, size, size, 3)
+plus an `index.json` with labels, classes and source paths.
+
+`ShardedImageDataset` memory-maps the shards and returns uint8 CHW tensors
+that share memory with the page cache (no decode, no copy), so the
+transforms given to it must accept tensors (see `prepare_dataloaders`).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+import json
+import os
+import warnings
+
+from PIL import Image
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+INDEX_NAME = 'index.json'
+INDEX_VERSION = 1
+
+
+def load_resized(args) -> np.ndarray:
+    """Decode `path`, resize the short side to `size` and center-crop to a square."""
+    path, size = args
+    img = Image.open(path)
+    # let libjpeg do most of the downscaling while decoding
+    img.draft('RGB', (size, size))
+    img = img.convert('RGB')
+    w, h = img.size
+    scale = size / min(w, h)
+    nw, nh = max(size, round(w * scale)), max(size, round(h * scale))
+    img = img.resize((nw, nh), Image.BILINEAR)
+    left, top = (nw - size) // 2, (nh - size) // 2
+    img = img.crop((left, top, left + size, top + size))
+    return np.asarray(img, dtype=np.uint8)
+
+
+def prepare_shards(
+    samples: Sequence[Tuple[str, int]],
+    classes: List[str],
+    out_dir: str,
+    size: int = 256,
+    shard_size: int = 4096,
+    num_workers: Optional[int] = None,
+) -> Path:
+    """Decode `samples` (path, label) once and write them as uint8 shards under `out_dir`."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    num_workers = num_workers or os.cpu_count() or 1
+    shards = []
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        for start in range(0, len(samples), shard_size):
+            chunk = samples[start:start + shard_size]
+            name = f'shard-{len(shards):05d}.npy'
+            arr = np.lib.format.open_memmap(str(out_dir / name), mode='w+', dtype=np.uint8,
+                                            shape=(len(chunk), size, size, 3))
+            jobs = ((path, size) for path, _ in chunk)
+            for i, pixels in enumerate(pool.map(load_resized, jobs, chunksize=16)):
+                arr[i] = pixels
+            arr.flush()
+            del arr
+            shards.append({'file': name, 'count': len(chunk)})
+            print(f'Wrote {name} ({start + len(chunk)}/{len(samples)} images)')
+
+    index = {
+        'version': INDEX_VERSION,
+        'size': size,
+        'classes': list(classes),
+        'shards': shards,
+        'labels': [int(label) for _, label in samples],
+        'paths': [str(path) for path, _ in samples],
+    }
+    with open(out_dir / INDEX_NAME, 'w') as f:
+        json.dump(index, f)
+    print('Wrote shard index to', out_dir / INDEX_NAME)
+    return out_dir
+
+
+def has_shards(shard_dir) -> bool:
+    return shard_dir is not None and (Path(shard_dir) / INDEX_NAME).exists()
+
+
+class ShardedImageDataset(Dataset):
+    """Dataset over shards written by `prepare_shards`, optionally restricted to `indices`."""
+
+    def __init__(self, shard_dir: str, indices=None, transform=None):
+        self.shard_dir = Path(shard_dir)
+        with open(self.shard_dir / INDEX_NAME, 'r') as f:
+            index = json.load(f)
+        self.classes = index['classes']
+        self.targets = index['labels']
+        self.size = index['size']
+        self.shard_files = [s['file'] for s in index['shards']]
+        self.offsets = np.cumsum([0] + [s['count'] for s in index['shards']])
+        self.indices = list(indices) if indices is not None else list(range(len(self.targets)))
+        self.transform = transform
+        # opened lazily in each DataLoader worker
+        self._maps = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = None
+        return state
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _locate(self, sample_idx: int):
+        shard = int(np.searchsorted(self.offsets, sample_idx, side='right')) - 1
+        return shard, sample_idx - int(self.offsets[shard])
+
+    def __getitem__(self, idx):
+        if self._maps is None:
+            self._maps = [np.load(str(self.shard_dir / f), mmap_mode='r') for f in self.shard_files]
+        sample_idx = self.indices[idx]
+        shard, row = self._locate(sample_idx)
+        with warnings.catch_warnings():
+            # the mapping is read-only; transforms never write in place
+            warnings.simplefilter('ignore', UserWarning)
+            img = torch.from_numpy(self._maps[shard][row]).permute(2, 0, 1)
+        if self.transform:
+            img = self.transform(img)
+        return img, self.targets[sample_idx]
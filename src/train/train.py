@@ -5,22 +5,34 @@ Features:
   root which will be stratified into train/val/test splits).
 - Uses a torchvision model (ResNet18 by default) with optional pretrained weights.
 - Checkpointing (best val accuracy) and resume from checkpoint supported.
+- Multi-process data-parallel training when launched with torchrun
+  (see `src/train/distributed.py`).
 """
 import argparse
 import json
 import math
 import os
+import time
 from pathlib import Path
 
 from tqdm import tqdm
-from sklearn.metrics import precision_recall_fscore_support, accuracy_score
 import csv
 import torch
 import torch.nn as nn
 import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
 from torchvision import models
 
+from src.model.models import resnet10
+
 from src.train.data_utils import prepare_dataloaders
+from src.train.dataset_index import DEFAULT_INDEX_DIR
+from src.train.loader_config import LoaderConfig
+from src.train.augment import BatchAugment, split_aspect
+from src.train.metrics import ConfusionMatrix, RunningLoss
+from src.train.distributed import all_reduce_sum, cleanup, init_distributed, rank0_print, set_epoch
+from src.train.compile import BACKENDS, CompiledModel
+from src.train.precision import autocast, fp32_state_dict, make_grad_scaler, memory_format, to_memory_format
 
 
 def parse_args():
@@ -30,7 +42,7 @@ def parse_args():
     p.add_argument('--batch-size', type=int, default=32)
     p.add_argument('--lr', type=float, default=1e-3)
     p.add_argument('--output', type=str, default='checkpoints', help='checkpoint output dir')
-    p.add_argument('--model', type=str, default='resnet18', choices=['resnet18', 'resnet50', 'efficientnet_b0'], help='model arch')
+    p.add_argument('--model', type=str, default='resnet18', choices=['resnet10', 'resnet18', 'resnet50', 'efficientnet_b0'], help='model arch')
     p.add_argument('--img-size', type=int, default=224)
     p.add_argument('--num-workers', type=int, default=4)
     p.add_argument('--pretrained', action='store_true', help='use pretrained weights')
@@ -38,11 +50,33 @@ def parse_args():
     p.add_argument('--val-split', type=float, default=0.1)
     p.add_argument('--test-split', type=float, default=0.1)
     p.add_argument('--resume', type=str, default=None, help='path to checkpoint to resume')
+    p.add_argument('--batch-augment', action='store_true', help='workers emit uint8 tensors; crop/flip/normalize run per batch in the main process')
+    p.add_argument('--shard-dir', type=str, default=None, help='pre-decoded shards from scripts/prepare_shards.py (used instead of --data-dir when present)')
+    p.add_argument('--index-cache', type=str, default=str(DEFAULT_INDEX_DIR), help="where the dataset file index/split cache is kept ('none' to rescan every run)")
+    p.add_argument('--pin-memory', dest='pin_memory', action='store_true', default=None, help='pin host batches (default: only when CUDA is available)')
+    p.add_argument('--no-pin-memory', dest='pin_memory', action='store_false')
+    p.add_argument('--no-persistent-workers', action='store_true', help='respawn DataLoader workers every epoch')
+    p.add_argument('--prefetch-factor', type=int, default=None, help='batches prefetched per worker (torch default: 2)')
+    p.add_argument('--shm-collate', action='store_true', help='collate batches directly into shared memory')
+    p.add_argument('--autotune-workers', action='store_true', help='probe a few --num-workers values on the train set and use the fastest')
+    p.add_argument('--autotune-candidates', type=str, default='', help="comma-separated worker counts to probe, e.g. '0,2,4,8'")
+    p.add_argument('--amp', action='store_true', help='mixed precision: bf16 autocast on CPU, fp16 + GradScaler on CUDA')
+    p.add_argument('--channels-last', action='store_true', help='train with NHWC (channels_last) weights and inputs')
+    p.add_argument('--compile', action='store_true', help='run forward passes through torch.compile/TorchScript (falls back to eager on failure)')
+    p.add_argument('--compile-backend', type=str, default='auto', choices=BACKENDS, help="'auto' = torch.compile when available, else TorchScript")
+    p.add_argument('--dist-backend', type=str, default='gloo', help="process group backend under torchrun ('gloo' for CPU, 'nccl' for multi-GPU)")
+    p.add_argument('--threads-per-proc', type=int, default=0, help='torch threads per process under torchrun (0 = cores / processes)')
+    p.add_argument('--autotune-window', type=float, default=3.0, help='seconds spent probing each worker count')
+    p.add_argument('--log-every', type=int, default=20, help='update the progress-bar loss every N steps (each update syncs the device)')
     return p.parse_args()
 
 
 def build_model(name: str, num_classes: int, pretrained: bool = True):
-    if name == 'resnet18':
+    if name == 'resnet10':
+        if pretrained:
+            print('No pretrained weights for resnet10; training from scratch')
+        model = resnet10(num_classes)
+    elif name == 'resnet18':
         model = models.resnet18(pretrained=pretrained)
         in_features = model.fc.in_features
         model.fc = nn.Linear(in_features, num_classes)
@@ -79,28 +113,62 @@ def resolve_device(device_str: str):
     return torch.device(device_str)
 
 
+def synchronize(device):
+    """Wait for queued kernels on `device` (CPU ops are already synchronous)."""
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    elif device.type == 'mps':
+        torch.mps.synchronize()
+
+
 def accuracy(outputs, labels):
     _, preds = torch.max(outputs, 1)
     return torch.sum(preds == labels).item() / labels.size(0)
 
 
 def train(args):
+    dist_info = init_distributed(args.dist_backend, args.threads_per_proc)
     out_dir = Path(args.output)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    print('Preparing dataloaders...')
+    rank0_print('Preparing dataloaders...')
+    loader_cfg = LoaderConfig(
+        num_workers=args.num_workers,
+        pin_memory=args.pin_memory,
+        persistent_workers=not args.no_persistent_workers,
+        prefetch_factor=args.prefetch_factor,
+        shm_collate=args.shm_collate,
+        autotune=args.autotune_workers,
+        autotune_candidates=[int(c) for c in args.autotune_candidates.split(',') if c.strip()],
+        autotune_window_s=args.autotune_window,
+    )
     train_loader, val_loader, test_loader, classes = prepare_dataloaders(
-        args.data_dir, img_size=args.img_size, batch_size=args.batch_size, val_split=args.val_split, test_split=args.test_split, num_workers=args.num_workers
+        args.data_dir, img_size=args.img_size, batch_size=args.batch_size, val_split=args.val_split, test_split=args.test_split, num_workers=args.num_workers,
+        shard_dir=args.shard_dir, batch_augment=args.batch_augment, loader_config=loader_cfg,
+        index_cache=None if args.index_cache.lower() == 'none' else args.index_cache,
     )
+    for r in loader_cfg.autotune_results:
+        rank0_print(f"  num_workers={r['num_workers']:>3}: {r['samples_per_s']:8.1f} samples/s")
+    rank0_print('DataLoader:', {k: v for k, v in loader_cfg.loader_kwargs().items() if k != 'collate_fn'},
+          '(shm collate)' if loader_cfg.shm_collate else '')
 
     metrics_file = out_dir / 'metrics.csv'
 
     num_classes = len(classes)
-    print(f'Found {num_classes} classes')
+    rank0_print(f'Found {num_classes} classes')
 
-    device = torch.device(args.device)
+    device = resolve_device(args.device)
+    if dist_info.enabled and device.type == 'cuda':
+        device = torch.device('cuda', dist_info.local_rank)
     model = build_model(args.model, num_classes, pretrained=args.pretrained)
-    model = model.to(device)
+    model = model.to(device, memory_format=memory_format(args.channels_last))
+    scaler = make_grad_scaler(device, args.amp)
+    if args.amp or args.channels_last:
+        rank0_print(f'Precision: {"amp" if args.amp else "fp32"}, memory format: {"channels_last" if args.channels_last else "NCHW"}')
+    # forward passes go through `net`; optimizer and checkpoints use the eager `model`
+    ddp = DistributedDataParallel(model, device_ids=[device.index] if device.type == 'cuda' else None) if dist_info.enabled else model
+    net = CompiledModel(ddp, args.compile_backend) if args.compile else ddp
+    augment = BatchAugment(args.img_size, device=device) if args.batch_augment else None
 
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=args.lr)
@@ -114,97 +182,132 @@ def train(args):
         optimizer.load_state_dict(ckpt.get('optimizer_state', optimizer.state_dict()))
         start_epoch = ckpt.get('epoch', 0)
         best_val_acc = ckpt.get('best_val_acc', 0.0)
-        print(f'Resuming from {args.resume} at epoch {start_epoch}')
+        rank0_print(f'Resuming from {args.resume} at epoch {start_epoch}')
+
+    train_cm = ConfusionMatrix(num_classes, device=device)
+    val_cm = ConfusionMatrix(num_classes, device=device)
+    train_loss = RunningLoss(device)
+    val_loss_meter = RunningLoss(device)
+    log_every = max(1, args.log_every)
+    first_step_s = None
+
+    def forward_backward(forward, imgs, labels):
+        # repeatable: CompiledModel.run_step reruns it eagerly if the compiled graph fails
+        optimizer.zero_grad()
+        with autocast(device, args.amp):
+            outputs = forward(imgs)
+            loss = criterion(outputs, labels)
+        scaler.scale(loss).backward()
+        return outputs, loss
 
     for epoch in range(start_epoch, args.epochs):
-        model.train()
-        running_loss = 0.0
-        train_preds = []
-        train_labels = []
-        n_samples = 0
-
-        pbar = tqdm(train_loader, desc=f'Epoch {epoch+1}/{args.epochs} [train]', unit='batch')
-        for imgs, labels in pbar:
+        net.train()
+        steady_s, steady_n = 0.0, 0
+        train_loss.reset()
+        train_cm.reset()
+        set_epoch(train_loader, epoch)
+
+        pbar = tqdm(train_loader, desc=f'Epoch {epoch+1}/{args.epochs} [train]', unit='batch', disable=not dist_info.is_main)
+        for step, (imgs, labels) in enumerate(pbar, 1):
+            step_start = time.perf_counter()
+            imgs, aspect = split_aspect(imgs)
             imgs = imgs.to(device)
             labels = labels.to(device)
-            optimizer.zero_grad()
-            outputs = model(imgs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-
-            bs = labels.size(0)
-            running_loss += loss.item() * bs
-            n_samples += bs
-
-            preds = outputs.argmax(1).detach().cpu().numpy()
-            train_preds.extend(preds.tolist())
-            train_labels.extend(labels.detach().cpu().numpy().tolist())
-
-            pbar.set_postfix({'loss': f'{running_loss / n_samples:.4f}'})
+            if augment is not None:
+                imgs = augment.train(imgs, aspect)
+            imgs = to_memory_format(imgs, args.channels_last)
+            if args.compile:
+                outputs, loss = net.run_step(forward_backward, imgs, labels)
+            else:
+                outputs, loss = forward_backward(net, imgs, labels)
+            scaler.step(optimizer)
+            scaler.update()
+
+            train_loss.update(loss, labels.size(0))
+            train_cm.update(outputs.detach(), labels)
+            if args.compile:
+                # only pay for a sync when --compile step timing was asked for
+                synchronize(device)
+                step_s = time.perf_counter() - step_start
+                if first_step_s is None:
+                    first_step_s = step_s
+                else:
+                    steady_s += step_s
+                    steady_n += 1
+
+            if step % log_every == 0:
+                pbar.set_postfix({'loss': f'{train_loss.mean():.4f}'})
         pbar.close()
 
-        epoch_loss = running_loss / n_samples if n_samples > 0 else 0.0
-        epoch_acc = accuracy_score(train_labels, train_preds) if n_samples > 0 else 0.0
-        precision, recall, f1, _ = precision_recall_fscore_support(train_labels, train_preds, average='weighted', zero_division=0)
-        print(f'Epoch [{epoch+1}/{args.epochs}] Train loss: {epoch_loss:.4f} acc: {epoch_acc:.4f} precision: {precision:.4f} recall: {recall:.4f} f1: {f1:.4f}')
+        # sum loss, sample counts and confusion matrices over all ranks
+        all_reduce_sum(train_loss.totals)
+        all_reduce_sum(train_cm.matrix)
+        epoch_loss = train_loss.mean()
+        m = train_cm.compute()
+        epoch_acc, precision, recall, f1 = m['accuracy'], m['precision'], m['recall'], m['f1']
+        rank0_print(f'Epoch [{epoch+1}/{args.epochs}] Train loss: {epoch_loss:.4f} acc: {epoch_acc:.4f} precision: {precision:.4f} recall: {recall:.4f} f1: {f1:.4f}')
+        if args.compile and steady_n:
+            rank0_print(f'Step time: first step (incl. compile) {first_step_s:.2f}s, steady state {1000 * steady_s / steady_n:.1f} ms/step')
 
         # validation
-        model.eval()
-        val_loss = 0.0
-        val_preds = []
-        val_labels = []
-        val_n = 0
-        pbar = tqdm(val_loader, desc=f'Epoch {epoch+1}/{args.epochs} [val]', unit='batch')
+        net.eval()
+        val_loss_meter.reset()
+        val_cm.reset()
+        pbar = tqdm(val_loader, desc=f'Epoch {epoch+1}/{args.epochs} [val]', unit='batch', disable=not dist_info.is_main)
         with torch.no_grad():
-            for imgs, labels in pbar:
+            for step, (imgs, labels) in enumerate(pbar, 1):
                 imgs = imgs.to(device)
                 labels = labels.to(device)
-                outputs = model(imgs)
-                loss = criterion(outputs, labels)
-                bs = labels.size(0)
-                val_loss += loss.item() * bs
-                val_n += bs
-
-                preds = outputs.argmax(1).detach().cpu().numpy()
-                val_preds.extend(preds.tolist())
-                val_labels.extend(labels.detach().cpu().numpy().tolist())
-                pbar.set_postfix({'val_loss': f'{val_loss / val_n:.4f}'})
+                if augment is not None:
+                    imgs = augment.eval(imgs)
+                imgs = to_memory_format(imgs, args.channels_last)
+                with autocast(device, args.amp):
+                    outputs = net(imgs)
+                    loss = criterion(outputs, labels)
+                val_loss_meter.update(loss, labels.size(0))
+                val_cm.update(outputs, labels)
+                if step % log_every == 0:
+                    pbar.set_postfix({'val_loss': f'{val_loss_meter.mean():.4f}'})
         pbar.close()
 
-        val_loss = val_loss / val_n if val_n > 0 else 0.0
-        val_acc = accuracy_score(val_labels, val_preds) if val_n > 0 else 0.0
-        v_precision, v_recall, v_f1, _ = precision_recall_fscore_support(val_labels, val_preds, average='weighted', zero_division=0)
-        print(f'Validation loss: {val_loss:.4f} acc: {val_acc:.4f} precision: {v_precision:.4f} recall: {v_recall:.4f} f1: {v_f1:.4f}')
-
-        # save metrics to CSV (append)
-        header = ['epoch','split','loss','accuracy','precision','recall','f1']
-        write_header = not metrics_file.exists()
-        with open(metrics_file, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            if write_header:
-                writer.writerow(header)
-            writer.writerow([epoch+1, 'train', f'{epoch_loss:.6f}', f'{epoch_acc:.6f}', f'{precision:.6f}', f'{recall:.6f}', f'{f1:.6f}'])
-            writer.writerow([epoch+1, 'val', f'{val_loss:.6f}', f'{val_acc:.6f}', f'{v_precision:.6f}', f'{v_recall:.6f}', f'{v_f1:.6f}'])
-
-        # checkpoint
+        all_reduce_sum(val_loss_meter.totals)
+        all_reduce_sum(val_cm.matrix)
+        val_loss = val_loss_meter.mean()
+        m = val_cm.compute()
+        val_acc, v_precision, v_recall, v_f1 = m['accuracy'], m['precision'], m['recall'], m['f1']
+        rank0_print(f'Validation loss: {val_loss:.4f} acc: {val_acc:.4f} precision: {v_precision:.4f} recall: {v_recall:.4f} f1: {v_f1:.4f}')
+
+        # save metrics to CSV (append); metrics are already reduced, so rank 0 speaks for all
+        if dist_info.is_main:
+            header = ['epoch','split','loss','accuracy','precision','recall','f1']
+            write_header = not metrics_file.exists()
+            with open(metrics_file, 'a', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                if write_header:
+                    writer.writerow(header)
+                writer.writerow([epoch+1, 'train', f'{epoch_loss:.6f}', f'{epoch_acc:.6f}', f'{precision:.6f}', f'{recall:.6f}', f'{f1:.6f}'])
+                writer.writerow([epoch+1, 'val', f'{val_loss:.6f}', f'{val_acc:.6f}', f'{v_precision:.6f}', f'{v_recall:.6f}', f'{v_f1:.6f}'])
+
+        # checkpoint (every rank tracks best_val_acc, only rank 0 writes)
         is_best = val_acc > best_val_acc
         if is_best:
             best_val_acc = val_acc
+        if is_best and dist_info.is_main:
             ckpt_path = out_dir / 'best.pth'
             torch.save({
                 'epoch': epoch + 1,
-                'model_state': model.state_dict(),
+                'model_state': fp32_state_dict(model),
                 'optimizer_state': optimizer.state_dict(),
                 'best_val_acc': best_val_acc,
                 'classes': classes,
             }, ckpt_path)
-            print('Saved best checkpoint to', ckpt_path)
+            rank0_print('Saved best checkpoint to', ckpt_path)
 
         # scheduler step
         scheduler.step()
 
-    print('Training complete. Best val acc:', best_val_acc)
+    rank0_print('Training complete. Best val acc:', best_val_acc)
+    cleanup()
 
 
 if __name__ == '__main__':
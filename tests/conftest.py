@@ -0,0 +1,36 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+# tests import the package the same way the scripts do
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def make_image_tree(root: Path, layout: dict) -> Path:
+    """Create empty image files: `{'train/a': 3, 'x/b': ['1.png', 'notes.txt']}`."""
+    for rel, files in layout.items():
+        d = root / rel
+        d.mkdir(parents=True, exist_ok=True)
+        if isinstance(files, int):
+            files = [f'{i}.jpg' for i in range(files)]
+        for name in files:
+            (d / name).write_bytes(b'')
+    return root
+
+
+@pytest.fixture
+def image_tree(tmp_path):
+    return lambda layout: make_image_tree(tmp_path, layout)
+
+
+def write_images(root: Path, layout: dict, size=(12, 9)):
+    """Like `make_image_tree`, but with decodable solid-colour JPEGs."""
+    from PIL import Image
+
+    for rel, n in layout.items():
+        d = root / rel
+        d.mkdir(parents=True, exist_ok=True)
+        for i in range(n):
+            Image.new('RGB', size, (40 * i % 256, 80, 120)).save(d / f'{i}.jpg')
+    return root
@@ -0,0 +1,57 @@
+import math
+
+import pytest
+
+torch = pytest.importorskip('torch')
+from src.train.augment import BatchAugment, WithAspect, split_aspect  # noqa: E402
+
+
+def boxes(aug, n, source_aspect):
+    theta = aug.crop_params(n, 'cpu', torch.full((n,), source_aspect))
+    w, h = theta[:, 0, 0].abs(), theta[:, 1, 1]
+    return w, h, theta[:, 0, 2], theta[:, 1, 2]
+
+
+@pytest.mark.parametrize('source_aspect', [0.5, 1.0, 16 / 9, 3.0])
+def test_crop_boxes_follow_random_resized_crop_in_source_pixels(source_aspect):
+    torch.manual_seed(0)
+    aug = BatchAugment(32)
+    w, h, cx, cy = boxes(aug, 4096, source_aspect)
+    # width / height of the box in source pixels stays inside the ratio range
+    pixel_ratio = w / h * source_aspect
+    assert pixel_ratio.min() >= 3 / 4 - 1e-4 and pixel_ratio.max() <= 4 / 3 + 1e-4
+    assert w.max() <= 1 and h.max() <= 1
+    # boxes stay inside the image
+    assert ((cx.abs() + w) <= 1 + 1e-6).all() and ((cy.abs() + h) <= 1 + 1e-6).all()
+    fitted = (w < 1) & (h < 1)
+    area = (w * h)[fitted]
+    assert area.min() >= 0.08 - 1e-4 and area.max() <= 1.0
+
+
+def test_square_default_matches_old_sampling():
+    torch.manual_seed(1)
+    aug = BatchAugment(32)
+    theta = aug.crop_params(512, 'cpu')
+    w, h = theta[:, 0, 0].abs(), theta[:, 1, 1]
+    assert ((w / h) >= 3 / 4 - 1e-4).all() and ((w / h) <= 4 / 3 + 1e-4).all()
+
+
+def test_wide_image_crop_is_not_stretched():
+    """A square box in source pixels on a 2:1 image must cover half the squashed width per unit height."""
+    aug = BatchAugment(32, scale=(0.25, 0.25), ratio=(1.0, 1.0), hflip_p=0.0)
+    w, h, _, _ = boxes(aug, 64, 2.0)
+    assert torch.allclose(w, torch.full_like(w, math.sqrt(0.25 / 2)))
+    assert torch.allclose(h, torch.full_like(h, math.sqrt(0.25 * 2)))
+
+
+def test_with_aspect_and_train_output():
+    from PIL import Image
+
+    tf = WithAspect(lambda img: torch.zeros(3, 36, 36, dtype=torch.uint8))
+    img, aspect = tf(Image.new('RGB', (40, 20)))
+    assert aspect.item() == 2.0
+    batch = torch.utils.data.default_collate([(tf(Image.new('RGB', (40, 20))), 0)] * 4)[0]
+    x, aspects = split_aspect(batch)
+    out = BatchAugment(32).train(x, aspects)
+    assert out.shape == (4, 3, 32, 32) and out.dtype == torch.float32
+    assert split_aspect(x)[1] is None
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import zipfile
+
+import pytest
+
+pytest.importorskip('fastapi')
+from src.api import app as api  # noqa: E402
+from src.model.utils import ImageTooLarge  # noqa: E402
+
+
+def make_zip(members: dict) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_member_over_limit_is_rejected_before_inflating():
+    # ~10 MB of zeros compresses to a few KB
+    data = make_zip({'leaf.jpg': b'\0' * (10 * 1024 * 1024)})
+    assert len(data) < 64 * 1024
+    with pytest.raises(ImageTooLarge):
+        api.ZipMembers(data, max_member_bytes=1024 * 1024)
+
+
+def test_member_count_is_capped():
+    data = make_zip({f'{i}.jpg': b'x' for i in range(5)})
+    with pytest.raises(ImageTooLarge):
+        api.ZipMembers(data, max_members=4)
+    assert len(api.ZipMembers(data, max_members=5).names()) == 5
+
+
+def test_only_image_members_are_listed():
+    data = make_zip({'a/1.jpg': b'1', 'a/.hidden.jpg': b'2', 'notes.txt': b'3', 'b/2.PNG': b'4'})
+    assert sorted(api.ZipMembers(data).names()) == ['a/1.jpg', 'b/2.PNG']
+
+
+def test_parallel_reads_use_one_handle_per_thread():
+    members = {f'{i}.jpg': bytes([i]) * 50_000 for i in range(32)}
+    archive = api.ZipMembers(make_zip(members), max_member_bytes=100_000)
+    with ThreadPoolExecutor(4) as pool:
+        out = dict(zip(archive.names(), pool.map(archive.read, archive.names())))
+    assert out == members
+    assert 1 <= len(archive._handles) <= 5
+    handles = list(archive._handles)
+    archive.close()
+    assert archive._handles == [] and all(zf.fp is None for zf in handles)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    testclient = pytest.importorskip('fastapi.testclient')
+    # any non-None session gets past the "model not loaded" check
+    monkeypatch.setattr(api, 'SESSION', object(), raising=False)
+    return testclient.TestClient(api.app)
+
+
+def test_zip_bomb_upload_gets_413(client, monkeypatch):
+    monkeypatch.setattr(api.settings, 'MAX_UPLOAD_BYTES', 1024 * 1024)
+    data = make_zip({'leaf.jpg': b'\0' * (10 * 1024 * 1024)})
+    r = client.post('/predict/batch', files=[('files', ('bomb.zip', data, 'application/zip'))])
+    assert r.status_code == 413
+    assert 'uncompressed' in r.json()['error']
+
+
+def test_oversized_archive_gets_413(client, monkeypatch):
+    monkeypatch.setattr(api.settings, 'MAX_ARCHIVE_BYTES', 1024)
+    data = make_zip({f'{i}.jpg': os.urandom(1024) for i in range(4)})
+    r = client.post('/predict/batch', files=[('files', ('big.zip', data, 'application/zip'))])
+    assert r.status_code == 413
+
+
+def test_invalid_zip_gets_400(client):
+    r = client.post('/predict/batch', files=[('files', ('broken.zip', b'not a zip', 'application/zip'))])
+    assert r.status_code == 400
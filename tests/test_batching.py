@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.api.batching import MicroBatcher
+from src.api.workers import BoundedPool
+
+
+class SlowModel:
+    """`run_batch` stand-in that records how many batches run at the same time."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.sizes = []
+
+    def __call__(self, arrays):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.sizes.append(len(arrays))
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return np.stack([a.sum(axis=0) for a in arrays])
+
+
+async def submit_all(batcher, n, shape=(2,)):
+    return await asyncio.gather(*(batcher.submit(np.full(shape, i, dtype=np.float32)) for i in range(n)))
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4])
+def test_batches_run_concurrently_up_to_pool_size(workers):
+    model = SlowModel()
+    pool = BoundedPool('inference', workers, 32)
+
+    async def main():
+        batcher = MicroBatcher(model, max_batch_size=2, max_latency_ms=1, run_async=pool.run,
+                               max_concurrency=workers)
+        return await submit_all(batcher, 16), batcher
+
+    try:
+        results, batcher = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert [float(r) for r in results] == [2.0 * i for i in range(16)]
+    assert model.peak == workers
+    assert batcher.items == 16 and batcher.stats()['max_concurrency'] == workers
+
+
+def test_batches_grow_while_all_slots_are_busy():
+    model = SlowModel(delay=0.1)
+    executor = ThreadPoolExecutor(1)
+
+    async def run_async(fn, x):
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, x)
+
+    async def main():
+        batcher = MicroBatcher(model, max_batch_size=8, max_latency_ms=0, run_async=run_async)
+        first = asyncio.ensure_future(batcher.submit(np.zeros(2, np.float32)))
+        await asyncio.sleep(0.02)
+        # queued while the first batch runs: collected together afterwards
+        rest = await submit_all(batcher, 5)
+        return await first, rest
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
+    assert model.sizes == [1, 5]
+
+
+def test_failure_reaches_every_caller_and_frees_the_slot():
+    calls = []
+
+    def flaky(arrays):
+        calls.append(len(arrays))
+        if len(calls) == 1:
+            raise RuntimeError('session failed')
+        return np.stack(arrays)
+
+    async def main():
+        batcher = MicroBatcher(flaky, max_batch_size=4, max_latency_ms=5)
+        failed = await asyncio.gather(*(batcher.submit(np.ones(2)) for _ in range(3)), return_exceptions=True)
+        ok = await batcher.submit(np.ones(2))
+        return failed, ok
+
+    failed, ok = asyncio.run(main())
+    assert all(isinstance(e, RuntimeError) for e in failed)
+    assert ok.tolist() == [1.0, 1.0]
@@ -0,0 +1,64 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+from src.train.compile import CompiledModel  # noqa: E402
+
+
+class FailingBackward(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, x):
+        return x.clone()
+
+    @staticmethod
+    def backward(ctx, grad):
+        raise RuntimeError('backward graph failed to compile')
+
+
+class BrokenGraph(torch.nn.Module):
+    """Stands in for a compiled module whose forward works but whose backward does not."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return FailingBackward.apply(self.model(x))
+
+
+def make(monkeypatch, compiled):
+    model = torch.nn.Linear(4, 3)
+    monkeypatch.setattr('src.train.compile.compile_model', lambda m, backend: (compiled(m), 'fake'))
+    return model, CompiledModel(model)
+
+
+def forward_backward(forward, model, x, y):
+    model.zero_grad()
+    loss = torch.nn.functional.cross_entropy(forward(x), y)
+    loss.backward()
+    return loss
+
+
+def test_backward_failure_reruns_step_eagerly(monkeypatch):
+    model, net = make(monkeypatch, BrokenGraph)
+    x, y = torch.randn(5, 4), torch.tensor([0, 1, 2, 0, 1])
+    loss = net.run_step(forward_backward, model, x, y)
+    assert net.compiled is None
+    # gradients are those of exactly one eager step
+    expected = [p.grad.clone() for p in model.parameters()]
+    forward_backward(model, model, x, y)
+    assert all(torch.equal(a, p.grad) for a, p in zip(expected, model.parameters()))
+    assert torch.isfinite(loss)
+
+
+def test_working_graph_is_kept(monkeypatch):
+    model, net = make(monkeypatch, lambda m: m)
+    net.run_step(forward_backward, model, torch.randn(2, 4), torch.tensor([0, 2]))
+    assert net.compiled is not None
+    assert 'train' in net.first_call_s
+
+
+def test_eager_failure_is_not_swallowed(monkeypatch):
+    model, net = make(monkeypatch, BrokenGraph)
+    with pytest.raises(IndexError):
+        # labels out of range fail in eager mode too
+        net.run_step(forward_backward, model, torch.randn(2, 4), torch.tensor([0, 7]))
@@ -0,0 +1,58 @@
+import pytest
+
+from src.train.dataset_index import find_split_dirs, scan_dataset, split_indices
+
+CLASSES = ['blight', 'healthy', 'rust']
+
+
+def test_flat_layout_matches_image_folder(image_tree):
+    datasets = pytest.importorskip('torchvision.datasets')
+    root = image_tree({
+        'plants/blight': ['a.jpg', 'b.webp', 'c.tif', 'notes.txt'],
+        'plants/healthy': ['d.png', 'e.JPEG'],
+        'plants/healthy/more': ['f.bmp'],
+        'plants/rust': ['g.ppm'],
+    })
+    index = scan_dataset(root, root / 'plants')
+    folder = datasets.ImageFolder(str(root / 'plants'))
+    assert index['layout'] == 'flat'
+    assert index['classes'] == folder.classes
+    assert [str(root / 'plants' / p) for p in index['paths']] == [p for p, _ in folder.samples]
+    assert index['labels'] == folder.targets
+
+
+def test_split_layout_uses_folders_as_split(image_tree):
+    root = image_tree({f'{split}/{c}': n for split, n in (('train', 4), ('valid', 2), ('test', 1)) for c in CLASSES})
+    assert [name for name, _ in find_split_dirs(root)] == ['train', 'val', 'test']
+    index = scan_dataset(root, root)
+    assert index['layout'] == 'split'
+    assert index['classes'] == CLASSES
+    train, val, test = split_indices(index['split'])
+    assert (len(train), len(val), len(test)) == (12, 6, 3)
+
+
+def test_no_train_folder_is_flat(image_tree):
+    root = image_tree({'val/a': 1, 'val/b': 1})
+    assert find_split_dirs(root) == []
+
+
+@pytest.mark.parametrize('layout,expected', [
+    ('split', (20, 10, 5)),
+    ('flat', (40, 5, 5)),
+])
+def test_load_dataset_index_end_to_end(image_tree, tmp_path, layout, expected):
+    data_utils = pytest.importorskip('src.train.data_utils')
+    if layout == 'split':
+        tree = {f'data/{split}/{c}': n for split, n in (('train', 4), ('val', 2), ('test', 1))
+                for c in CLASSES + ['mold', 'spot']}
+    else:
+        tree = {f'data/{c}': 10 for c in CLASSES + ['mold', 'spot']}
+    data_dir = image_tree(tree) / 'data'
+    cache = tmp_path / 'cache'
+    index, splits = data_utils.load_dataset_index(data_dir, 42, 0.1, 0.1, cache)
+    assert index['layout'] == layout
+    assert index['root'] == str(data_dir.resolve())
+    assert tuple(len(s) for s in splits) == expected
+    # the second call is served from the cache with the same split
+    _, cached = data_utils.load_dataset_index(data_dir, 42, 0.1, 0.1, cache)
+    assert [sorted(s) for s in cached] == [sorted(s) for s in splits]
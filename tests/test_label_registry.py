@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from src.api.labels import LabelRegistry
+
+
+def bump_mtime(path):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def sources(tmp_path):
+    manifest = tmp_path / 'model.json'
+    classes_json = tmp_path / 'classes.json'
+    checkpoint = tmp_path / 'missing.pth'
+    return manifest, classes_json, checkpoint
+
+
+def test_manifest_outranks_classes_json(sources):
+    manifest, classes_json, checkpoint = sources
+    classes_json.write_text(json.dumps(['x', 'y']))
+    registry = LabelRegistry(manifest, classes_json, checkpoint)
+    assert registry.get() == ['x', 'y']
+
+    manifest.write_text(json.dumps({'classes': ['a', 'b']}))
+    registry.invalidate()
+    assert registry.get() == ['a', 'b']
+
+
+def test_no_sources_returns_none(sources):
+    registry = LabelRegistry(*sources)
+    assert registry.get() is None
+    assert registry.version == 1
+
+
+def test_reloads_only_on_content_change(sources, monkeypatch):
+    manifest, classes_json, checkpoint = sources
+    classes_json.write_text(json.dumps(['a', 'b']))
+    registry = LabelRegistry(manifest, classes_json, checkpoint)
+    reads = []
+    original = registry._read
+    monkeypatch.setattr(registry, '_read', lambda: reads.append(1) or original())
+
+    assert registry.get() == ['a', 'b']
+    assert registry.get() == ['a', 'b']
+    assert len(reads) == 1
+    version, digest = registry.version, registry.digest
+
+    # a touch changes the stat signature but not the bytes
+    bump_mtime(classes_json)
+    assert registry.get() == ['a', 'b']
+    assert len(reads) == 1
+    assert (registry.version, registry.digest) == (version, digest)
+
+    classes_json.write_text(json.dumps(['a', 'c']))
+    bump_mtime(classes_json)
+    assert registry.get() == ['a', 'c']
+    assert len(reads) == 2
+    assert registry.version == version + 1
+    assert registry.digest != digest
+
+
+def test_same_classes_keep_version_and_digest(sources):
+    manifest, classes_json, checkpoint = sources
+    classes_json.write_text(json.dumps(['a', 'b']))
+    registry = LabelRegistry(manifest, classes_json, checkpoint)
+    registry.get()
+    version, digest = registry.version, registry.digest
+
+    # different bytes, same class list
+    classes_json.write_text(json.dumps(['a', 'b'], indent=2))
+    bump_mtime(classes_json)
+    assert registry.get() == ['a', 'b']
+    assert (registry.version, registry.digest) == (version, digest)
+
+
+def test_invalidate_forces_reread(sources):
+    manifest, classes_json, checkpoint = sources
+    classes_json.write_text(json.dumps(['a']))
+    registry = LabelRegistry(manifest, classes_json, checkpoint)
+    registry.get()
+
+    # same size and mtime: only invalidate() can notice this edit
+    st = classes_json.stat()
+    classes_json.write_text(json.dumps(['b']))
+    os.utime(classes_json, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert registry.get() == ['a']
+    registry.invalidate()
+    assert registry.get() == ['b']
+
+
+def test_unreadable_source_falls_through(sources):
+    manifest, classes_json, checkpoint = sources
+    manifest.write_text('{not json')
+    classes_json.write_text(json.dumps(['a', 'b']))
+    registry = LabelRegistry(manifest, classes_json, checkpoint)
+    assert registry.get() == ['a', 'b']
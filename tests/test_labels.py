@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+pytest.importorskip('fastapi')
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src.api import app as api  # noqa: E402
+from src.api.labels import LabelRegistry  # noqa: E402
+
+from conftest import make_image_tree  # noqa: E402
+
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    """Point the app at a models/ dir with an exported manifest + classes.json for ['a', 'b']."""
+    models_dir = tmp_path / 'models'
+    models_dir.mkdir()
+    manifest = models_dir / 'model.json'
+    classes_json = models_dir / 'classes.json'
+    manifest.write_text(json.dumps({'version': 1, 'model': 'resnet18', 'classes': ['a', 'b']}))
+    classes_json.write_text(json.dumps(['a', 'b']))
+    monkeypatch.setattr(api, 'MODELS_DIR', models_dir)
+    monkeypatch.setattr(api, 'MANIFEST_PATH', manifest)
+    monkeypatch.setattr(api, 'CLASSES_JSON_PATH', classes_json)
+    monkeypatch.setattr(api, 'LABELS', LabelRegistry(manifest, classes_json, tmp_path / 'missing.pth'))
+    rebuilds = []
+    monkeypatch.setattr(api, 'schedule_rebuild', lambda use_classes_json=True: rebuilds.append(use_classes_json))
+    return models_dir, rebuilds
+
+
+def raw_labels(client):
+    return [c['raw'] for c in client.get('/labels').json()['classes']]
+
+
+def test_regenerate_changes_served_labels(models, tmp_path):
+    models_dir, rebuilds = models
+    data = make_image_tree(tmp_path / 'data', {'Tomato___healthy': 1, 'Tomato___rust': 1})
+    client = TestClient(api.app)
+    assert raw_labels(client) == ['a', 'b']
+
+    r = client.post('/labels/regenerate', params={'data_root': str(data)})
+    assert r.status_code == 200
+    assert r.json()['model'] == 'relabelled'
+    assert raw_labels(client) == ['Tomato___healthy', 'Tomato___rust']
+    assert json.loads((models_dir / 'model.json').read_text())['classes'] == ['Tomato___healthy', 'Tomato___rust']
+    assert rebuilds == []
+
+
+def test_regenerate_with_new_class_count_schedules_rebuild(models, tmp_path):
+    models_dir, rebuilds = models
+    data = make_image_tree(tmp_path / 'data', {'x': 1, 'y': 1, 'z': 1})
+    client = TestClient(api.app)
+
+    r = client.post('/labels/regenerate', params={'data_root': str(data)})
+    assert r.json()['model'] == 'rebuild'
+    assert rebuilds == [True]
+    # the served model still has two outputs, so its labels stay until the rebuild swaps both in
+    assert raw_labels(client) == ['a', 'b']
+    assert json.loads((models_dir / 'classes.json').read_text()) == ['x', 'y', 'z']
+
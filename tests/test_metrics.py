@@ -0,0 +1,54 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from src.train.metrics import ConfusionMatrix, RunningLoss  # noqa: E402
+
+
+def test_confusion_matrix_counts():
+    cm = ConfusionMatrix(3)
+    cm.update(torch.tensor([0, 1, 2, 2]), torch.tensor([0, 1, 1, 2]))
+    # logits take the argmax
+    cm.update(torch.tensor([[0.1, 0.9, 0.0], [2.0, 0.0, 1.0]]), torch.tensor([1, 2]))
+    expected = torch.tensor([[1, 0, 0],
+                             [0, 2, 1],
+                             [1, 0, 1]])
+    assert torch.equal(cm.matrix, expected)
+
+
+def test_confusion_matrix_matches_sklearn():
+    metrics = pytest.importorskip('sklearn.metrics')
+    gen = torch.Generator().manual_seed(0)
+    labels = torch.randint(0, 5, (200,), generator=gen)
+    # class 4 is never predicted, so its precision is undefined
+    preds = torch.randint(0, 4, (200,), generator=gen)
+    cm = ConfusionMatrix(5)
+    for i in range(0, 200, 32):
+        cm.update(preds[i:i + 32], labels[i:i + 32])
+    result = cm.compute()
+
+    p, r, f1, _ = metrics.precision_recall_fscore_support(
+        labels.numpy(), preds.numpy(), average='weighted', zero_division=0)
+    assert result['accuracy'] == pytest.approx(metrics.accuracy_score(labels.numpy(), preds.numpy()))
+    assert result['precision'] == pytest.approx(p)
+    assert result['recall'] == pytest.approx(r)
+    assert result['f1'] == pytest.approx(f1)
+
+
+def test_confusion_matrix_empty_and_reset():
+    cm = ConfusionMatrix(2)
+    assert cm.compute() == {'accuracy': 0.0, 'precision': 0.0, 'recall': 0.0, 'f1': 0.0}
+    cm.update(torch.tensor([1]), torch.tensor([1]))
+    assert cm.compute()['accuracy'] == 1.0
+    cm.reset()
+    assert int(cm.matrix.sum()) == 0
+
+
+def test_running_loss_is_sample_weighted():
+    running = RunningLoss()
+    assert running.mean() == 0.0
+    running.update(torch.tensor(1.0), 3)
+    running.update(torch.tensor(3.0), 1)
+    assert running.mean() == pytest.approx(1.5)
+    running.reset()
+    assert running.mean() == 0.0
@@ -0,0 +1,54 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('onnx')
+pytest.importorskip('onnxruntime')
+from src.model.optimize import optimize_export  # noqa: E402
+
+
+class ConvBN(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 8, 3, padding=1, bias=False)
+        self.bn = torch.nn.BatchNorm2d(8)
+        self.head = torch.nn.Linear(8, 4)
+
+    def forward(self, x):
+        x = torch.relu(self.bn(self.conv(x)))
+        return self.head(x.mean(dim=(2, 3)))
+
+
+def test_export_already_folds_batchnorm(tmp_path):
+    model = ConvBN()
+    # non-trivial running statistics so a missing fold would change the output
+    with torch.no_grad():
+        model.bn.running_mean.uniform_(-1, 1)
+        model.bn.running_var.uniform_(0.5, 2)
+    report = optimize_export(model, tmp_path / 'model.onnx', img_size=16)
+    assert report['batchnorm_ops'] == 0
+    assert 'BatchNormalization' not in report['op_types_after']
+    assert report['max_abs_diff'] < 1e-4
+    assert not (tmp_path / 'model.base.onnx').exists()
+
+
+def test_benchmark_can_be_skipped(tmp_path, monkeypatch):
+    def no_benchmark(*args, **kwargs):
+        raise AssertionError('latency benchmark should not run')
+
+    monkeypatch.setattr('src.model.optimize.ort_latency_ms', no_benchmark)
+    report = optimize_export(ConvBN(), tmp_path / 'model.onnx', img_size=16, benchmark=False)
+    assert report['latency_ms_before'] is None and report['latency_ms_after'] is None
+    assert report['ops_after'] is not None
+
+
+def test_in_server_rebuild_skips_the_benchmark(monkeypatch):
+    pytest.importorskip('fastapi')
+    from src.api import app as api
+
+    calls = []
+    monkeypatch.setattr('src.model.artifacts.build_onnx_artifact',
+                        lambda *args, **kwargs: calls.append(kwargs) or {'model': 'resnet18', 'cached': False})
+    monkeypatch.setattr(api, 'load_served_session', lambda: (None, api.MODEL_PATH))
+    monkeypatch.setattr(api, 'SESSION', None, raising=False)
+    api.rebuild_model()
+    assert calls and calls[0]['benchmark'] is False
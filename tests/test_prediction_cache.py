@@ -0,0 +1,110 @@
+import pytest
+
+from src.api import cache as cache_mod
+from src.api.cache import PredictionCache, content_hash
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_mod.time, 'time', clock)
+    return clock
+
+
+def test_content_hash_is_stable():
+    assert content_hash(b'abc') == content_hash(b'abc')
+    assert content_hash(b'abc') != content_hash(b'abd')
+
+
+def test_hit_and_miss_counts(clock):
+    cache = PredictionCache(max_entries=4, ttl_s=60)
+    cache.set_model_identity('m1')
+    assert cache.get('k') is None
+    cache.put('k', {'label': 'a'})
+    assert cache.get('k') == {'label': 'a'}
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    assert stats['hit_ratio'] == 0.5
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = PredictionCache(max_entries=2, ttl_s=60)
+    cache.set_model_identity('m1')
+    cache.put('a', {'v': 1})
+    cache.put('b', {'v': 2})
+    # touching 'a' makes 'b' the eviction candidate
+    assert cache.get('a') == {'v': 1}
+    cache.put('c', {'v': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'v': 1}
+    assert cache.get('c') == {'v': 3}
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_expires_entries(clock):
+    cache = PredictionCache(max_entries=4, ttl_s=10)
+    cache.set_model_identity('m1')
+    cache.put('k', {'v': 1})
+    clock.now += 10
+    assert cache.get('k') == {'v': 1}
+    clock.now += 0.5
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_zero_ttl_never_expires(clock):
+    cache = PredictionCache(max_entries=4, ttl_s=0)
+    cache.set_model_identity('m1')
+    cache.put('k', {'v': 1})
+    clock.now += 10 ** 9
+    assert cache.get('k') == {'v': 1}
+
+
+def test_model_change_clears_entries(clock):
+    cache = PredictionCache(max_entries=4, ttl_s=60)
+    cache.set_model_identity('m1')
+    cache.put('k', {'v': 1})
+    cache.set_model_identity('m1')
+    assert cache.get('k') == {'v': 1}
+    cache.set_model_identity('m2')
+    assert cache.get('k') is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_persisted_entries_survive_restart(tmp_path, clock):
+    cache = PredictionCache(max_entries=4, ttl_s=60, persist_dir=tmp_path)
+    cache.set_model_identity('m1')
+    cache.put('k', {'v': 1})
+
+    restarted = PredictionCache(max_entries=4, ttl_s=60, persist_dir=tmp_path)
+    restarted.set_model_identity('m1')
+    assert restarted.get('k') == {'v': 1}
+    assert restarted.stats()['disk_hits'] == 1
+    # promoted into memory, so the second lookup does not touch the disk
+    assert restarted.get('k') == {'v': 1}
+    assert restarted.stats()['disk_hits'] == 1
+
+
+def test_persisted_entries_expire_and_prune(tmp_path, clock):
+    cache = PredictionCache(max_entries=4, ttl_s=60, persist_dir=tmp_path)
+    cache.set_model_identity('m1')
+    cache.put('k', {'v': 1})
+    old_dir = cache._disk_dir()
+
+    restarted = PredictionCache(max_entries=4, ttl_s=60, persist_dir=tmp_path)
+    restarted.set_model_identity('m1')
+    clock.now += 61
+    assert restarted.get('k') is None
+    assert not (old_dir / 'k.json').exists()
+
+    cache.put('k', {'v': 1})
+    cache.set_model_identity('m2')
+    assert not old_dir.exists()
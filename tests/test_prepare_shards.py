@@ -0,0 +1,40 @@
+from pathlib import Path
+import importlib.util
+
+import pytest
+
+from conftest import write_images
+
+pytest.importorskip('torch')
+from src.train.shards import ShardedImageDataset, has_shards  # noqa: E402
+
+CLASSES = ['blight', 'healthy', 'rust']
+
+
+def load_script():
+    path = Path(__file__).resolve().parents[1] / 'scripts' / 'prepare_shards.py'
+    spec = importlib.util.spec_from_file_location('prepare_shards', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_split_layout_is_packed_per_split(tmp_path):
+    data = write_images(tmp_path / 'data', {
+        f'dataset/{split}/{c}': n for split, n in (('test', 1), ('train', 3), ('valid', 2)) for c in CLASSES})
+    counts = load_script().pack_dataset(data, tmp_path / 'shards', size=8, shard_size=4, num_workers=1)
+    assert counts == {'train': 9, 'val': 6, 'test': 3}
+    for split, n in counts.items():
+        assert has_shards(tmp_path / 'shards' / split)
+        ds = ShardedImageDataset(tmp_path / 'shards' / split)
+        assert len(ds) == n
+        assert ds.classes == CLASSES
+    img, label = ShardedImageDataset(tmp_path / 'shards' / 'train')[8]
+    assert tuple(img.shape) == (3, 8, 8) and label == 2
+
+
+def test_flat_layout_is_one_shard_set(tmp_path):
+    data = write_images(tmp_path / 'data', {c: 2 for c in CLASSES})
+    counts = load_script().pack_dataset(data, tmp_path / 'shards', size=8, num_workers=1)
+    assert counts == {None: 6}
+    assert has_shards(tmp_path / 'shards')
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+from src.train.scan import dataset_node, find_class_root, keep_splits_together, tree_from_paths
+
+CLASSES = ['apple_scab', 'healthy', 'leaf_mold', 'rust', 'spot']
+
+
+def split_layout(prefix='', counts=(('train', 4), ('val', 2), ('test', 1))):
+    return {f'{prefix}{split}/{c}': n for split, n in counts for c in CLASSES}
+
+
+def test_flat_tree_returns_class_root(image_tree):
+    root = image_tree({f'data/{c}': 2 for c in CLASSES})
+    result = find_class_root(root)
+    assert result.root == root / 'data'
+    assert result.class_dir == root / 'data'
+    assert result.classes == CLASSES
+    assert result.total_images == 10
+
+
+def test_split_tree_returns_dataset_root(image_tree):
+    root = image_tree(split_layout())
+    result = find_class_root(root)
+    assert result.root == root
+    assert result.class_dir == root / 'train'
+    assert result.classes == CLASSES
+    assert result.counts == {c: 4 for c in CLASSES}
+    assert result.total_images == 5 * (4 + 2 + 1)
+
+
+def test_split_tree_with_fewer_classes_than_splits(image_tree):
+    root = image_tree({f'{split}/{c}': 2 for split in ('test', 'train', 'val') for c in ('healthy', 'sick')})
+    result = find_class_root(root)
+    assert result.root == root
+    assert result.classes == ['healthy', 'sick']
+
+
+def test_nested_split_tree_returns_parent_of_splits(image_tree):
+    root = image_tree(split_layout('archive/dataset/'))
+    result = find_class_root(root)
+    assert result.root == root / 'archive' / 'dataset'
+    assert result.class_dir == root / 'archive' / 'dataset' / 'train'
+
+
+def test_split_folder_passed_directly_is_kept(image_tree):
+    root = image_tree(split_layout())
+    assert find_class_root(root / 'test').root == root / 'test'
+    assert keep_splits_together(root / 'test', root / 'test') == root / 'test'
+
+
+def test_non_image_files_are_ignored(image_tree):
+    root = image_tree({'a': ['1.jpg', 'readme.txt', 'notes.md'], 'b': ['2.PNG', '3.jpeg']})
+    result = find_class_root(root)
+    assert result.counts == {'a': 1, 'b': 2}
+
+
+def test_archive_listing_keeps_splits_together():
+    names = [f'dataset/{split}/{c}/{i}.jpg' for split in ('test', 'train', 'val') for c in CLASSES for i in range(2)]
+    root, node = dataset_node(tree_from_paths(names), max_depth=None)
+    assert root.path == Path('dataset')
+    assert node.path == Path('dataset/train')
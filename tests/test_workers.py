@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from src.api.workers import BoundedPool, Overloaded
+
+
+@pytest.fixture
+def pool():
+    pool = BoundedPool('test', max_workers=1, max_queue=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_limits_are_clamped():
+    pool = BoundedPool('test', max_workers=0, max_queue=-3)
+    assert (pool.max_workers, pool.max_queue, pool.limit) == (1, 0, 1)
+    pool.shutdown()
+
+
+def test_rejects_when_saturated(pool):
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(pool.run(release.wait))
+        second = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        assert pool.in_flight == 2
+        assert pool.stats()['queued'] == 1
+        with pytest.raises(Overloaded) as excinfo:
+            await pool.run(release.wait)
+        assert excinfo.value.pool_name == 'test'
+        release.set()
+        await asyncio.gather(first, second)
+        # capacity frees up once the work drains
+        assert await pool.run(lambda: 42) == 42
+
+    asyncio.run(main())
+    stats = pool.stats()
+    assert (stats['in_flight'], stats['completed'], stats['rejected']) == (0, 3, 1)
+
+
+def test_run_many_admits_the_group_as_a_unit(pool):
+    release = threading.Event()
+
+    async def main():
+        group = asyncio.ensure_future(pool.run_many(lambda x: release.wait() and x * 2, [1, 2, 3]))
+        await asyncio.sleep(0.05)
+        # the whole group counts towards in_flight, beyond the per-call limit
+        assert pool.in_flight == 3
+        with pytest.raises(Overloaded):
+            await pool.run(lambda: None)
+        with pytest.raises(Overloaded):
+            await pool.run_many(lambda x: x, [1])
+        release.set()
+        return await group
+
+    assert asyncio.run(main()) == [2, 4, 6]
+    stats = pool.stats()
+    assert (stats['in_flight'], stats['completed'], stats['rejected']) == (0, 3, 2)
+
+
+def test_run_many_returns_exceptions_per_item(pool):
+    def fn(x):
+        if x == 2:
+            raise ValueError('bad item')
+        return x
+
+    results = asyncio.run(pool.run_many(fn, [1, 2, 3]))
+    assert results[0] == 1 and results[2] == 3
+    assert isinstance(results[1], ValueError)
+    assert pool.in_flight == 0
+
+
+def test_errors_release_capacity(pool):
+    def boom():
+        raise RuntimeError('boom')
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await pool.run(boom)
+
+    asyncio.run(main())
+    assert pool.in_flight == 0
+
+
+def test_run_propagates_context(pool):
+    var = contextvars.ContextVar('var', default=None)
+
+    async def main():
+        var.set('request-1')
+        return await pool.run(var.get)
+
+    assert asyncio.run(main()) == 'request-1'